@@ -1,3 +1,6 @@
 __version__ = "1.1"
 __author__ = "Evan Chen"
 __date__ = "March 2, 2013"
+
+from converter import convert
+from errors import DragonError, GGBFormatError, ParseError, UnsupportedError, RenderError, ConfigError
@@ -1,15 +1,28 @@
 #Import some stuff
-import os
-import zipfile
-import ConfigParser
-import string
+import sys
+import shutil
 import argparse
+from StringIO import StringIO
 
-from xml.etree.ElementTree import ElementTree
-from constants import SHORT_NAME, VERSION_NUMBER, FULL_NAME, GEOGEBRA_XML_LOCATION
-from diagram import AsyDiagram, doCompileDiagramObjects, drawDiagram
+from constants import SHORT_NAME, VERSION_NUMBER, FULL_NAME, GOOD_LUCK, PARSE_CACHE_SIZE
+from converter import resolveFilename, isDocument, openGeoGebraXML, convertSource, convertVariants, parseVariant, conversionCache, CONVERSION_CACHE_SIZE, BACKENDS, VARIANT_OPTIONS
+from errors import DragonError
+from batch import runBatch, outputFilename, renderFilename
+from stream import runFramed, FrameError
+from manifest import Manifest
+from watch import watch
+from render import AsyRenderer, RENDER_FORMATS, RENDER_CACHE_SIZE
+import server
+from ggb_parser import parse_cache
+from profiler import Profiler
 
 # Argument parser {{{
+def variantSpec(spec):
+	try:
+		return parseVariant(spec)
+	except DragonError, e:
+		raise argparse.ArgumentTypeError(str(e))
+
 parser = argparse.ArgumentParser(
 		description = "%s %s, by v_Enhance: %s" %(SHORT_NAME, VERSION_NUMBER, FULL_NAME),
 		epilog = "Note: This is, and probably always will be, an unfinished work.  It may not always produce large, in-scale, clearly labelled diagram made with drawing instruments (compass, ruler, protractor, graph paper, carbon paper)."
@@ -17,7 +30,8 @@ parser = argparse.ArgumentParser(
 parser.add_argument("FILENAME",
 		action = "store",
 		metavar = "FILE",
-		help = "The .ggb file to be converted.  Obviously,this argument is required."
+		nargs = "*",
+		help = "The .ggb file to be converted.  Obviously,this argument is required.  In batch mode, any number of files, directories or globs.  - reads the .ggb file, or a bare geogebra.xml, from standard input."
 		)
 #Non-bool arguments
 parser.add_argument('--size', '-s',
@@ -55,7 +69,166 @@ parser.add_argument('--config',
 		default = "",
 		help = "If specified, uses the specified .cfg files for this diagram only.  Defaults to FILENAME.cfg"
 		)
+parser.add_argument('--jobs', '-j',
+		action = "store",
+		dest = "JOBS",
+		metavar = "N",
+		type = int,
+		default = 0,
+		help = "Number of worker processes in batch mode.  Defaults to the number of CPUs."
+		)
+parser.add_argument('--outdir',
+		action = "store",
+		dest = "OUTPUT_DIR",
+		metavar = "DIR",
+		default = "",
+		help = "In batch and watch mode, write the .asy files (and renders) into DIR instead of next to each input."
+		)
+parser.add_argument('--timeout',
+		action = "store",
+		dest = "TIMEOUT",
+		metavar = "SECONDS",
+		type = int,
+		default = 60,
+		help = "In batch mode, give up on a file after this many seconds.  0 means no limit.  Defaults to 60."
+		)
+parser.add_argument('--parsecache',
+		action = "store",
+		dest = "PARSE_CACHE_SIZE",
+		metavar = "SIZE",
+		type = int,
+		default = PARSE_CACHE_SIZE,
+		help = "Maximum number of parsed expressions to remember, for diagrams which repeat themselves.  0 turns the cache off.  Defaults to %d." %PARSE_CACHE_SIZE
+		)
+parser.add_argument('--only',
+		action = "store",
+		dest = "ONLY_LABELS",
+		metavar = "LABELS",
+		default = "",
+		help = "Comma-separated labels, e.g. A,B,omega.  Only these objects, and whatever they are constructed from, are converted."
+		)
+parser.add_argument('--backend',
+		action = "store",
+		dest = "BACKEND",
+		metavar = "NAME",
+		default = "asy",
+		help = "What to emit: %s.  Defaults to asy." %", ".join(sorted(BACKENDS))
+		)
+parser.add_argument('--variant',
+		action = "append",
+		dest = "VARIANTS",
+		metavar = "PATH:KEY=VALUE,...",
+		type = variantSpec,
+		default = [],
+		help = "Also write the diagram to PATH with some options changed, e.g. cse.asy:CSE_MODE=1,CONCISE_MODE=1.  May be repeated; the construction is compiled once for all of them, and nothing goes to standard output.  The options which may differ are %s." %", ".join(VARIANT_OPTIONS)
+		)
+parser.add_argument('--preview',
+		action = "store",
+		dest = "PREVIEW_FILENAME",
+		metavar = "FILE",
+		default = "",
+		help = "Also write a rough SVG picture of the diagram to FILE, drawn without Asymptote from the coordinates in the .ggb file.  The usual output is written as well; with --variant, the preview is one more variant."
+		)
+parser.add_argument('--plugin',
+		action = "store",
+		dest = "PLUGINS",
+		metavar = "MODULES",
+		default = "",
+		help = "Comma-separated Python modules with more GeoGebra commands, written like those in constructs.py.  Their commands are only used by the conversions of this run."
+		)
+parser.add_argument('--numeric',
+		action = "store",
+		dest = "NUMERIC_MODE",
+		metavar = "MODE",
+		nargs = "?",
+		choices = ["full", "hybrid"],
+		const = "full",
+		default = "",
+		help = "Writes the coordinates GeoGebra computed instead of constructions, which Asymptote draws much faster.  --numeric=hybrid only does so for intersections, circumcircles and relpoint."
+		)
+parser.add_argument('--hoistmin',
+		action = "store",
+		dest = "HOIST_MIN_SIZE",
+		metavar = "CHARS",
+		type = int,
+		default = 12,
+		help = "With --hoist, only hoist expressions at least this many characters long.  Defaults to 12."
+		)
+parser.add_argument('--hoistbudget',
+		action = "store",
+		dest = "HOIST_BUDGET",
+		metavar = "CHARS",
+		type = int,
+		default = 400,
+		help = "With --hoist, ignore expressions longer than this many characters.  Defaults to 400."
+		)
+parser.add_argument('--render',
+		action = "store",
+		dest = "RENDER_FORMAT",
+		metavar = "FORMAT",
+		choices = RENDER_FORMATS,
+		default = "",
+		help = "Also runs Asymptote, writing FILE.pdf (or svg, eps, png) next to the input or into --outdir.  Renders of identical code are cached."
+		)
+parser.add_argument('--asy',
+		action = "store",
+		dest = "ASY_COMMAND",
+		metavar = "PATH",
+		default = "asy",
+		help = "The Asymptote executable used by --render.  Defaults to asy."
+		)
+parser.add_argument('--rendercache',
+		action = "store",
+		dest = "RENDER_CACHE_SIZE",
+		metavar = "MB",
+		type = int,
+		default = RENDER_CACHE_SIZE,
+		help = "Size limit of the render cache; the least recently used renders are evicted.  Defaults to %d." %RENDER_CACHE_SIZE
+		)
+parser.add_argument('--cachedir',
+		action = "store",
+		dest = "CACHE_DIR",
+		metavar = "DIR",
+		default = "",
+		help = "Where converted diagrams are cached.  Defaults to ~/.cache/dragon/asy."
+		)
+parser.add_argument('--cachesize',
+		action = "store",
+		dest = "CACHE_SIZE",
+		metavar = "MB",
+		type = int,
+		default = CONVERSION_CACHE_SIZE,
+		help = "Size limit of the conversion cache; the least recently used entries are evicted.  Defaults to %d." %CONVERSION_CACHE_SIZE
+		)
 #Bool arguments
+parser.add_argument("--watch",
+		action = "store_const",
+		dest = "WATCH_MODE",
+		const = 1,
+		default = 0,
+		help = "Keeps running, and rewrites FILE.asy (or the one in --outdir) whenever FILE or its .cfg file changes."
+		)
+parser.add_argument("--batch",
+		action = "store_const",
+		dest = "BATCH_MODE",
+		const = 1,
+		default = 0,
+		help = "Converts every given file, directory and glob, writing one .asy per input and one JSON status line per file."
+		)
+parser.add_argument("--framed",
+		action = "store_const",
+		dest = "FRAMED_MODE",
+		const = 1,
+		default = 0,
+		help = "Reads any number of documents from standard input, each as its length in bytes on a line and then the .ggb file (or geogebra.xml), and writes each result as \"LENGTH ok\" or \"LENGTH error\" on a line and then the code or message.  No FILE is given."
+		)
+parser.add_argument("--no-cache",
+		action = "store_const",
+		dest = "CACHE_MODE",
+		const = 0,
+		default = 1,
+		help = "Converts from scratch, without looking in or adding to the cache of converted diagrams."
+		)
 parser.add_argument("--xml",
 		action = "store_const",
 		dest = "DO_XML_ONLY",
@@ -84,6 +257,62 @@ parser.add_argument('--cse', '--cse5',
 		default = 0,
 		help = "Allows the usage of CSE5 whenever possible."
 		)
+parser.add_argument('--noprune',
+		action = "store_const",
+		dest = "PRUNE_MODE",
+		const = 0,
+		default = 1,
+		help = "Keeps hidden objects which nothing visible is constructed from.  By default they are left out."
+		)
+parser.add_argument('--autolabel',
+		action = "store_const",
+		dest = "AUTO_LABELS",
+		const = 1,
+		default = 0,
+		help = "Chooses the direction of each label so that labels avoid each other, dots and paths, instead of dir(45).  Entries in the .cfg file still win.  Needs NumPy."
+		)
+parser.add_argument('--nocull',
+		action = "store_const",
+		dest = "CULL_MODE",
+		const = 0,
+		default = 1,
+		help = "With --clip, still draws objects which lie entirely outside the view.  By default they are left out."
+		)
+parser.add_argument('--nofitlines',
+		action = "store_const",
+		dest = "FIT_LINES",
+		const = 0,
+		default = 1,
+		help = "With --clip, still extends lines and rays by --linescale.  By default they are cut down to the view."
+		)
+parser.add_argument('--noshareintersections',
+		action = "store_const",
+		dest = "SHARE_INTERSECTIONS",
+		const = 0,
+		default = 1,
+		help = "Computes every intersection point separately, even of the same two paths.  By default, IntersectionPoints is called once per pair of paths."
+		)
+parser.add_argument('--hoist',
+		action = "store_const",
+		dest = "HOIST_MODE",
+		const = 1,
+		default = 0,
+		help = "Binds expressions which are written out more than once to temporaries, so they are only evaluated once.  Off by default."
+		)
+parser.add_argument('--stats',
+		action = "store_const",
+		dest = "STATS_MODE",
+		const = 1,
+		default = 0,
+		help = "Prints what the optimisation passes did (objects removed, bytes saved, ...) to stderr."
+		)
+parser.add_argument('--manifest',
+		action = "store",
+		dest = "MANIFEST_FILENAME",
+		metavar = "FILENAME",
+		default = "",
+		help = "An INI file of settings for many diagrams: a [defaults] section, and one section per diagram named like it (e.g. [Iran]), with options and label.X = dir(30) entries.  A diagram's own .cfg file still wins."
+		)
 parser.add_argument('--verbose', 
 		action = "store_const",
 		dest = "CONCISE_MODE",
@@ -105,80 +334,130 @@ parser.add_argument('--csecolors',
 		default = 0,
 		help = "When using CSE5, use the default pathpen and pointpen (blue/red).  This is off by default."
 		)
+parser.add_argument('--profile',
+		action = "store_const",
+		dest = "PROFILE_MODE",
+		const = 1,
+		default = 0,
+		help = "Prints where the time and memory went (stages, constructs functions, expressions) to stderr.  Implies --no-cache, as a cached diagram is not converted at all."
+		)
 parser.add_argument('--version',
 		action = "version",
 		version = "DRAGON %s, by v_Enhance" %VERSION_NUMBER
 		)
 # }}}
 
-opts = vars(parser.parse_args())
-opts['LINE_SCALE_FACTOR'] = float(opts['LINE_SCALE_FACTOR'])
-opts['LABEL_SCALE_FACTOR'] = float(opts['LABEL_SCALE_FACTOR'])
+def main(argv = None):
+	if argv is None:
+		argv = sys.argv[1:]
+	if argv[:1] == ["serve"]:
+		return server.main(argv[1:])
+	opts = vars(parser.parse_args(argv))
+	opts['LINE_SCALE_FACTOR'] = float(opts['LINE_SCALE_FACTOR'])
+	opts['LABEL_SCALE_FACTOR'] = float(opts['LABEL_SCALE_FACTOR'])
 
+	parse_cache.resize(opts['PARSE_CACHE_SIZE'])
+	try:
+		manifest = Manifest(opts['MANIFEST_FILENAME']) if opts['MANIFEST_FILENAME'] else None
+	except DragonError, e:
+		print >>sys.stderr, "FATAL ERROR"
+		print >>sys.stderr, e
+		return 1
+	if opts['FRAMED_MODE']:
+		if opts['FILENAME']:
+			parser.error("no FILE may be given with --framed; the documents come from standard input")
+		try:
+			failures = runFramed(opts, sys.stdin, sys.stdout, manifest)
+		except FrameError, e:
+			print >>sys.stderr, e
+			return 1
+		return 1 if failures else 0
+	if not opts['FILENAME']:
+		parser.error("FILE is required")
+	if opts['BATCH_MODE']:
+		failures = runBatch(opts['FILENAME'], opts, jobs = opts['JOBS'], outdir = opts['OUTPUT_DIR'], timeout = opts['TIMEOUT'], manifest = manifest)
+		return 1 if failures else 0
+	if len(opts['FILENAME']) != 1:
+		parser.error("only one FILE may be given without --batch")
 
-if __name__ == "__main__":
 	#Get the desired file and parse it
-	FILENAME = opts['FILENAME']
-	if not "." in FILENAME:
-		#Extension isn't given, let's assume it was omitted
-		FILENAME += ".ggb"
-	elif FILENAME[-1] == ".":
-		#Last character is ".", add in "ggb"
-		FILENAME += "ggb"
-	ggb = zipfile.ZipFile(FILENAME)
-	xmlFile = ggb.open(GEOGEBRA_XML_LOCATION)
-
-	#Read configuration file
-	config_filename = opts['CONFIG_FILENAME']
-	if config_filename.strip() == "":
-		config_filename = FILENAME[:FILENAME.find('.')] + '.cfg'
-	label_dict = {}
-	if os.path.isfile(config_filename):
-		config = ConfigParser.RawConfigParser()
-		config.optionxform = str # makes names case-sensitive
-		config.read(config_filename)
-		var_cfg = config.items("var") if config.has_section("var") else {}
-		for key, val in var_cfg:
-			try:
-				opts[string.upper(key)] = eval(val)
-			except (NameError, SyntaxError):
-				opts[string.upper(key)] = val
-		label_cfg = config.items("label") if config.has_section("label") else {}
-		for key, val in label_cfg:
-			label_dict[key] = "lsf * " + val
-	
-	# Print XML file only, then exit
-	if opts['DO_XML_ONLY']:
-		print ''.join(xmlFile.readlines())
-		exit()
-
-	#Convert to tree
-	ggb_tree = ElementTree()
-	ggb_tree.parse(xmlFile)
+	if opts['FILENAME'][0] == "-":
+		if opts['WATCH_MODE'] or opts['RENDER_FORMAT']:
+			parser.error("--watch and --render need a FILE, not -")
+		FILENAME = sys.stdin.read() # The data itself; converter tells it from a filename
+		if not isDocument(FILENAME):
+			print >>sys.stderr, "FATAL ERROR"
+			print >>sys.stderr, "Standard input is neither a .ggb file nor geogebra.xml"
+			return 1
+	else:
+		FILENAME = resolveFilename(opts['FILENAME'][0])
 
-	#Retrieve the provided values of the viewport {{{
-	window_width =	float(ggb_tree.find("euclidianView").find("size").attrib["width"])
-	window_height =	float(ggb_tree.find("euclidianView").find("size").attrib["height"])
-	xzero = 	float(ggb_tree.find("euclidianView").find("coordSystem").attrib["xZero"])
-	yzero = 	float(ggb_tree.find("euclidianView").find("coordSystem").attrib["yZero"])
-	xscale = 	float(ggb_tree.find("euclidianView").find("coordSystem").attrib["scale"])
-	yscale = 	float(ggb_tree.find("euclidianView").find("coordSystem").attrib["yscale"])
+	if opts['WATCH_MODE']:
+		try:
+			watch(FILENAME, opts, outputFilename(FILENAME, opts['OUTPUT_DIR']), manifest_filename = opts['MANIFEST_FILENAME'] or None)
+		except KeyboardInterrupt:
+			pass
+		return 0
 
-	#Compute the viewport coordinates from this information 
-	xmin = -xzero/float(xscale)
-	xmax = (window_width - xzero)/float(xscale)
-	ymin = -(window_height -yzero)/float(yscale)
-	ymax = yzero/float(yscale)
-	view = (xmin, xmax, ymin, ymax)
-	# }}}
+	try:
+		# Print XML file only, then exit
+		if opts['DO_XML_ONLY']:
+			shutil.copyfileobj(openGeoGebraXML(FILENAME), sys.stdout)
+			print
+			return 0
 
-	#Do the construction
-	construct_tree = ggb_tree.find("construction")
-	theMainDiagram = AsyDiagram()
-	doCompileDiagramObjects(construct_tree, theMainDiagram)
+		# Without other variants, the preview comes on top of the usual output, from the same compile
+		main_output = StringIO() if opts['PREVIEW_FILENAME'] and not opts['VARIANTS'] else None
+		if opts['PREVIEW_FILENAME']:
+			opts['VARIANTS'].append((opts['PREVIEW_FILENAME'], {'BACKEND' : "svg"}))
+		report = {}
+		if opts['PROFILE_MODE']:
+			opts['CACHE_MODE'] = 0 # Otherwise a hit would profile nothing but the cache lookup
+		profile = Profiler().start() if opts['PROFILE_MODE'] else None
+		if opts['VARIANTS']:
+			files = [open(path, "w") for path, overrides in opts['VARIANTS']]
+			outs = zip(files, [overrides for path, overrides in opts['VARIANTS']])
+			if main_output is not None:
+				outs.insert(0, (main_output, {}))
+			try:
+				convertVariants(FILENAME, opts, outs, report = report, cache = conversionCache(opts), manifest = manifest)
+				for f, overrides in outs:
+					f.write("\n")
+			finally:
+				for f in files:
+					f.close()
+			if main_output is not None:
+				sys.stdout.write(main_output.getvalue())
+			if opts['RENDER_FORMAT']:
+				renderer = AsyRenderer(opts['ASY_COMMAND'], max_bytes = opts['RENDER_CACHE_SIZE'] * 2**20)
+				if main_output is not None and opts['BACKEND'] == "asy":
+					renderer.renderTo(main_output.getvalue(), renderFilename(FILENAME, opts['OUTPUT_DIR'], opts['RENDER_FORMAT']))
+				for path, overrides in opts['VARIANTS']:
+					if overrides.get('BACKEND', opts['BACKEND']) == "asy":
+						f = open(path)
+						renderer.renderTo(f.read(), renderFilename(path, "", opts['RENDER_FORMAT']))
+						f.close()
+		elif opts['RENDER_FORMAT']:
+			code = convertSource(FILENAME, opts, report = report, cache = conversionCache(opts), manifest = manifest) + "\n"
+			sys.stdout.write(code)
+			renderer = AsyRenderer(opts['ASY_COMMAND'], max_bytes = opts['RENDER_CACHE_SIZE'] * 2**20)
+			renderer.renderTo(code, renderFilename(FILENAME, opts['OUTPUT_DIR'], opts['RENDER_FORMAT']))
+		else:
+			convertSource(FILENAME, opts, out = sys.stdout, report = report, cache = conversionCache(opts), manifest = manifest)
+			print
+		if profile is not None:
+			profile.stop()
+			profile.report()
+		for name in sorted(report) if opts['STATS_MODE'] else []:
+			print >>sys.stderr, "%s: %s" %(name, ", ".join("%s %s" %(report[name][key], key.replace("_", " "))
+					for key in sorted(report[name])))
+	except DragonError, e:
+		print >>sys.stderr, "FATAL ERROR"
+		print >>sys.stderr, e
+		print >>sys.stderr, GOOD_LUCK
+		return 1
+	return 0
 
-	if opts['CLIP_IMG'] == 0:
-		print drawDiagram(theMainDiagram, label_dict, opts=opts).replace(u"\u03B1", "alpha")
-	else:
-		print drawDiagram(theMainDiagram, label_dict, view=view, opts=opts).replace(u"\u03B1", "alpha")
 
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,182 @@
+"""batch.py
+Batch mode: converts many .ggb files (directories, globs or plain filenames) with a pool of
+worker processes.  Each input gets an .asy file, either next to it or in an output directory,
+and one JSON line describing the result is printed per file."""
+
+import os
+import sys
+import glob
+import errno
+import json
+import time
+import signal
+import traceback
+import multiprocessing
+
+from converter import resolveFilename, convertSource, conversionCache
+from errors import DragonError, RenderError
+from render import AsyRenderer
+from manifest import Manifest
+
+
+_manifest = None #The Manifest of this worker process, from _startWorker
+_cache = None #Its conversion cache, or None
+_renderer = None #Its AsyRenderer, if the batch renders
+
+def _startWorker(manifest, opts):
+	"""Pool initializer: the manifest is sent to each worker once, not with every job, so the
+	.cfg lookups it caches (one directory listing each) last for all of the worker's files.
+	The caches are made here too, so that each worker scans a cache directory for its size
+	at most once, rather than once per file."""
+	global _manifest, _cache, _renderer
+	_manifest = manifest
+	_cache = conversionCache(opts)
+	if opts.get('RENDER_FORMAT'):
+		_renderer = AsyRenderer(opts['ASY_COMMAND'], max_bytes = opts['RENDER_CACHE_SIZE'] * 2**20)
+
+class ConversionTimeout(Exception):
+	pass
+
+def _raiseTimeout(signum, frame):
+	raise ConversionTimeout()
+
+
+def collectInputs(patterns):
+	"""Expand a list of directories, globs and filenames into a list of .ggb files.
+	Directories are searched recursively.  Duplicates are dropped; order is kept."""
+	found = []
+	seen = set()
+	for pattern in patterns:
+		if os.path.isdir(pattern):
+			matches = []
+			for dirpath, dirnames, filenames in os.walk(pattern):
+				dirnames.sort()
+				for name in sorted(filenames):
+					if name.lower().endswith(".ggb"):
+						matches.append(os.path.join(dirpath, name))
+		elif glob.has_magic(pattern):
+			matches = sorted(glob.glob(pattern))
+		else:
+			matches = [resolveFilename(pattern)]
+		for filename in matches:
+			if filename not in seen:
+				seen.add(filename)
+				found.append(filename)
+	return found
+
+def commonDirectory(filenames):
+	"""The deepest directory which all of filenames are in"""
+	if not filenames:
+		return ""
+	prefix = os.path.commonprefix([os.path.dirname(os.path.abspath(f)) + os.sep for f in filenames])
+	return prefix[:prefix.rfind(os.sep) + 1]
+
+def outputFilename(filename, outdir = "", root = ""):
+	"""Where the .asy for filename goes: next to it, or into outdir if given.
+	With a root directory, the path of filename below root is kept inside outdir,
+	so that a/fig.ggb and b/fig.ggb do not both become outdir/fig.asy."""
+	base = os.path.splitext(filename)[0] + ".asy"
+	if outdir:
+		if root:
+			base = os.path.join(outdir, os.path.relpath(os.path.abspath(base), root))
+		else:
+			base = os.path.join(outdir, os.path.basename(base))
+	return base
+
+def renderFilename(filename, outdir = "", fmt = "pdf"):
+	"""Where the render of filename goes: like outputFilename, with fmt as the extension"""
+	return os.path.splitext(outputFilename(filename, outdir))[0] + "." + fmt
+
+
+def _convertOne(job):
+	"""Worker: convert one file, render it if opts asks for it, and report on it.  Never raises."""
+	filename, out_filename, opts, timeout = job
+	result = {"input" : filename, "output" : out_filename}
+	start = time.time()
+	f = None
+	if timeout:
+		signal.signal(signal.SIGALRM, _raiseTimeout)
+		signal.alarm(int(timeout))
+	try:
+		try:
+			directory = os.path.dirname(out_filename)
+			if directory and not os.path.isdir(directory):
+				try:
+					os.makedirs(directory)
+				except OSError, e:
+					if e.errno != errno.EEXIST or not os.path.isdir(directory): # Another worker may have just made it
+						raise
+			f = open(out_filename, "w")
+			convertSource(filename, opts, out = f, cache = _cache, manifest = _manifest)
+			f.write("\n")
+			f.close()
+			if opts.get('RENDER_FORMAT'):
+				result["render"] = _renderOne(out_filename, opts['RENDER_FORMAT'])
+		finally:
+			if timeout:
+				signal.alarm(0)
+			if f is not None:
+				f.close()
+		result["status"] = "ok"
+	except ConversionTimeout:
+		result["status"] = "timeout"
+		result["error"] = "exceeded %s seconds" %timeout
+	except RenderError, e:
+		result["status"] = "render_error" # The .asy file itself is fine
+		result["error"] = str(e)
+	except DragonError, e:
+		result["status"] = "error"
+		result["error"] = "%s: %s" %(e.__class__.__name__, e)
+	except Exception, e:
+		result["status"] = "error"
+		result["error"] = "%s: %s" %(e.__class__.__name__, e)
+		result["traceback"] = traceback.format_exc()
+	if result["status"] in ("error", "timeout") and f is not None and os.path.isfile(out_filename):
+		os.remove(out_filename) # Don't leave half a diagram behind
+	result["seconds"] = round(time.time() - start, 4)
+	return result
+
+
+def _renderOne(out_filename, fmt):
+	"""Render the .asy file out_filename next to itself.  Each worker process renders one file
+	at a time, so --jobs also bounds the number of asy processes."""
+	f = open(out_filename, "rb")
+	code = f.read()
+	f.close()
+	return _renderer.renderTo(code, os.path.splitext(out_filename)[0] + "." + fmt)
+
+
+def runBatch(patterns, opts, jobs = None, outdir = "", timeout = None, stream = None, manifest = None):
+	"""Convert every file matched by patterns, with the settings of manifest (a manifest.Manifest) if given.
+	One JSON line per file is written to stream as soon as that file is done.
+	Returns the number of files which failed."""
+	if stream is None:
+		stream = sys.stdout
+	filenames = collectInputs(patterns)
+	root = commonDirectory(filenames) if outdir else ""
+	jobs_list = []
+	writers = {} #output filename : the input written there
+	failures = 0
+	for filename in filenames:
+		out_filename = outputFilename(filename, outdir, root)
+		if out_filename in writers:
+			# Never let one input overwrite the output of another
+			failures += 1
+			result = {"input" : filename, "output" : out_filename, "status" : "error",
+				"error" : "%s is already written for %s" %(out_filename, writers[out_filename])}
+			stream.write(json.dumps(result, sort_keys = True) + "\n")
+			continue
+		writers[out_filename] = filename
+		jobs_list.append((filename, out_filename, opts, timeout))
+
+	pool = multiprocessing.Pool(jobs or None, _startWorker, (manifest or Manifest(), opts))
+	try:
+		for result in pool.imap_unordered(_convertOne, jobs_list):
+			if result["status"] != "ok":
+				failures += 1
+			stream.write(json.dumps(result, sort_keys = True) + "\n")
+			stream.flush()
+	finally:
+		pool.close()
+		pool.join()
+	return failures
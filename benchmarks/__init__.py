@@ -0,0 +1,2 @@
+"""Benchmarks for Dragon.  Run each one as a module, e.g.
+python -m dragon.benchmarks.lexer"""
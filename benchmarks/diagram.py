@@ -0,0 +1,70 @@
+"""benchmarks/diagram.py
+Times building (including removals) and drawing synthetic AsyDiagrams of up to 100k objects,
+to check the container and drawDiagram scale linearly.
+
+python -m dragon.benchmarks.diagram [SIZE ...]"""
+
+import sys
+import time
+
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.diagram import AsyDiagram, GGBObject, drawDiagram
+
+SIZES = [1000, 10000, 100000]
+
+
+class NullSink():
+	"""Swallows the output, so only the emission itself is timed"""
+	def write(self, chunk):
+		pass
+
+def build(n):
+	"""A diagram of n objects in the shape of a real construction: free points, segments
+	between them, intersections of those, and text elements which get removed again."""
+	diagram = AsyDiagram()
+	for i in range(n):
+		label = "P_%d" %i
+		kind = i % 5
+		if kind == 0 or i < 3:
+			diagram[label] = GGBObject(label = label, constructor = "(%d, %d)" %(i, i % 7))
+		elif kind == 1:
+			a, b = "P_%d" %(i-1), "P_%d" %(i-2)
+			diagram[label] = GGBObject(label = label, constructor = "%s--%s" %(a, b), asy_obj_type = "path", ggb_obj_type = "segment")
+			diagram[a].depend += 1
+			diagram[b].depend += 1
+		elif kind == 2:
+			a, b = "P_%d" %(i-1), "P_%d" %(i-3)
+			diagram[label] = GGBObject(label = label, constructor = "IntersectionPoint(%s,%s)" %(a, b))
+			diagram[a].depend += 1
+			diagram[b].depend += 1
+		elif kind == 3:
+			diagram[label] = GGBObject(label = label, constructor = "\"$t_{%d}$\"" %i)
+			diagram.text_dict[label] = {"text" : diagram[label].constructor, "x" : i, "y" : 0}
+			diagram.remove(label)
+		else:
+			diagram[label] = GGBObject(label = label, constructor = "(%d, 0)" %i, visible = 0)
+		if label in diagram.objectDict and i % 2 == 0:
+			diagram[label].needs_label = 1
+			diagram[label].depend += 1
+	return diagram
+
+def run(sizes):
+	opts = dict(DEFAULT_OPTIONS)
+	print "%10s %12s %12s %12s %12s" %("objects", "build", "draw", "concise", "us/object")
+	for n in sizes:
+		start = time.time()
+		diagram = build(n)
+		t_build = time.time() - start
+
+		start = time.time()
+		drawDiagram(diagram, opts = opts, out = NullSink())
+		t_draw = time.time() - start
+
+		opts_concise = dict(opts, CONCISE_MODE = 1)
+		start = time.time()
+		drawDiagram(diagram, opts = opts_concise, out = NullSink())
+		t_concise = time.time() - start
+		print "%10d %11.4fs %11.4fs %11.4fs %12.2f" %(n, t_build, t_draw, t_concise, 1e6 * (t_build + t_draw) / n)
+
+if __name__ == "__main__":
+	run([int(arg) for arg in sys.argv[1:]] or SIZES)
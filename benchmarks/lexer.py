@@ -0,0 +1,77 @@
+"""benchmarks/lexer.py
+Times ggb_parser.tokenize and ShuntingYard on very long expressions, to check they scale linearly.
+The old character-by-character tokenizer is kept here for comparison.
+
+python -m dragon.benchmarks.lexer [SIZE ...]"""
+
+import sys
+import time
+
+from dragon import ggb_parser
+from dragon.diagram import GGBObject
+
+SIZES = [10000, 20000, 40000, 80000]
+
+
+def legacy_get_tokens_from_string(s):
+	"""The tokenizer as it was before ggb_parser.tokenize"""
+	tokens = []
+	cocoon = ""
+	for char in s + ";":
+		if char in "()[]+-*/^,;":
+			if cocoon.strip() != "":
+				tokens.append(cocoon.strip())
+			if len(tokens) > 0:
+				if not ggb_parser.isFunc(tokens[-1]) and not (tokens[-1] in "+-*/^") and char == "(":
+					tokens.append("*")
+			tokens.append(char)
+			cocoon = ""
+		elif char == " " and cocoon.strip() == "":
+			pass
+		else:
+			cocoon += char
+	tokens.pop()
+	return tokens
+
+def make_expression(length):
+	"""An arithmetic expression of roughly length characters, with commands and implicit multiplication"""
+	pieces = ["Distance[A_1, B_1]", "2(x+y)", "x*y^2", "12.5/x", "Length[Segment[A_1, B_1]]"]
+	parts = []
+	total = 0
+	i = 0
+	while total < length:
+		piece = pieces[i % len(pieces)]
+		parts.append(piece)
+		total += len(piece) + 3
+		i += 1
+	return " + ".join(parts)
+
+def make_ref_dict():
+	ref_dict = {}
+	for label, ggb_type in [("A_1", "point"), ("B_1", "point"), ("x", "numeric"), ("y", "numeric")]:
+		ref_dict[label] = GGBObject(label = label, ggb_obj_type = ggb_type)
+	return ref_dict
+
+def best_time(func, repeat = 3):
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		func()
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+def run(sizes):
+	ref_dict = make_ref_dict()
+	print "%10s %12s %12s %12s %14s" %("chars", "tokenize", "shunting", "legacy", "tokenize us/ch")
+	for size in sizes:
+		s = make_expression(size)
+		tokens = ggb_parser.tokenize(s)
+		t_tokenize = best_time(lambda: ggb_parser.tokenize(s))
+		t_shunting = best_time(lambda: ggb_parser.ShuntingYard(tokens, ref_dict = ref_dict, num_expected = 1))
+		t_legacy = best_time(lambda: legacy_get_tokens_from_string(s))
+		print "%10d %11.4fs %11.4fs %11.4fs %14.3f" %(len(s), t_tokenize, t_shunting, t_legacy, 1e6 * t_tokenize / len(s))
+
+if __name__ == "__main__":
+	run([int(arg) for arg in sys.argv[1:]] or SIZES)
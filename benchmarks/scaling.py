@@ -0,0 +1,131 @@
+"""benchmarks/scaling.py
+Times each stage of a conversion on synthetic constructions of growing size, and records peak memory.
+The stages are those of a real conversion: the construction is streamed out of the XML by
+converter.iterConstruction and compiled by converter.compileDiagram, with the optimisation passes
+the default options run, and drawn by converter.drawVariant.  Clipping is on unless --noclip is
+given, so that culling and line fitting are timed too.  Time spent tokenizing and in the
+shunting yard is shown apart from the rest of the compile.
+Every size runs in a fresh worker process, so the peak resident set size (ru_maxrss)
+after each stage belongs to that size alone.  Results are printed as a table and
+written as JSON, e.g. to compare two versions:
+
+python -m dragon.benchmarks.scaling [--output FILE] [--depth DEPTH] [--noclip] [SIZE ...]"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import zipfile
+import multiprocessing
+from StringIO import StringIO
+
+from dragon import profiler
+from dragon.constants import DEFAULT_OPTIONS, VERSION_NUMBER, GEOGEBRA_XML_LOCATION
+from dragon.converter import openGeoGebraXML, compileDiagram, drawVariant
+from dragon.benchmarks.synthetic import generateGGB
+from dragon.benchmarks.diagram import NullSink
+
+SIZES = [1000, 10000, 100000]
+STAGES = ["zip_open", "xml_parse", "tokenize", "shunting_yard", "compile", "cull", "prune", "fitlines", "intersections", "draw"]
+
+
+def peakMemory():
+	"""Peak resident set size of this process so far, in kilobytes"""
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == "darwin":
+		peak /= 1024 # Bytes there
+	return peak
+
+class StageTimer(profiler.Profiler):
+	"""A Profiler which only times the stages, so that the conversion pays for no per-call
+	bookkeeping, and notes the peak memory after each outermost stage"""
+	def __init__(self):
+		profiler.Profiler.__init__(self)
+		self.peak_kb = {}
+
+	def start(self):
+		profiler.active = self
+		return self
+
+	def stop(self):
+		profiler.active = None
+
+	def _close(self, name):
+		profiler.Profiler._close(self, name)
+		if not self._open:
+			self.peak_kb[name] = peakMemory()
+
+	def call(self, name, function, *args, **kwargs):
+		return function(*args, **kwargs)
+
+	def expression(self, s, number_of_tokens):
+		pass
+
+	def diagram(self, diagram):
+		pass
+
+def measure(job):
+	"""Worker: convert a synthetic construction of n objects, timing each stage"""
+	n, depth, clip = job
+	data = generateGGB(n, depth)
+	opts = dict(DEFAULT_OPTIONS)
+	opts['CLIP_IMG'] = clip
+	result = {"objects" : n, "depth" : depth, "clip" : clip, "ggb_bytes" : len(data), "seconds" : {}, "peak_kb" : {}}
+	result["peak_kb"]["start"] = peakMemory()
+
+	timer = StageTimer().start()
+	try:
+		with timer.stage("zip_open"):
+			xmlFile = openGeoGebraXML(data)
+		diagram, view = compileDiagram(xmlFile, opts) # Straight from the zip member, as a conversion does
+		drawVariant(diagram, view, {}, opts, NullSink())
+	finally:
+		timer.stop()
+	result["xml_bytes"] = zipfile.ZipFile(StringIO(data)).getinfo(GEOGEBRA_XML_LOCATION).file_size
+	result["compiled_objects"] = len(diagram)
+	for name in STAGES:
+		result["seconds"][name] = round(timer.stages[name][0], 6) if name in timer.stages else 0.0
+	result["peak_kb"].update(timer.peak_kb)
+	return result
+
+def run(sizes, depth = 8, clip = 1):
+	columns = STAGES + ["total"]
+	print "%10s" %"objects" + "".join(" %13s" %name for name in columns) + " %10s" %"peak MB"
+	results = []
+	for n in sizes:
+		pool = multiprocessing.Pool(1)
+		try:
+			result = pool.apply(measure, [(n, depth, clip)])
+		finally:
+			pool.close()
+			pool.join()
+		seconds = [result["seconds"][name] for name in STAGES]
+		print "%10d" %n + "".join(" %12.3fs" %t for t in seconds + [sum(seconds)]) + " %10.1f" %(max(result["peak_kb"].values()) / 1024.0)
+		results.append(result)
+	return results
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Time the stages of Dragon on synthetic constructions.")
+	parser.add_argument("sizes", metavar = "SIZE", type = int, nargs = "*", default = SIZES,
+			help = "Numbers of objects.  Defaults to %s." %" ".join(map(str, SIZES)))
+	parser.add_argument("--depth", type = int, default = 8,
+			help = "Nesting depth of the arithmetic expressions.  Defaults to 8.")
+	parser.add_argument("--output", "-o", default = "scaling-%s.json" %VERSION_NUMBER,
+			help = "JSON file for the results.  Defaults to scaling-VERSION.json.")
+	parser.add_argument("--noclip", action = "store_true",
+			help = "Convert without clipping to the view, which skips culling and line fitting.")
+	args = parser.parse_args(argv)
+
+	results = run(args.sizes, args.depth, 0 if args.noclip else 1)
+	f = open(args.output, "w")
+	json.dump({"version" : VERSION_NUMBER, "python" : platform.python_version(),
+			"platform" : platform.platform(), "date" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"stages" : STAGES, "results" : results}, f, indent = 1, sort_keys = True)
+	f.write("\n")
+	f.close()
+	print "Results written to %s" %args.output
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,104 @@
+"""benchmarks/synthetic.py
+Generates synthetic GeoGebra constructions of any size, for benchmarks.
+Every step adds a handful of objects to a chain, each built from earlier ones:
+a free point, a circle, a line, their intersection (which the next step builds on),
+a numeric defined by a deeply nested arithmetic expression, and now and then a text.
+About half of the points are labelled.
+
+python -m dragon.benchmarks.synthetic OBJECTS FILE.ggb [DEPTH]"""
+
+import sys
+import zipfile
+from StringIO import StringIO
+from xml.sax.saxutils import quoteattr
+
+from dragon.constants import GEOGEBRA_XML_LOCATION
+
+OBJECTS_PER_STEP = 6 #Roughly; texts are every TEXT_EVERY steps
+TEXT_EVERY = 4
+
+HEADER = """<?xml version="1.0" encoding="utf-8"?>
+<geogebra format="4.0">
+<euclidianView>
+	<size  width="1200" height="800"/>
+	<coordSystem xZero="600.0" yZero="400.0" scale="50.0" yscale="50.0"/>
+</euclidianView>
+<construction title="synthetic" author="" date="">
+"""
+FOOTER = """</construction>
+</geogebra>
+"""
+
+def showXML(visible, labelled):
+	return '\t<show object="%s" label="%s"/>\n' %(str(bool(visible)).lower(), str(bool(labelled)).lower())
+
+def pointXML(label, x, y, labelled):
+	return ('<element type="point" label="%s">\n' %label + showXML(1, labelled) +
+			'\t<objColor r="0" g="0" b="255" alpha="0.0"/>\n' +
+			'\t<coords x="%r" y="%r" z="1.0"/>\n</element>\n' %(x, y))
+
+def pathXML(ggb_type, label, visible = 1):
+	return ('<element type="%s" label="%s">\n' %(ggb_type, label) + showXML(visible, 0) +
+			'\t<objColor r="0" g="153" b="0" alpha="0.0"/>\n' +
+			'\t<lineStyle thickness="2" type="0" typeHidden="1"/>\n</element>\n')
+
+def commandXML(name, inputs, output):
+	return ('<command name="%s">\n' %name +
+			'\t<input %s/>\n' %" ".join('a%d=%s' %(i, quoteattr(arg)) for i, arg in enumerate(inputs)) +
+			'\t<output a0="%s"/>\n</command>\n' %output)
+
+def nestedExpression(previous, depth):
+	"""An arithmetic expression depth levels deep, e.g. (r1 + 1) * (2 - (r1 / 3))"""
+	exp = previous
+	for level in range(depth):
+		if level % 2 == 0:
+			exp = "(%s + %d) * 0.5" %(exp, level + 1)
+		else:
+			exp = "%d - (%s / %d)" %(level + 2, exp, level + 3)
+	return exp
+
+def generateXML(n, depth = 8):
+	"""geogebra.xml for a construction of about n objects, as a list of strings"""
+	parts = [HEADER]
+	parts.append(pointXML("A0", 0.0, 0.0, 1))
+	parts.append(pointXML("Q0", 1.0, 0.0, 1))
+	parts.append('<element type="numeric" label="r0">\n' + showXML(0, 0) + '\t<value val="1.0"/>\n</element>\n')
+	count = 3
+	step = 0
+	while count < n:
+		step += 1
+		A, Q, c, l, r = ["%s%d" %(prefix, step) for prefix in ("A", "Q", "c", "l", "r")]
+		parts.append(pointXML(A, float(step % 97), float(step % 89) / 2, step % 2))
+		parts.append(commandXML("Circle", ["Q%d" %(step-1), A], c))
+		parts.append(pathXML("conic", c, step % 3 == 0))
+		parts.append(commandXML("Line", ["A%d" %(step-1), A], l))
+		parts.append(pathXML("line", l, step % 3 == 1))
+		parts.append(commandXML("Intersect", [c, l, "1"], Q))
+		parts.append(pointXML(Q, 0.0, 0.0, step % 2 == 0))
+		parts.append('<expression label="%s" exp=%s/>\n' %(r, quoteattr(nestedExpression("r%d" %(step-1), depth))))
+		parts.append('<element type="numeric" label="%s">\n' %r + showXML(0, 0) + '\t<value val="1.0"/>\n</element>\n')
+		count += 5
+		if step % TEXT_EVERY == 0:
+			t = "text%d" %step
+			parts.append('<expression label="%s" exp=%s/>\n' %(t, quoteattr('"Step %d"' %step)))
+			parts.append('<element type="text" label="%s">\n' %t + showXML(1, 1) +
+					'\t<startPoint x="%d.0" y="-1.0" z="1.0"/>\n</element>\n' %(step % 97))
+			count += 1
+	parts.append(FOOTER)
+	return parts
+
+def generateGGB(n, depth = 8):
+	"""The bytes of a .ggb archive with a construction of about n objects"""
+	data = StringIO()
+	archive = zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED)
+	archive.writestr(GEOGEBRA_XML_LOCATION, "".join(generateXML(n, depth)))
+	archive.close()
+	return data.getvalue()
+
+if __name__ == "__main__":
+	if len(sys.argv) < 3:
+		print >>sys.stderr, __doc__.splitlines()[-1]
+		sys.exit(2)
+	f = open(sys.argv[2], "wb")
+	f.write(generateGGB(int(sys.argv[1]), *[int(arg) for arg in sys.argv[3:4]]))
+	f.close()
@@ -0,0 +1,139 @@
+"""cache.py
+A content-addressed cache of files on disk, shared safely between processes.
+Entries are written to a temporary file and renamed into place, so a reader never sees half an entry.
+When the cache grows past its size limit, the least recently used entries are evicted;
+a hit refreshes the entry's mtime, which is what "recently used" means here."""
+
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+
+
+def defaultCacheDirectory():
+	base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+	return os.path.join(base, "dragon")
+
+def hashKey(*parts):
+	"""A key for the cache from any number of byte strings"""
+	h = hashlib.sha256()
+	for part in parts:
+		if isinstance(part, unicode):
+			part = part.encode("utf-8")
+		h.update("%d:" %len(part)) #So that ("ab", "c") and ("a", "bc") differ
+		h.update(part)
+	return h.hexdigest()
+
+
+class DiskCache():
+	"""Files stored under directory by key (see hashKey) and suffix, e.g. ".pdf".
+	max_bytes bounds the total size; 0 means no bound."""
+	def __init__(self, directory = None, max_bytes = 0):
+		self.directory = directory or defaultCacheDirectory()
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self._size = None #Estimated total size; the directory is only scanned when this passes max_bytes
+
+	def path(self, key, suffix = ""):
+		return os.path.join(self.directory, key[:2], key + suffix)
+
+	def lookup(self, key, suffix = ""):
+		"""The path of the entry, or None if there is none"""
+		path = self.path(key, suffix)
+		try:
+			os.utime(path, None)
+		except OSError, e:
+			if e.errno == errno.ENOENT or not os.path.isfile(path):
+				self.misses += 1
+				return None
+			# e.g. a read-only cache: the entry is still good, it just isn't marked as recently used
+		self.hits += 1
+		return path
+
+	def read(self, key, suffix = ""):
+		"""The contents of the entry, or None if there is none"""
+		path = self.lookup(key, suffix)
+		if path is None:
+			return None
+		try:
+			f = open(path, "rb")
+		except IOError: # Evicted just now by someone else
+			return None
+		try:
+			return f.read()
+		finally:
+			f.close()
+
+	def tempDirectory(self):
+		"""A fresh directory in the cache, on the same filesystem, for building entries in.
+		The caller removes it."""
+		self._makedirs(self.directory)
+		return tempfile.mkdtemp(prefix = ".tmp", dir = self.directory)
+
+	def storeFile(self, key, suffix, filename):
+		"""Move filename into the cache as the entry; returns its path"""
+		path = self.path(key, suffix)
+		self._makedirs(os.path.dirname(path))
+		os.rename(filename, path) # Atomic; the last writer wins, with identical contents anyway
+		if self.max_bytes:
+			if self._size is not None:
+				self._size += os.path.getsize(path)
+			if self._size is None or self._size > self.max_bytes:
+				self.evict()
+		return path
+
+	def store(self, key, suffix, data):
+		"""Write data as the entry; returns its path"""
+		self._makedirs(self.directory)
+		fd, filename = tempfile.mkstemp(prefix = ".tmp", dir = self.directory)
+		f = os.fdopen(fd, "wb")
+		try:
+			f.write(data)
+		finally:
+			f.close()
+		return self.storeFile(key, suffix, filename)
+
+	def entries(self):
+		"""(mtime, size, path) of every entry"""
+		found = []
+		for dirpath, dirnames, filenames in os.walk(self.directory):
+			dirnames[:] = [name for name in dirnames if not name.startswith(".tmp")]
+			for name in filenames:
+				if name.startswith(".tmp"):
+					continue
+				path = os.path.join(dirpath, name)
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				found.append((st.st_mtime, st.st_size, path))
+		return found
+
+	def evict(self):
+		"""Remove least recently used entries until the cache fits in max_bytes"""
+		if not self.max_bytes:
+			return
+		entries = self.entries()
+		total = sum(size for mtime, size, path in entries)
+		for mtime, size, path in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+			total -= size
+		self._size = total
+
+	def clear(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	@staticmethod
+	def _makedirs(directory):
+		try:
+			os.makedirs(directory)
+		except OSError, e:
+			if e.errno != errno.EEXIST:
+				raise
@@ -17,6 +17,30 @@ CSE_CONCISE_TRANSLATE["Distance"] = "d"
 
 GOOD_LUCK = "You are on your own.  Good luck!"
 
+#Options which change the output, and their defaults.  The command line uses the same names.
+DEFAULT_OPTIONS = {
+	'IMG_SIZE' : "11cm",
+	'LINE_SCALE_FACTOR' : 2011.0,
+	'LABEL_SCALE_FACTOR' : 0.8,
+	'FONT_SIZE' : "10pt",
+	'CONFIG_FILENAME' : "",
+	'CLIP_IMG' : 0,
+	'CONCISE_MODE' : 0,
+	'CSE_MODE' : 0,
+	'CSE_COLORS' : 0,
+	'BACKEND' : "asy",
+	'NUMERIC_MODE' : "",
+	'CULL_MODE' : 1,
+	'PRUNE_MODE' : 1,
+	'ONLY_LABELS' : "",
+	'FIT_LINES' : 1,
+	'SHARE_INTERSECTIONS' : 1,
+	'AUTO_LABELS' : 0,
+	'HOIST_MODE' : 0,
+	'HOIST_MIN_SIZE' : 12,
+	'HOIST_BUDGET' : 400,
+	}
+
 
 #Things that might occasionally want to be changed
 DICT_ASY_TYPES = {
@@ -55,6 +79,7 @@ DEPEND_THRESHOLD = 1 #min number of refs before pair name is assigned.
 #This is here because I was an idiot and thought DEPEND_THRESHOLD > 1 would work.
 #It doesn't.
 GEOGEBRA_XML_LOCATION = "geogebra.xml"
+PARSE_CACHE_SIZE = 4096 #max number of parsed expressions kept by ggb_parser.parse_cache
 INFIX_OPERATOR_DICT = {
 		"+" : {"name": "op_plus", "prec": 5},
 		"-" : {"name": "op_minus", "prec": 5},
@@ -2,18 +2,17 @@
 Contains the library of GGB > Asymptote information.
 name is a dictionary of name conversions, while the functions perform the actual Asymptote outputting.
 Each function has an attribute ggb_return_type, which lists the expected return GGB type of the function.
-This can be converted to an asymptote type using the dictionary DICT_ASY_TYPES in constants.py """
+This can be converted to an asymptote type using the dictionary DICT_ASY_TYPES in constants.py
+Each function also has an attribute ggb_arity, the (fewest, most) arguments it takes; registry.py checks
+calls against it before the function is called, so the functions can rely on it."""
 
 from constants import DICT_ASY_TYPES
+from errors import ParseError, UnsupportedError
 
 #Auxiliary functions
 def aux_paren(args):
 	return "(" + ",".join([str(t) for t in args]) + ")"
-def aux_check_sane(args, lmin, lmax):
-	assert lmin <= len(args) <= lmax, "%d is not in [%d, %d]" %(len(args), lmin, lmax)
-def aux_get_cmd(cmdname, args, lmin=None, lmax=None):
-	if lmin is not None and lmax is not None:
-		aux_check_sane(args, lmin, lmax)
+def aux_get_cmd(cmdname, args):
 	return cmdname + aux_paren(args)
 def aux_op_join(op_symbol, args):
 	return op_symbol.join([str(t) for t in args])
@@ -40,7 +39,8 @@ def Midpoint(*args, **kwargs):
 		return aux_get_cmd("midpoint", args)
 	else:
 		return aux_get_cmd("midpoint", ['--'.join(args)])
-Midpoint.ggb_return_type = "point" 
+Midpoint.ggb_return_type = "point"
+Midpoint.ggb_arity = (1, 2)
 
 def Circle(*args, **kwargs):
 	if len(args) == 2:
@@ -51,12 +51,12 @@ def Circle(*args, **kwargs):
 		else:
 			return aux_get_cmd("CirclebyPoint", args)
 	else:
-		return aux_get_cmd("circumcircle", args, 3,3)
+		return aux_get_cmd("circumcircle", args)
 Circle.ggb_return_type = "point"
+Circle.ggb_arity = (2, 3)
 
 #Aw god.  Center of a circle.
 def Center(*args, **kwargs):
-	aux_check_sane(args, 1, 1)
 	w = args[0]
 	#Do we really haveee to do this?
 	#Because I sure don't want to.
@@ -73,6 +73,7 @@ def Center(*args, **kwargs):
 		bpoint = "relpoint(%s, 0.5)" %w
 		return Midpoint(apoint, bpoint, **kwargs)
 Center.ggb_return_type = "point"
+Center.ggb_arity = (1, 1)
 
 #Polygons
 def Polygon(*args, **kwargs):
@@ -81,14 +82,14 @@ def Polygon(*args, **kwargs):
 		yield '%s--%s' %(args[i], args[i+1])
 	yield '%s--%s' %(args[-1], args[0])
 Polygon.ggb_return_type = "polygon"
+Polygon.ggb_arity = (3, None)
 
 def Segment(*args, **kwargs):
-	aux_check_sane(args, 2,2)
 	return args[0] + "--" + args[1]
 Segment.ggb_return_type = "segment"
+Segment.ggb_arity = (2, 2)
 
 def Intersect(*args, **kwargs):
-	aux_check_sane(args, 2, 3)
 	if len(args) == 2:
 		if kwargs["num_expected"] == 1:
 			return aux_get_cmd("IntersectionPoint", args)
@@ -98,14 +99,17 @@ def Intersect(*args, **kwargs):
 	else:
 		A = args[0]
 		B = args[1]
-		index = str(int(args[2])-1)
+		try:
+			index = str(int(args[2])-1)
+		except ValueError:
+			raise ParseError, "The index of an intersection must be a whole number, not %s" %args[2]
 		#Because asymptote indexes as 0,1,... while 
 		#geogebra indexs as 1,2,...
 		return aux_get_cmd("IntersectionPoint", [A,B,index])
 Intersect.ggb_return_type = "point"
+Intersect.ggb_arity = (2, 3)
 
 def Line(*args, **kwargs):
-	aux_check_sane(args, 2,2)
 	first, second = args
 	if DICT_ASY_TYPES[kwargs["args_types"][1]] == 'path':
 		start =	 "relpoint(%s,0.5-10/lisf)" %second
@@ -115,33 +119,33 @@ def Line(*args, **kwargs):
 	else:
 		return "Line" + aux_paren( [args[0], args[1], 'lisf'] )
 Line.ggb_return_type = "line"
+Line.ggb_arity = (2, 2)
 
 def Ray(*args, **kwargs):
-	aux_check_sane(args, 2,2)
 	return "Line" + aux_paren( [args[0], args[1], 0, 'lisf'] )
 Ray.ggb_return_type = "ray"
+Ray.ggb_arity = (2, 2)
 
 
 
 
 
 def AngularBisector(*args, **kwargs):
-	aux_check_sane(args, 2,3)
 	if len(args) == 2:
-		raise ValueError, "Have not implemented angle bisector for two lines yet..."
+		raise UnsupportedError, "Have not implemented angle bisector for two lines yet..."
 
 	else:
 		kwargs['args_types'] = ["point", "point"]
 		return Line(args[1], "bisectorpoint" + aux_paren(args), **kwargs)
 
 AngularBisector.ggb_return_type = "line"
+AngularBisector.ggb_arity = (2, 3)
 
 
 
 
 
 def LineBisector(*args, **kwargs):
-	aux_check_sane(args,1,2)
 	if len(args) == 2: 
 		#Perp Bisector of two points A and B
 		kwargs['args_types'] = ["point", "point"]
@@ -160,26 +164,27 @@ def LineBisector(*args, **kwargs):
 		return Line(Midpoint(start, end, **kwargs), "bisectorpoint" + aux_paren([start, end]), **kwargs)
 
 LineBisector.ggb_return_type = "line"
+LineBisector.ggb_arity = (1, 2)
 
 
 def OrthogonalLine(*args, **kwargs):
-	aux_check_sane(args, 2,2)
 	A = "relpoint(%s, 0)" %args[1]
 	B = "relpoint(%s, 1)" %args[1]
 	P = args[0]
 	kwargs['args_types'] = ["point", "point"]
 	return Line(P,Foot(P,A,B), **kwargs)
 OrthogonalLine.ggb_return_type = "line"
+OrthogonalLine.ggb_arity = (2, 2)
 
 
 def Vector(*args, **kwargs):
 	#Why would you do this?
 	return Segment(*args, **kwargs)
 Vector.ggb_return_type = "segment"
+Vector.ggb_arity = (2, 2)
 
 
 def Length(*args, **kwargs):
-	aux_check_sane(args,1,2)
 	if len(args) == 2: #Two points
 		return aux_get_cmd("distance", args)
 	elif len(args[0]) == 4 and args[0][1:3] == "--":
@@ -187,13 +192,14 @@ def Length(*args, **kwargs):
 	else: #One segment
 		return aux_get_cmd("arclength", args)
 Length.ggb_return_type = "numeric"
+Length.ggb_arity = (1, 2)
 
 def Distance(*args, **kwargs):
 	return Length(*args, **kwargs)
 Distance.ggb_return_type = "numeric"
+Distance.ggb_arity = (1, 2)
 
 def Angle(*args, **kwargs):
-	aux_check_sane(args, 3,3)
 	A,B,C = args
 	return "(abs(dot(unit(%s-%s),unit(%s-%s))) < 1/2011) ? " %(A,B,C,B) + \
 			"rightanglemark(%s,%s,%s) : anglemark(%s,%s,%s)" %(A,B,C,A,B,C) 
@@ -201,9 +207,9 @@ def Angle(*args, **kwargs):
 	#a right angle mark when the angle is roughly 90 degrees
 	#and a generic mark otherwise.
 Angle.ggb_return_type = "angle"
+Angle.ggb_arity = (3, 3)
 
 def Mirror(*args, **kwargs):
-	aux_check_sane(args, 2, 2)
 	#FML.
 	first, second = args
 	type1 = DICT_ASY_TYPES[kwargs["args_types"][0]]
@@ -219,25 +225,32 @@ def Mirror(*args, **kwargs):
 def return_first_type(*args, **kwargs):
 	return kwargs["args_types"][0]
 Mirror.ggb_return_type = return_first_type
+Mirror.ggb_arity = (2, 2)
 
 def Rotate(*args, **kwargs):
-	aux_check_sane(args, 3, 3)
 	obj, angle, pivot = args
 	return "rotate(%s, %s) * %s" %(str(angle), str(pivot), str(obj))
 Rotate.ggb_return_type = return_first_type
+Rotate.ggb_arity = (3, 3)
 
 
 		
 
-def Incircle(*args, **kwargs): return aux_get_cmd("incircle", args, 3,3)
-def Incenter(*args, **kwargs): return aux_get_cmd("incenter", args, 3,3)
-def Foot(*args, **kwargs): return aux_get_cmd("foot", args, 3, 3)
-def Orthocenter(*args, **kwargs): return aux_get_cmd("orthocenter", args, 3,3)
-def Centroid(*args, **kwargs): return aux_get_cmd("centroid", args, 3,3)
-def Circumcenter(*args, **kwargs): return aux_get_cmd("circumcenter", args, 3,3)
+def Incircle(*args, **kwargs): return aux_get_cmd("incircle", args)
+def Incenter(*args, **kwargs): return aux_get_cmd("incenter", args)
+def Foot(*args, **kwargs): return aux_get_cmd("foot", args)
+def Orthocenter(*args, **kwargs): return aux_get_cmd("orthocenter", args)
+def Centroid(*args, **kwargs): return aux_get_cmd("centroid", args)
+def Circumcenter(*args, **kwargs): return aux_get_cmd("circumcenter", args)
 Incircle.ggb_return_type = "conic"
+Incircle.ggb_arity = (3, 3)
 Incenter.ggb_return_type = "point"
+Incenter.ggb_arity = (3, 3)
 Foot.ggb_return_type = "point"
+Foot.ggb_arity = (3, 3)
 Orthocenter.ggb_return_type = "point"
+Orthocenter.ggb_arity = (3, 3)
 Centroid.ggb_return_type = "point"
+Centroid.ggb_arity = (3, 3)
 Circumcenter.ggb_return_type = "point"
+Circumcenter.ggb_arity = (3, 3)
@@ -0,0 +1,406 @@
+"""converter.py
+Runs the whole conversion of one .ggb file: open the archive, read the configuration file,
+compile the construction and draw the diagram.
+convert() is the library entry point; the command line and the batch mode use convertSource()."""
+
+import os
+import glob
+import hashlib
+import zipfile
+import ConfigParser
+import string
+from StringIO import StringIO
+
+from xml.etree.ElementTree import iterparse, ParseError as XMLParseError
+from constants import GEOGEBRA_XML_LOCATION, DEFAULT_OPTIONS
+from diagram import AsyDiagram, doCompileDiagramObjects, drawDiagram
+from optimize import bakeNumeric, cullToView, pruneDiagram, intersectionValues, fitLines, shareIntersections, hoistCommonSubexpressions
+from labels import placeLabels
+from preview import drawPreview
+from registry import pluginRegistry
+from errors import DragonError, GGBFormatError, ConfigError
+from cache import DiskCache, defaultCacheDirectory, hashKey
+from manifest import checkedOption
+import profiler
+
+ZIP_MAGIC = "PK\x03\x04"
+UTF8_BOM = "\xef\xbb\xbf"
+XML_SNIFF_SIZE = 256 #Bytes read from a file to tell bare XML from anything else
+XML_CHUNK_SIZE = 2**16 #Bytes of geogebra.xml hashed at a time for the cache key
+CONVERSION_CACHE_SIZE = 256 #Megabytes
+
+#Backends, by the names BACKEND takes.  Each is called like diagram.drawDiagram,
+#backend(diagram, label_locations, opts = opts, view = view, out = out), and must not change diagram.
+BACKENDS = {"asy" : drawDiagram, "svg" : drawPreview}
+
+#Options which may differ between variants drawn from the same compiled diagram
+VARIANT_OPTIONS = ['BACKEND', 'CONCISE_MODE', 'CSE_MODE', 'CSE_COLORS', 'IMG_SIZE', 'FONT_SIZE',
+		'LABEL_SCALE_FACTOR', 'LINE_SCALE_FACTOR']
+
+
+def resolveFilename(filename):
+	"""Fill in the .ggb extension if it was omitted."""
+	if not "." in filename:
+		#Extension isn't given, let's assume it was omitted
+		filename += ".ggb"
+	elif filename[-1] == ".":
+		#Last character is ".", add in "ggb"
+		filename += "ggb"
+	return filename
+
+def readConfig(config_filename, opts):
+	"""Read a .cfg file, if it exists.
+	Values in [var] override the entries of opts (in place); they are checked as those of a manifest are
+	(see manifest.checkedOption).  The return value is the dictionary of label locations from [label]."""
+	label_dict = {}
+	if os.path.isfile(config_filename):
+		config = ConfigParser.RawConfigParser()
+		config.optionxform = str # makes names case-sensitive
+		try:
+			config.read(config_filename)
+		except ConfigParser.Error, e:
+			raise ConfigError, "Malformed configuration file %s: %s" %(config_filename, e)
+		var_cfg = config.items("var") if config.has_section("var") else {}
+		for key, val in var_cfg:
+			if string.upper(key) == 'PLUGINS':
+				raise ConfigError, "%s: plugins can only be loaded with --plugin" %config_filename
+			name, value = checkedOption(key, val, "%s, [var]" %config_filename)
+			opts[name] = value
+		label_cfg = config.items("label") if config.has_section("label") else {}
+		for key, val in label_cfg:
+			label_dict[key] = "lsf * " + val
+	return label_dict
+
+def registerBackend(name, backend):
+	"""Make backend (see BACKENDS) available as BACKEND = name"""
+	BACKENDS[name] = backend
+
+def getView(euclidian_view):
+	"""Retrieve the viewport (xmin, xmax, ymin, ymax) from the <euclidianView> element of the file."""
+	#Retrieve the provided values of the viewport
+	window_width =	float(euclidian_view.find("size").attrib["width"])
+	window_height =	float(euclidian_view.find("size").attrib["height"])
+	xzero = 	float(euclidian_view.find("coordSystem").attrib["xZero"])
+	yzero = 	float(euclidian_view.find("coordSystem").attrib["yZero"])
+	xscale = 	float(euclidian_view.find("coordSystem").attrib["scale"])
+	yscale = 	float(euclidian_view.find("coordSystem").attrib["yscale"])
+
+	#Compute the viewport coordinates from this information
+	xmin = -xzero/float(xscale)
+	xmax = (window_width - xzero)/float(xscale)
+	ymin = -(window_height -yzero)/float(yscale)
+	ymax = yzero/float(yscale)
+	return (xmin, xmax, ymin, ymax)
+
+def iterConstruction(xmlFile, header):
+	"""Stream the children of <construction> (commands, expressions, elements) out of xmlFile.
+	Each child is yielded as soon as it is closed and cleared once the caller is done with it,
+	so memory stays flat however large the construction is.
+	The viewport from <euclidianView>, which precedes the construction, is stored in header["view"]."""
+	depth = 0
+	root = None
+	construction = None
+	for event, elem in iterparse(xmlFile, events = ("start", "end")):
+		if event == "start":
+			depth += 1
+			if depth == 1:
+				root = elem
+			elif depth == 2 and elem.tag == "construction":
+				construction = elem
+			continue
+		if depth == 3 and construction is not None:
+			yield elem
+			elem.clear()
+			construction.remove(elem)
+		elif depth == 2:
+			if elem.tag == "euclidianView":
+				header["view"] = getView(elem)
+			elif elem.tag == "construction":
+				construction = None
+			# Nothing else at the top level is needed once it has been read
+			root.remove(elem)
+		depth -= 1
+
+def isDocument(data):
+	"""Whether the byte string data is a .ggb archive or a bare geogebra.xml, rather than a filename"""
+	if data[:4] == ZIP_MAGIC:
+		return True
+	if isinstance(data, str) and data[:3] == UTF8_BOM:
+		data = data[3:]
+	return data.lstrip()[:1] == "<"
+
+def openGeoGebraXML(source):
+	"""Open geogebra.xml inside source, which is the name of a .ggb file, the contents of one as
+	a byte string, or a file object open on one.  Instead of a .ggb archive, each of these may
+	also be a bare geogebra.xml; the first bytes tell which.
+	Return value: file object for the XML."""
+	data = None
+	if isinstance(source, bytearray) or (isinstance(source, str) and isDocument(source)):
+		data = str(source)
+	elif hasattr(source, "read"):
+		data = source.read()
+	else:
+		f = open(source, "rb")
+		start = f.read(XML_SNIFF_SIZE)
+		if start[:4] != ZIP_MAGIC and isDocument(start):
+			f.seek(0)
+			return f
+		f.close()
+	if data is not None:
+		if data[:4] != ZIP_MAGIC:
+			if isDocument(data):
+				return StringIO(data)
+			raise GGBFormatError, "Not a GeoGebra file: (data)"
+		source = StringIO(data) # zipfile needs to seek
+	try:
+		return zipfile.ZipFile(source).open(GEOGEBRA_XML_LOCATION)
+	except zipfile.BadZipfile:
+		raise GGBFormatError, "Not a GeoGebra file: %s" %(source if isinstance(source, basestring) else "(data)")
+	except KeyError:
+		raise GGBFormatError, "No %s in the GeoGebra file" %GEOGEBRA_XML_LOCATION
+
+_code_version = []
+def codeVersion():
+	"""A hash of Dragon's own source code, so that cached conversions die with the code that made them"""
+	if not _code_version:
+		sources = []
+		for filename in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+			f = open(filename, "rb")
+			sources.append(f.read())
+			f.close()
+		_code_version.append(hashKey(*sources))
+	return _code_version[0]
+
+def xmlDigest(source):
+	"""A hash of geogebra.xml in source (as returned by sourceSettings), read a chunk at a time
+	so that the document is never held in memory whole"""
+	h = hashlib.sha256()
+	xmlFile = openXML(source)
+	try:
+		for chunk in iter(lambda: xmlFile.read(XML_CHUNK_SIZE), ""):
+			h.update(chunk)
+	finally:
+		xmlFile.close()
+	return h.hexdigest()
+
+def conversionKey(xml_digest, label_dict, opts):
+	"""The conversion cache key: the construction (by its xmlDigest), the label locations and the options,
+	after the .cfg file, and the plugins with the hashes of their sources"""
+	return hashKey(codeVersion(), xml_digest, repr(sorted(label_dict.items())),
+			repr([(key, opts.get(key)) for key in sorted(DEFAULT_OPTIONS)]), repr(pluginRegistry(opts.get('PLUGINS', "")).key))
+
+def conversionCache(opts):
+	"""The DiskCache for converted diagrams which opts asks for (CACHE_MODE, CACHE_DIR, CACHE_SIZE), or None"""
+	if not opts.get('CACHE_MODE'):
+		return None
+	return DiskCache(opts.get('CACHE_DIR') or os.path.join(defaultCacheDirectory(), "asy"),
+			opts.get('CACHE_SIZE', CONVERSION_CACHE_SIZE) * 2**20)
+
+def sourceSettings(source, opts, manifest = None):
+	"""Read the settings for source: those of manifest (a manifest.Manifest), then the .cfg file,
+	which is given by CONFIG_FILENAME or else looked for next to source if it is a filename.
+	Return value: (source, label locations, opts updated by the settings as a new dictionary).
+	The source returned can be opened with openXML any number of times: a filename is resolved,
+	and a file object, which can only be read once, is read into memory (as openGeoGebraXML would)."""
+	opts = dict(opts)
+	label_dict = {}
+	if isinstance(source, basestring) and not isDocument(source):
+		source = resolveFilename(source)
+		if manifest is not None:
+			default_config_filename = manifest.configFilename(source)
+		else:
+			default_config_filename = os.path.splitext(source)[0] + '.cfg'
+		filename = source
+	else:
+		default_config_filename = ""
+		filename = None
+		if hasattr(source, "read"):
+			source = StringIO(source.read())
+	if manifest is not None:
+		manifest_opts, label_dict = manifest.settingsFor(filename)
+		opts.update(manifest_opts)
+	#Read configuration file; it has the last word
+	config_filename = opts.get('CONFIG_FILENAME', "")
+	if config_filename.strip() == "":
+		config_filename = default_config_filename
+	label_dict.update(readConfig(config_filename, opts))
+	return source, label_dict, opts
+
+def openXML(source):
+	"""openGeoGebraXML for a source returned by sourceSettings, from its start"""
+	with profiler.stage("zip_open"):
+		if hasattr(source, "seek"):
+			source.seek(0)
+		return openGeoGebraXML(source)
+
+def convertSource(source, opts, out = None, report = None, cache = None, manifest = None, compiled_nodes = None):
+	"""Convert source (see openGeoGebraXML) with the complete option dictionary opts,
+	writing the Asymptote code to the file-like out.
+	If out is not given, the code is returned as a string instead.
+	opts is not modified; values from the .cfg file apply to this diagram only.
+	If report (a dictionary) is given, the optimisation passes put their statistics in it.
+	If cache (a cache.DiskCache) is given, the code is looked up there by conversionKey first,
+	so an unchanged diagram costs one read of geogebra.xml and one hash.  On a miss, geogebra.xml is
+	read a second time, to compile it; neither read holds the whole document in memory.
+	manifest (a manifest.Manifest) supplies settings for the diagram, below those of its .cfg file.
+	compiled_nodes (a diagram.CompiledNodes) keeps what each node of the construction compiled to,
+	for the next conversion of the same diagram."""
+	source, label_dict, opts = sourceSettings(source, opts, manifest)
+	if cache is None:
+		return compileAndDraw(openXML(source), label_dict, opts, out, report, compiled_nodes)
+	with profiler.stage("cache"):
+		key = conversionKey(xmlDigest(source), label_dict, opts)
+		code = cache.read(key, ".asy")
+	if report is not None:
+		report["cache"] = {"hits" : int(code is not None)}
+	if code is None:
+		code = compileAndDraw(openXML(source), label_dict, opts, None, report, compiled_nodes)
+		with profiler.stage("cache"):
+			cache.store(key, ".asy", code)
+	if out is None:
+		return code
+	out.write(code)
+
+def parseVariant(spec):
+	"""A variant as given on the command line, PATH:KEY=VALUE,... e.g. out-cse.asy:CSE_MODE=1,IMG_SIZE=8cm
+	Return value: (path, overrides), with the values converted to the types of DEFAULT_OPTIONS."""
+	path, sep, settings = spec.rpartition(":")
+	if not sep or (settings and "=" not in settings):
+		path, settings = spec, ""
+	if not path:
+		raise DragonError, "No output file in the variant %s" %spec
+	overrides = {}
+	for setting in settings.split(","):
+		if not setting.strip():
+			continue
+		key, sep, val = setting.partition("=")
+		key = key.strip().upper()
+		if key not in VARIANT_OPTIONS:
+			raise DragonError, "%s cannot be set per variant; these can: %s" %(key, ", ".join(VARIANT_OPTIONS))
+		try:
+			overrides[key] = type(DEFAULT_OPTIONS[key])(val.strip())
+		except ValueError:
+			raise DragonError, "Bad value %s for %s" %(val, key)
+	return path, overrides
+
+def convertVariants(source, opts, variants, report = None, cache = None, manifest = None):
+	"""Convert source once and write it out several ways.  variants is a list of (out, overrides):
+	each is drawn with opts updated by the dictionary overrides, whose keys are among VARIANT_OPTIONS,
+	and written to the file-like out.  The construction is compiled a single time, and not at all
+	if cache has every variant already.  The other arguments are as for convertSource."""
+	source, label_dict, opts = sourceSettings(source, opts, manifest)
+	for out, overrides in variants:
+		unknown = [key for key in overrides if key not in VARIANT_OPTIONS]
+		if unknown:
+			raise DragonError, "Options %s cannot differ between variants" %", ".join(sorted(unknown))
+	xml_digest = None
+	if cache is not None:
+		with profiler.stage("cache"):
+			xml_digest = xmlDigest(source)
+	pending = []
+	hits = 0
+	for out, overrides in variants:
+		variant_opts = dict(opts)
+		variant_opts.update(overrides)
+		key = None
+		if cache is not None:
+			with profiler.stage("cache"):
+				key = conversionKey(xml_digest, label_dict, variant_opts)
+				code = cache.read(key, ".asy")
+			if code is not None:
+				hits += 1
+				out.write(code)
+				continue
+		pending.append((out, variant_opts, key))
+	if report is not None and cache is not None:
+		report["cache"] = {"hits" : hits}
+	if not pending:
+		return
+	diagram, view = compileDiagram(openXML(source), opts, report)
+	for out, variant_opts, key in pending:
+		code = drawVariant(diagram, view, label_dict, variant_opts, None, report)
+		if key is not None:
+			with profiler.stage("cache"):
+				cache.store(key, ".asy", code)
+		out.write(code)
+
+def compileDiagram(xmlFile, opts, report = None, compiled_nodes = None):
+	"""Compile the construction in xmlFile and run the optimisation passes opts asks for.
+	opts['PLUGINS'], which only the command line sets, names plugin modules for this conversion alone.
+	With compiled_nodes (a diagram.CompiledNodes), the nodes unchanged since its last compile are reused.
+	Return value: (AsyDiagram, viewport or None)"""
+	#Do the construction, straight from the stream
+	header = {}
+	registry = pluginRegistry(opts.get('PLUGINS', ""))
+	theMainDiagram = AsyDiagram()
+	try:
+		with profiler.stage("compile"):
+			doCompileDiagramObjects(profiler.timed(iterConstruction(xmlFile, header), "xml_parse"), theMainDiagram, registry, compiled_nodes)
+	except XMLParseError, e:
+		raise GGBFormatError, "Malformed %s: %s" %(GEOGEBRA_XML_LOCATION, e)
+	view = header.get("view")
+	fit_lines = opts['CLIP_IMG'] and view is not None and opts.get('FIT_LINES')
+
+	if opts.get('NUMERIC_MODE'):
+		with profiler.stage("bake"):
+			bakeNumeric(theMainDiagram, opts['NUMERIC_MODE'], report)
+	if fit_lines:
+		with profiler.stage("fitlines"):
+			intersections = intersectionValues(theMainDiagram) # Before culling and pruning drop any
+	if opts['CLIP_IMG'] and view is not None and opts.get('CULL_MODE'):
+		with profiler.stage("cull"):
+			cullToView(theMainDiagram, view, report)
+	if opts.get('PRUNE_MODE') or opts.get('ONLY_LABELS'):
+		only = [label.strip() for label in opts.get('ONLY_LABELS', "").split(",") if label.strip()]
+		with profiler.stage("prune"):
+			pruneDiagram(theMainDiagram, only, report)
+	if fit_lines:
+		with profiler.stage("fitlines"):
+			fitLines(theMainDiagram, view, report, intersections)
+	if opts.get('SHARE_INTERSECTIONS'):
+		with profiler.stage("intersections"):
+			shareIntersections(theMainDiagram, report)
+	if opts.get('HOIST_MODE'):
+		with profiler.stage("hoist"):
+			hoistCommonSubexpressions(theMainDiagram, opts['HOIST_MIN_SIZE'], opts['HOIST_BUDGET'], report)
+	if profiler.active is not None:
+		profiler.active.diagram(theMainDiagram)
+	return theMainDiagram, view
+
+def drawVariant(diagram, view, label_dict, opts, out = None, report = None):
+	"""Draw a compiled diagram with the backend opts names.  Nothing here changes diagram,
+	so one diagram can be drawn with any number of option sets."""
+	if opts.get('AUTO_LABELS'):
+		with profiler.stage("labels"):
+			placed = placeLabels(diagram, opts, view if opts['CLIP_IMG'] else None, report)
+		placed.update(label_dict) # The .cfg file has the last word
+		label_dict = placed
+	backend = opts.get('BACKEND', "asy")
+	if backend not in BACKENDS:
+		raise DragonError, "Unknown backend %s; known are %s" %(backend, ", ".join(sorted(BACKENDS)))
+
+	with profiler.stage("draw"):
+		if opts['CLIP_IMG'] == 0:
+			return BACKENDS[backend](diagram, label_dict, opts=opts, out=out)
+		else:
+			return BACKENDS[backend](diagram, label_dict, view=view, opts=opts, out=out)
+
+def compileAndDraw(xmlFile, label_dict, opts, out = None, report = None, compiled_nodes = None):
+	"""The uncached part of convertSource, from the XML on"""
+	diagram, view = compileDiagram(xmlFile, opts, report, compiled_nodes)
+	return drawVariant(diagram, view, label_dict, opts, out, report)
+
+def convert(source, out = None, **options):
+	"""Convert a GeoGebra diagram to Asymptote.
+	source is the name of a .ggb file, the contents of one as a byte string, or a file object open on one.
+	options are the ones of the command line, by their names in constants.DEFAULT_OPTIONS,
+	e.g. convert("Iran.ggb", CONCISE_MODE = 1, IMG_SIZE = "8cm").
+	The code is written to out if given, and returned as a string otherwise.
+	Raises a DragonError if the diagram cannot be converted.
+	Nothing is shared between calls, so it is safe to convert from several threads at once."""
+	unknown = [key for key in options if key not in DEFAULT_OPTIONS]
+	if unknown:
+		raise TypeError, "Unknown options: %s" %", ".join(sorted(unknown))
+	opts = dict(DEFAULT_OPTIONS)
+	opts.update(options)
+	return convertSource(source, opts, out)
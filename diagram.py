@@ -1,6 +1,12 @@
+from StringIO import StringIO
+from collections import OrderedDict
+
 import ggb_parser
+from registry import commands
+from emitter import AsyEmitter, clean_string
 from constants import DICT_ASY_TYPES, LINE_STYLE, LINE_WT, STRING_TYPE, DEPEND_THRESHOLD
-from constants import SHORT_NAME, VERSION_NUMBER, CSE_CONCISE_TRANSLATE
+from constants import SHORT_NAME, VERSION_NUMBER
+from errors import GGBFormatError, ParseError, UnsupportedError
 
 
 class GGBObject():
@@ -18,7 +24,11 @@ class GGBObject():
 		asy_obj_type: the object type that should be declared; e.g. "pair", "path", etc.
 		needs_label: whether the object should be labelled in the actual diagram.
 		needs_pen: 1 if any of the attributes {color, thick, style} are not the default values, and 0 otherwise.
+		value: the numbers GeoGebra computed for the object, if any (see elementValue).
+	Once the object is in an AsyDiagram, changing one of INDEXED_ATTRIBUTES updates the diagram's buckets.
 	"""
+	INDEXED_ATTRIBUTES = frozenset(["visible", "depend", "needs_label", "asy_obj_type"])
+
 	def __init__(self, **kwargs):
 		for key in kwargs.keys():
 			setattr(self, key, kwargs[key])
@@ -26,6 +36,11 @@ class GGBObject():
 	def __repr__(self):
 		return "%s = %s" %(self.label, self.constructor)
 
+	def __setattr__(self, name, value):
+		self.__dict__[name] = value
+		if name in self.INDEXED_ATTRIBUTES and self._owner is not None:
+			self._owner._reindex(self)
+
 	#Attributes, and their default values
 	visible = 1
 	depend = 0
@@ -39,238 +54,532 @@ class GGBObject():
 
 	needs_pen = 0
 	needs_label = 0
+	value = None
+
+	_owner = None #The AsyDiagram containing this object
+	_key = None #Its label in there
+	_seq = (0, 0) #Its position in construction order
+
+
+class ObjectBucket():
+	"""A set of labels of an AsyDiagram, which iterates in construction order.
+	Adding and removing are O(1); iterating over k labels is O(k log k)."""
+	def __init__(self):
+		self._members = {} #label : sequence number
+
+	def add(self, obj):
+		self._members[obj._key] = obj._seq
+
+	def discard(self, obj):
+		self._members.pop(obj._key, None)
+
+	def __contains__(self, label):
+		return label in self._members
+
+	def __len__(self):
+		return len(self._members)
+
+	def __iter__(self):
+		return iter(sorted(self._members, key = self._members.__getitem__))
 
 
 class AsyDiagram():
 	"""AsyDiagram Class
 	This is basically just a container for GGBObjects in
-	the diagram currently being created"""
-
-	objectList = [] #List of labels to mantain construction order.
-	toLabelList = [] #List of labels of objects which require labelling on the actual output.
-	objectDict = {} #Label : GGBObject instance dictionary for all objects in diagram.
-
-	text_dict = {} #List of text objects
+	the diagram currently being created.
+	Objects are kept in construction order and can be removed in O(1).
+	The diagram also keeps buckets of labels, updated whenever an object changes,
+	so that drawing needs one pass over each bucket rather than over every object:
+		declared: objects which are referenced or labelled, and hence need to be declared.
+		visible[asy_obj_type]: objects to be drawn, by Asymptote type.
+		labelled: objects which need a label.
+		text_dict: the text elements, which are not objects.
+	dependencies maps each label to the labels its constructor refers to, one entry per reference.
+	All state belongs to the instance, so separate diagrams never see each other's objects."""
+
+	def __init__(self):
+		self.objectDict = OrderedDict() #Label : GGBObject instance dictionary for all objects in diagram, in construction order.
+		self.declared = ObjectBucket()
+		self.visible = {} #asy_obj_type : ObjectBucket
+		self.labelled = ObjectBucket()
+		self.text_dict = OrderedDict() #Text objects
+		self.dependencies = {} #Label : labels referenced by its constructor
+		self.warnings = [] #Complaints about the input, written as comments at the top of the output
+		self._seq = 0
+		self._inserted = 0
+
+	@property
+	def objectList(self):
+		"""Labels of all objects, in construction order"""
+		return sorted(self.objectDict, key = lambda label: self.objectDict[label]._seq)
+
+	def warn(self, message):
+		if message not in self.warnings:
+			self.warnings.append(message)
 
 	def has_key(self, key):
 		return self.objectDict.has_key(key)
 
+	def __len__(self):
+		return len(self.objectDict)
+
 	def __getitem__(self, label):
 		return self.objectDict[label]
 
 	def __setitem__(self, label, obj):
+		if label in self.objectDict:
+			self.remove(label)
+		self._seq += 1
+		self._add(label, obj, (self._seq, 0))
+
+	def insertBefore(self, before_label, label, obj):
+		"""Add obj so that it comes right before before_label in construction order,
+		and before anything inserted there earlier (which may refer to it)."""
+		self._inserted -= 1
+		self._add(label, obj, (self[before_label]._seq[0], self._inserted))
+
+	def _add(self, label, obj, seq):
+		if label in self.objectDict:
+			self.remove(label)
+		obj.__dict__.update(_owner = self, _key = label, _seq = seq)
 		self.objectDict[label] = obj
-		self.objectList.append(label)
-
-
-def doCompileDiagramObjects(tree, diagram):
-	for xml_geo_obj in list(tree):
-		#Cases:commands,expressions,elements
-		if xml_geo_obj.tag == "command":
-			#Decompress args
-			cmd_name = xml_geo_obj.attrib["name"]
-			cmd_input_obj = xml_geo_obj.find("input")
-			cmd_output_obj = xml_geo_obj.find("output")
-			num_output = len(cmd_output_obj.keys())
-			num_args = len(cmd_input_obj.keys())
-			args = [ cmd_input_obj.attrib['a%d' %i] for i in range(0, num_args) ]
-
-			if cmd_name == 'Point':
-				#Bail out
-				continue
-
-			#Convert to geogebra
-			ggb_command = "%s[%s]" %(cmd_name, ','.join(args))
-			#Parse it!
-			constructor, deps = ggb_parser.parse_string(ggb_command, num_expected=num_output, ref_dict = diagram.objectDict)
-
-			if type(constructor) == STRING_TYPE:
-				constructor_array = [constructor]
-			else:
-				constructor_array = list(constructor)
-				#Polygons... -___-
-
-			#Get output
-			try:
-				for i in range(0, num_output):
-					label = cmd_output_obj.attrib['a%d' %i]
-					diagram[label] = GGBObject(constructor = constructor_array[i], label=label)
-			except IndexError:
-				#Whine and exit
-				print ggb_command
-				print cmd_output_obj
-				exit()
-			
-			# Add dependencies
-			for label in deps:
-				if diagram.has_key(label):
-					diagram[label].depend += 1
-				else:
-					print "/* WARNING: No object has label %s */" %label
-
-		elif xml_geo_obj.tag == "expression":
-			#Dependencies may or may not be screwed over now.
-			label = xml_geo_obj.attrib["label"]
-			exp = xml_geo_obj.attrib["exp"]
-			if xml_geo_obj.attrib.get("type", "") == "point":
-				if exp[0] == "(" and exp[-1] == ")":
-					x_exp, y_exp = exp[1:-1].split(",") # so (b+c,0) -> b+c and 0
-					x_parse, x_deps = ggb_parser.parse_string(x_exp, num_expected=1, ref_dict = diagram.objectDict)
-					y_parse, y_deps = ggb_parser.parse_string(y_exp, num_expected=1, ref_dict = diagram.objectDict)
-					diagram[label] = GGBObject(label = label, asy_obj_type = "pair", constructor = "(%s, %s)" %(x_parse,y_parse) )
-					deps = x_deps + y_deps
-				else:
-					out, deps = ggb_parser.parse_string(exp, num_expected=1, ref_dict = diagram.objectDict)
-					diagram[label] = GGBObject(label = label, asy_obj_type = "pair", constructor = out)
-			else:
-				#print "/* Expression %s = %s */" %(label, exp)
-				if exp[0] == exp[-1] == "\"":
-					# This is text.
-					parsedExp = exp
-				else:
-					parsedExp, deps = ggb_parser.parse_string(exp, num_expected=1, ref_dict = diagram.objectDict)
-				diagram[label] = GGBObject(constructor = parsedExp, label=label)
-				diagram[label].depend += 1 #Explicitly defined reals are almost always dependencies; good to be safe here
-			# Add dependencies for expressions too!
-			for label in deps:
-				if diagram.has_key(label):
-					diagram[label].depend += 1
-				else:
-					print "/* WARNING: No object has label %s */" %label
-
-		elif xml_geo_obj.tag == "element":
-			ggb_type = xml_geo_obj.attrib['type']	
-			label = xml_geo_obj.attrib["label"]
-			if DICT_ASY_TYPES.has_key(ggb_type):
-				asy_type = DICT_ASY_TYPES[ggb_type]
-			elif ggb_type == "polygon":
-				diagram[xml_geo_obj.attrib["label"]].visible = 0
-				#Polygons are silly.  SKIP.
-				continue
-			elif ggb_type == "text": #OH please no...
-				#Get the attributes we need
-				text_label = label
-				text_content = diagram.objectDict[label].constructor
-				xml_startpoint_obj = xml_geo_obj.find("startPoint")
-				x_coord = xml_startpoint_obj.attrib['x']
-				y_coord = xml_startpoint_obj.attrib['y']
-
-				#Add this to a dict just for texts, assuming visible
-				if xml_geo_obj.find("show").attrib["object"] == "true":
-					diagram.text_dict[text_label] = {"text" : text_content, "x" : x_coord, "y" : y_coord}
-
-				#Delete this from the diagram
-				del diagram.objectDict[label]
-				diagram.objectList.remove(label)
-				continue
+		self._reindex(obj)
+
+	def addDependencies(self, label, deps):
+		"""Record that label's constructor refers to deps, and count the references.
+		Labels which are not in the diagram are skipped."""
+		for dep in deps:
+			if self.has_key(dep):
+				self[dep].depend += 1
+				self.dependencies.setdefault(label, []).append(dep)
+
+	def dropDependencies(self, label):
+		"""Forget label's references, e.g. because it is removed"""
+		for dep in self.dependencies.pop(label, []):
+			if self.has_key(dep):
+				self[dep].depend -= 1
+
+	def remove(self, label):
+		"""Take the object out of the diagram and all buckets"""
+		self.dependencies.pop(label, None)
+		obj = self.objectDict.pop(label)
+		self.declared.discard(obj)
+		self.labelled.discard(obj)
+		for bucket in self.visible.values():
+			bucket.discard(obj)
+		obj.__dict__["_owner"] = None
+		return obj
+
+	def _reindex(self, obj):
+		"""Put obj in exactly the buckets it belongs to"""
+		if obj.depend >= DEPEND_THRESHOLD or obj.needs_label:
+			self.declared.add(obj)
+		else:
+			self.declared.discard(obj)
+		if obj.needs_label:
+			self.labelled.add(obj)
+		else:
+			self.labelled.discard(obj)
+		for asy_obj_type, bucket in self.visible.items():
+			if asy_obj_type != obj.asy_obj_type or not obj.visible or obj._key == "":
+				bucket.discard(obj)
+		if obj.visible and obj._key != "": #Unnamed outputs are never drawn
+			if obj.asy_obj_type not in self.visible:
+				self.visible[obj.asy_obj_type] = ObjectBucket()
+			self.visible[obj.asy_obj_type].add(obj)
+
+	def visibleOfType(self, asy_obj_type):
+		return self.visible.get(asy_obj_type, ())
+
+
+def elementValue(xml_geo_obj, ggb_type):
+	"""The numbers GeoGebra stored for an element, or None if there are none (or they are undefined):
+		point: (x, y)
+		line, segment, ray, ...: (a, b, c) of the equation ax + by + c = 0
+		conic: (A0, ..., A5) of A0 x^2 + A1 y^2 + A2 + 2 A3 xy + 2 A4 x + 2 A5 y = 0
+		numeric, angle: (value,)"""
+	try:
+		if ggb_type == "point":
+			coords = xml_geo_obj.find("coords").attrib
+			z = float(coords["z"])
+			value = (float(coords["x"]) / z, float(coords["y"]) / z)
+		elif xml_geo_obj.find("matrix") is not None:
+			matrix = xml_geo_obj.find("matrix").attrib
+			value = tuple(float(matrix["A%d" %i]) for i in range(6))
+		elif xml_geo_obj.find("coords") is not None:
+			coords = xml_geo_obj.find("coords").attrib
+			value = (float(coords["x"]), float(coords["y"]), float(coords["z"]))
+		elif xml_geo_obj.find("value") is not None:
+			value = (float(xml_geo_obj.find("value").attrib["val"]),)
+		else:
+			return None
+	except (KeyError, ValueError, ZeroDivisionError):
+		return None
+	if any(v != v or v in (float("inf"), float("-inf")) for v in value): # NaN for undefined objects
+		return None
+	return value
+
+def warnMissing(diagram, deps):
+	for label in deps:
+		if not diagram.has_key(label):
+			diagram.warn("No object has label %s" %label)
+
+def doCompileDiagramObjects(tree, diagram, registry = commands, compiled_nodes = None):
+	"""Compile every command, expression and element of a construction into diagram,
+	with the GeoGebra commands of registry (see registry.pluginRegistry).
+	tree may be the <construction> element itself or any iterable of its children,
+	e.g. the stream from converter.iterConstruction.
+	With compiled_nodes (a CompiledNodes), nodes compiled by an earlier call are reused."""
+	if compiled_nodes is not None:
+		return compiled_nodes.compile(tree, diagram, registry)
+	for xml_geo_obj in tree:
+		compileNode(xml_geo_obj, diagram, registry)
+
+def compileNode(xml_geo_obj, diagram, registry = commands):
+	"""Compile one command, expression or element into diagram.
+	Return value: the labels its expression refers to, which may not all be in diagram."""
+	#Cases:commands,expressions,elements
+	if xml_geo_obj.tag == "command":
+		#Decompress args
+		cmd_name = xml_geo_obj.attrib["name"]
+		cmd_input_obj = xml_geo_obj.find("input")
+		cmd_output_obj = xml_geo_obj.find("output")
+		num_output = len(cmd_output_obj.keys())
+		num_args = len(cmd_input_obj.keys())
+		args = [ cmd_input_obj.attrib['a%d' %i] for i in range(0, num_args) ]
+
+		if cmd_name == 'Point':
+			#Bail out
+			return []
+
+		#Convert to geogebra
+		ggb_command = "%s[%s]" %(cmd_name, ','.join(args))
+		#Parse it!
+		constructor, deps = ggb_parser.parse_string(ggb_command, num_expected=num_output, ref_dict = diagram.objectDict, registry = registry)
+
+		if type(constructor) == STRING_TYPE:
+			constructor_array = [constructor]
+		else:
+			constructor_array = list(constructor)
+			#Polygons... -___-
+
+		#Get output
+		try:
+			for i in range(0, num_output):
+				label = cmd_output_obj.attrib['a%d' %i]
+				diagram[label] = GGBObject(constructor = constructor_array[i], label=label)
+		except IndexError:
+			raise ParseError, "%s gave %d results, but GeoGebra expects %d" %(ggb_command, len(constructor_array), num_output)
+		
+		# Add dependencies
+		warnMissing(diagram, deps)
+		for i in range(0, num_output):
+			diagram.addDependencies(cmd_output_obj.attrib['a%d' %i], deps)
+		return deps
+
+	elif xml_geo_obj.tag == "expression":
+		#Dependencies may or may not be screwed over now.
+		label = xml_geo_obj.attrib["label"]
+		exp = xml_geo_obj.attrib["exp"]
+		if xml_geo_obj.attrib.get("type", "") == "point":
+			if exp[0] == "(" and exp[-1] == ")":
+				x_exp, y_exp = exp[1:-1].split(",") # so (b+c,0) -> b+c and 0
+				x_parse, x_deps = ggb_parser.parse_string(x_exp, num_expected=1, ref_dict = diagram.objectDict, registry = registry)
+				y_parse, y_deps = ggb_parser.parse_string(y_exp, num_expected=1, ref_dict = diagram.objectDict, registry = registry)
+				diagram[label] = GGBObject(label = label, asy_obj_type = "pair", constructor = "(%s, %s)" %(x_parse,y_parse) )
+				deps = x_deps + y_deps
 			else:
-				print "/* WARNING: Dragon does not know how to handle type %s */" %ggb_type
-				continue
-				#Cross fingers here!
-
-			
-			if diagram.has_key(label):
-				#OK, so just slap on attributes, later.
-				diagram[label].asy_obj_type = asy_type
-				diagram[label].ggb_obj_type = ggb_type
-					
+				out, deps = ggb_parser.parse_string(exp, num_expected=1, ref_dict = diagram.objectDict, registry = registry)
+				diagram[label] = GGBObject(label = label, asy_obj_type = "pair", constructor = out)
+		else:
+			#print "/* Expression %s = %s */" %(label, exp)
+			if exp[0] == exp[-1] == "\"":
+				# This is text.
+				parsedExp = exp
+				deps = []
 			else:
-				#Oh, free object?
-				if ggb_type == "point":
-					x_coord = xml_geo_obj.find('coords').attrib['x']
-					y_coord = xml_geo_obj.find('coords').attrib['y']
-					diagram[label] = GGBObject(label = label, asy_obj_type = asy_type, constructor = "(%s, %s)" %(x_coord,y_coord) )
-				elif ggb_type == "numeric":
-					val = xml_geo_obj.find('value').attrib['val']
-					diagram[label] = GGBObject(label = label, visible = 0, asy_obj_type = asy_type, constructor = val)
-					diagram[label].depend += 1
-				else:
-					print "PANIC: Dragon cannot handle free object of type %s" %ggb_type
-					print "Dying..."
-					exit()
-
-			#OK, attributes now...
-			if xml_geo_obj.find("show") == None:
-				# No show... ignoring.
-				pass
+				parsedExp, deps = ggb_parser.parse_string(exp, num_expected=1, ref_dict = diagram.objectDict, registry = registry)
+			diagram[label] = GGBObject(constructor = parsedExp, label=label)
+			diagram[label].depend += 1 #Explicitly defined reals are almost always dependencies; good to be safe here
+		# Add dependencies for expressions too!
+		warnMissing(diagram, deps)
+		diagram.addDependencies(label, deps)
+		return deps
+
+	elif xml_geo_obj.tag == "element":
+		ggb_type = xml_geo_obj.attrib['type']	
+		label = xml_geo_obj.attrib["label"]
+		if DICT_ASY_TYPES.has_key(ggb_type):
+			asy_type = DICT_ASY_TYPES[ggb_type]
+		elif ggb_type == "polygon":
+			diagram[xml_geo_obj.attrib["label"]].visible = 0
+			#Polygons are silly.  SKIP.
+			return []
+		elif ggb_type == "text": #OH please no...
+			#Get the attributes we need
+			text_label = label
+			text_content = diagram.objectDict[label].constructor
+			xml_startpoint_obj = xml_geo_obj.find("startPoint")
+			x_coord = xml_startpoint_obj.attrib['x']
+			y_coord = xml_startpoint_obj.attrib['y']
+
+			#Add this to a dict just for texts, assuming visible
+			if xml_geo_obj.find("show").attrib["object"] == "true":
+				diagram.text_dict[text_label] = {"text" : text_content, "x" : x_coord, "y" : y_coord}
+
+			#Delete this from the diagram
+			diagram.remove(label)
+			return []
+		else:
+			diagram.warn("Dragon does not know how to handle type %s" %ggb_type)
+			return []
+			#Cross fingers here!
 
+		
+		if diagram.has_key(label):
+			#OK, so just slap on attributes, later.
+			diagram[label].asy_obj_type = asy_type
+			diagram[label].ggb_obj_type = ggb_type
+				
+		else:
+			#Oh, free object?
+			if ggb_type == "point":
+				x_coord = xml_geo_obj.find('coords').attrib['x']
+				y_coord = xml_geo_obj.find('coords').attrib['y']
+				diagram[label] = GGBObject(label = label, asy_obj_type = asy_type, constructor = "(%s, %s)" %(x_coord,y_coord) )
+			elif ggb_type == "numeric":
+				val = xml_geo_obj.find('value').attrib['val']
+				diagram[label] = GGBObject(label = label, visible = 0, asy_obj_type = asy_type, constructor = val)
+				diagram[label].depend += 1
 			else:
-				if xml_geo_obj.find("show").attrib["object"] == "true":
-					diagram[label].visible = 1
-					if asy_type == "path":
-						colorArray = []
-						for c in 'rgb':
-							colorArray.append(int(xml_geo_obj.find("objColor").attrib[c])/256.0)
-						thick = int(xml_geo_obj.find("lineStyle").attrib["thickness"])
-						style = int(xml_geo_obj.find("lineStyle").attrib["type"])
-
-						if sum(colorArray) > 0:
-							diagram[label].color = 'rgb(%.1f,%.1f,%.1f)' %tuple(colorArray)
-							diagram[label].needs_pen = 1
-						if thick != 2:
-							diagram[label].thick = 'linewidth(%s)' %LINE_WT[thick]
-							diagram[label].needs_pen = 1
-						if style != 0:
-							diagram[label].style = LINE_STYLE[style]
-							diagram[label].needs_pen = 1
-					#Paths are pretty configurable ._.
-				else:
-					diagram[label].visible = 0
-
-				# Determine which objects need labelling
-				if xml_geo_obj.find("show").attrib["label"] == "true" and diagram[label].visible == 1 and diagram[label].ggb_obj_type != "angle":
-					diagram.toLabelList.append(label)
-					diagram[label].needs_label = 1
-					diagram[label].depend += 1
-					diagram[label].label = label
+				raise UnsupportedError, "Dragon cannot handle free object %s of type %s" %(label, ggb_type)
+
+		diagram[label].value = elementValue(xml_geo_obj, ggb_type)
 
+		#OK, attributes now...
+		if xml_geo_obj.find("show") == None:
+			# No show... ignoring.
+			pass
 
 		else:
-			#cry
-			print "Karl is angry\nKarl does not recognize tag %s" %xml_geo_obj.tag
-			print xml_geo_obj.__dict__
-			exit()
+			if xml_geo_obj.find("show").attrib["object"] == "true":
+				diagram[label].visible = 1
+				if asy_type == "path":
+					colorArray = []
+					for c in 'rgb':
+						colorArray.append(int(xml_geo_obj.find("objColor").attrib[c])/256.0)
+					thick = int(xml_geo_obj.find("lineStyle").attrib["thickness"])
+					style = int(xml_geo_obj.find("lineStyle").attrib["type"])
+
+					if sum(colorArray) > 0:
+						diagram[label].color = 'rgb(%.1f,%.1f,%.1f)' %tuple(colorArray)
+						diagram[label].needs_pen = 1
+					if thick != 2:
+						diagram[label].thick = 'linewidth(%s)' %LINE_WT[thick]
+						diagram[label].needs_pen = 1
+					if style != 0:
+						diagram[label].style = LINE_STYLE[style]
+						diagram[label].needs_pen = 1
+				#Paths are pretty configurable ._.
+			else:
+				diagram[label].visible = 0
 
+			# Determine which objects need labelling
+			if xml_geo_obj.find("show").attrib["label"] == "true" and diagram[label].visible == 1 and diagram[label].ggb_obj_type != "angle":
+				diagram[label].needs_label = 1
+				diagram[label].depend += 1
+				diagram[label].label = label
 
-def clean_string(s):
-	return s.replace("'", "_prime")
-def restore_string(s):
-	return s.replace("_prime", r"\'")
 
-def drawDiagram(diagram, label_locations = {}, opts = {}, view = None):
+	else:
+		#cry
+		raise GGBFormatError, "Karl is angry\nKarl does not recognize tag %s" %xml_geo_obj.tag
+	return []
+
+def nodeLabels(xml_geo_obj):
+	"""The labels of the objects a command, expression or element makes or changes"""
+	if xml_geo_obj.tag == "command":
+		cmd_output_obj = xml_geo_obj.find("output")
+		return [cmd_output_obj.attrib['a%d' %i] for i in range(0, len(cmd_output_obj.keys()))]
+	return [xml_geo_obj.attrib["label"]]
+
+def nodeKey(xml_geo_obj):
+	"""The content of a node (tag, attributes, text and children) as a hashable value"""
+	return (xml_geo_obj.tag, tuple(sorted(xml_geo_obj.attrib.items())), (xml_geo_obj.text or "").strip(),
+			tuple(nodeKey(child) for child in xml_geo_obj))
+
+def objectState(obj):
+	"""The attributes of a GGBObject, without those of the diagram it is in"""
+	return dict((key, val) for key, val in obj.__dict__.items() if not key.startswith("_"))
+
+
+class NodeEffect():
+	"""What compiling one node did to a diagram, so that it can be done again without compiling:
+		labels: the labels of the objects the node makes or changes (see nodeLabels).
+		refs: the labels its expression refers to.
+		seen: what the node saw when it was compiled: the fingerprints (see CompiledNodes) of labels,
+			then the GeoGebra types of the objects of refs, which is all that parsing looks at.
+		changes: (what, label, data) in the order they happen; what is one of
+			"create" (data: the attributes of a new object), "update" (data: (changed attributes,
+			change in depend)), "remove", "depend_on" (data: labels added to its dependencies)
+			and "text" (data: its entry in text_dict).
+		warnings: the warnings the node gave."""
+	def __init__(self, labels, refs, seen):
+		self.labels = labels
+		self.refs = refs
+		self.seen = seen
+		self.changes = []
+		self.warnings = []
+
+	@classmethod
+	def record(cls, xml_geo_obj, diagram, registry, fingerprints):
+		"""Compile xml_geo_obj into diagram, noting what that changes"""
+		labels = nodeLabels(xml_geo_obj)
+		before = dict((label, diagram.objectDict.get(label)) for label in labels)
+		states = dict((label, (objectState(obj), obj.depend, len(diagram.dependencies.get(label, ()))))
+				for label, obj in before.items() if obj is not None)
+		texts = dict((label, diagram.text_dict.get(label)) for label in labels)
+		warnings, diagram.warnings = diagram.warnings, []
+		try:
+			refs = compileNode(xml_geo_obj, diagram, registry)
+		finally:
+			warnings, diagram.warnings = diagram.warnings, warnings
+		effect = cls(labels, tuple(refs), seenBy(labels, refs, diagram, fingerprints))
+		effect.warnings = warnings
+		for message in warnings:
+			diagram.warn(message)
+		for label in labels:
+			obj = diagram.objectDict.get(label)
+			if obj is None:
+				if before[label] is not None:
+					effect.changes.append(("remove", label, None))
+			elif obj is not before[label]:
+				effect.changes.append(("create", label, objectState(obj)))
+				if diagram.dependencies.get(label):
+					effect.changes.append(("depend_on", label, list(diagram.dependencies[label])))
+			else:
+				state, depend, number_of_deps = states[label]
+				changed = dict((key, val) for key, val in objectState(obj).items()
+						if key != "depend" and (key not in state or state[key] != val))
+				if changed or obj.depend != depend:
+					effect.changes.append(("update", label, (changed, obj.depend - depend)))
+				if len(diagram.dependencies.get(label, ())) > number_of_deps:
+					effect.changes.append(("depend_on", label, diagram.dependencies[label][number_of_deps:]))
+			text = diagram.text_dict.get(label)
+			if text is not None and text != texts[label]:
+				effect.changes.append(("text", label, dict(text)))
+		return effect
+
+	def replay(self, diagram):
+		for message in self.warnings:
+			diagram.warn(message)
+		for what, label, data in self.changes:
+			if what == "create":
+				diagram[label] = GGBObject(**data)
+			elif what == "update":
+				changed, depend = data
+				obj = diagram[label]
+				for key, val in changed.items():
+					setattr(obj, key, val)
+				if depend:
+					obj.depend += depend
+			elif what == "remove":
+				diagram.remove(label)
+			elif what == "depend_on":
+				diagram.addDependencies(label, data)
+			elif what == "text":
+				diagram.text_dict[label] = dict(data)
+
+
+def seenBy(labels, refs, diagram, fingerprints):
+	"""What a node which makes or changes labels and refers to refs depends on (see NodeEffect.seen)"""
+	return (tuple(fingerprints.get(label) for label in labels) +
+			tuple(diagram[ref].ggb_obj_type if diagram.has_key(ref) else None for ref in refs))
+
+
+class CompiledNodes():
+	"""Remembers what each command, expression and element of a construction compiled to, for
+	watch mode, so that compiling the construction again after an edit only compiles what changed.
+	Nodes are found again by their content (see nodeKey), and an unchanged node is replayed
+	(see NodeEffect) rather than parsed and compiled, as long as what it saw is unchanged too:
+	the objects it makes or changes must have been made and changed by the same nodes so far, which
+	each label's fingerprint tells, and the objects it refers to must still have the same types.
+	So moving a free point or recolouring an object compiles that one element again; changing
+	the type of an object also compiles the nodes which refer to it.
+	Entries for nodes which the latest compile did not see are dropped."""
+	def __init__(self):
+		self._entries = {} #nodeKey : NodeEffect
+		self._registry_key = None
+		self.compiled = 0
+		self.reused = 0
+
+	def compile(self, tree, diagram, registry = commands):
+		"""Like doCompileDiagramObjects"""
+		if registry.key != self._registry_key: # Other plugins, other results
+			self._entries = {}
+			self._registry_key = registry.key
+		used = {}
+		fingerprints = {} #label : fingerprint of its object so far
+		self.compiled = self.reused = 0
+		for xml_geo_obj in tree:
+			key = nodeKey(xml_geo_obj)
+			effect = self._entries.get(key)
+			if effect is not None and effect.seen == seenBy(effect.labels, effect.refs, diagram, fingerprints):
+				effect.replay(diagram)
+				self.reused += 1
+			else:
+				effect = NodeEffect.record(xml_geo_obj, diagram, registry, fingerprints)
+				self.compiled += 1
+			used[key] = effect
+			fingerprint = (key, effect.seen)
+			for label in effect.labels:
+				fingerprints[label] = fingerprint
+		self._entries = used
+
+
+def drawDiagram(diagram, label_locations = {}, opts = {}, view = None, out = None):
+	"""Write the Asymptote code for diagram to the file-like out, one statement at a time.
+	If out is not given, the code is returned as a string instead."""
+	if out is None:
+		out = StringIO()
+		drawDiagram(diagram, label_locations, opts, view, out)
+		return out.getvalue()
+
 	CONCISE_MODE = opts['CONCISE_MODE']
 	CSE_MODE = opts['CSE_MODE']
-	out_asy_code = ""
+	for asy_obj_type in diagram.visible:
+		if asy_obj_type not in ("pair", "path", "real") and len(diagram.visible[asy_obj_type]) > 0:
+			curr_obj = diagram[iter(diagram.visible[asy_obj_type]).next()]
+			raise UnsupportedError, "Type %s from object %s is not recognized" %(asy_obj_type, curr_obj)
+	emit = AsyEmitter(out, concise = CONCISE_MODE)
+	for warning in diagram.warnings:
+		emit.raw("/* WARNING: %s */\n" %warning)
 	if CONCISE_MODE == 0:
-		out_asy_code += "/* %s %s \nHomemade Script by v_Enhance. */\n\n" %(SHORT_NAME, VERSION_NUMBER)
-	out_asy_code += """import olympiad; import cse5; size(%(IMG_SIZE)s); real lsf=%(LABEL_SCALE_FACTOR).4f; real lisf=%(LINE_SCALE_FACTOR).1f; defaultpen(fontsize(%(FONT_SIZE)s));"""  %opts
+		emit.code("/* %s %s \nHomemade Script by v_Enhance. */\n\n" %(SHORT_NAME, VERSION_NUMBER))
+	header = """import olympiad; import cse5; size(%(IMG_SIZE)s); real lsf=%(LABEL_SCALE_FACTOR).4f; real lisf=%(LINE_SCALE_FACTOR).1f; defaultpen(fontsize(%(FONT_SIZE)s));"""  %opts
 	if CONCISE_MODE == 0:
-		out_asy_code = out_asy_code.replace("; ", "; \n") # Add newlines for readability
+		header = header.replace("; ", "; \n") # Add newlines for readability
+	emit.code(header)
 
 	if view is not None:
-		out_asy_code += " real xmin=%.2f; real xmax=%.2f; real ymin=%.2f; real ymax=%.2f;" %view
+		emit.code(" real xmin=%.2f; real xmax=%.2f; real ymin=%.2f; real ymax=%.2f;" %view)
 	if CSE_MODE == 1 and opts['CSE_COLORS'] == 0:
-		out_asy_code += " pathpen=black; pointpen=black;"
-	out_asy_code += "\n"
+		emit.code(" pathpen=black; pointpen=black;")
+	emit.code("\n")
 
 	if CONCISE_MODE == 0:
-		out_asy_code += "\n"
+		emit.code("\n")
 
 	#Declare pairs, paths, etc. which are dependencies
 	if CONCISE_MODE == 1:
 		#Assemble lists of all dependencies
 		concise_depend_declare_dict = {}
-		for label in diagram.objectList:
-			curr_obj = diagram[label]
-			if curr_obj.depend >= DEPEND_THRESHOLD: 
-				curr_asy_obj_type = curr_obj.asy_obj_type
-				concise_depend_declare_dict[curr_asy_obj_type] = concise_depend_declare_dict.get(curr_asy_obj_type, []) + [label]
-			else:
-				pass
+		for label in diagram.declared:
+			concise_depend_declare_dict.setdefault(diagram[label].asy_obj_type, []).append(label)
 		
 		for generic_asy_obj_type in concise_depend_declare_dict.keys():
-			out_asy_code += "%s %s; " %(generic_asy_obj_type, ', '.join(concise_depend_declare_dict[generic_asy_obj_type]))
-		out_asy_code += "\n"
+			emit.code("%s %s; " %(generic_asy_obj_type, ', '.join(concise_depend_declare_dict[generic_asy_obj_type])))
+		emit.code("\n")
 	else:
 		#We'll just shout them out as we go.
 		pass
@@ -278,21 +587,18 @@ def drawDiagram(diagram, label_locations = {}, opts = {}, view = None):
 	#Actually create objects!
 	#Not drawing: this is only those that need to have a reference
 	if CONCISE_MODE == 0:
-		out_asy_code += "/* Initialize Objects */\n"
+		emit.code("/* Initialize Objects */\n")
 
-	for label in diagram.objectList:
+	for label in diagram.declared:
 		curr_obj = diagram[label]
-		if curr_obj.depend >= DEPEND_THRESHOLD or curr_obj.needs_label:
-			if CONCISE_MODE == 0:
-				out_asy_code += "%s %s = %s;\n" %(curr_obj.asy_obj_type, label, curr_obj.constructor)
-			else:
-				out_asy_code += "%s = %s; " %(label, curr_obj.constructor)
+		if CONCISE_MODE == 0:
+			emit.code("%s %s = %s;\n" %(curr_obj.asy_obj_type, label, curr_obj.constructor))
 		else:
-			pass
+			emit.code("%s = %s; " %(label, curr_obj.constructor))
 	
-	out_asy_code += "\n"
+	emit.code("\n")
 	if CONCISE_MODE == 0:
-		out_asy_code += "/* Draw objects */\n"
+		emit.code("/* Draw objects */\n")
 
 	#DRAW EVERYTHING
 	#First, decide how to dot points and draw paths
@@ -305,47 +611,27 @@ def drawDiagram(diagram, label_locations = {}, opts = {}, view = None):
 	else:
 		dotCmd = "D"
 		drawCmd = "D"
-	dots_code = ""
-	#Main loop
-	for label in diagram.objectList:
-		if label == "": continue
+	#Draw the visible paths.  Sorry, idk how to draw a real number.</sarc>
+	for label in diagram.visibleOfType("path"):
 		curr_obj = diagram[label]
-		if curr_obj.depend < DEPEND_THRESHOLD:
-			obj_repr = curr_obj.constructor # If object wasn't declared earlier
+		obj_repr = objectRepr(curr_obj)
+		if not curr_obj.needs_pen:
+			emit.code("%s(%s);" %(drawCmd, obj_repr))
 		else:
-			obj_repr = label # Already declared -- refer to by name
-		if curr_obj.visible == 0:
-			pass #Don't draw invisible objects
-		else:
-			#Figure out how to draw depending on whether path, pair, or other type.
-			if curr_obj.asy_obj_type == "pair":
-				dots_code += "%s(%s);" %(dotCmd, obj_repr)
-				dots_code += "\n" if CONCISE_MODE == 0 else " "
-			elif curr_obj.asy_obj_type == "path":
-				if not curr_obj.needs_pen:
-					out_asy_code += "%s(%s);" %(drawCmd, obj_repr)
-					out_asy_code += "\n" if CONCISE_MODE == 0 else " "
-				else:
-					#Create a pen
-					penProps = [blah for blah in [curr_obj.color, curr_obj.thick, curr_obj.style] if blah != None]
-					if CONCISE_MODE == 0:
-						pen = ' + '.join(penProps)
-						out_asy_code += "%s(%s, %s);\n" %(drawCmd, obj_repr, pen)
-					else:
-						pen = '+'.join(penProps)
-						out_asy_code += "%s(%s, %s); " %(drawCmd, obj_repr, pen)
-			elif curr_obj.asy_obj_type == "real":
-				#Sorry, idk how to draw a real number.</sarc>
-				continue
+			#Create a pen
+			penProps = [blah for blah in [curr_obj.color, curr_obj.thick, curr_obj.style] if blah != None]
+			if CONCISE_MODE == 0:
+				emit.code("%s(%s, %s);" %(drawCmd, obj_repr, ' + '.join(penProps)))
 			else:
-				print "Type %s from object %s is not recognized" %(curr_obj.asy_obj_type, curr_obj)
-				print "Dying..."
-				exit()
+				emit.code("%s(%s, %s);" %(drawCmd, obj_repr, '+'.join(penProps)))
+		emit.newline()
 	
 	# Dot points
 	if CONCISE_MODE == 0:
-		out_asy_code += "\n/* Place dots on each point */\n"
-	out_asy_code += dots_code
+		emit.code("\n/* Place dots on each point */\n")
+	for label in diagram.visibleOfType("pair"):
+		emit.code("%s(%s);" %(dotCmd, objectRepr(diagram[label])))
+		emit.newline()
 	
 	#Setup label commands.
 	if CSE_MODE == 0 and CONCISE_MODE == 0:
@@ -355,44 +641,38 @@ def drawDiagram(diagram, label_locations = {}, opts = {}, view = None):
 	else:
 		label_cmd_name = "MarkPoint"
 	
-	out_asy_code += "\n"
+	emit.code("\n")
 	if CONCISE_MODE == 0:
-		out_asy_code += "/* Label points */\n"
+		emit.code("/* Label points */\n")
 
-	# If concise, change the long CSE commands to the abbreviations
-	for long_name in CSE_CONCISE_TRANSLATE:
-		out_asy_code.replace(long_name, CSE_CONCISE_TRANSLATE[long_name])
-	
-	#Finally, before the last labelling, clean up apostrophes and such
-	out_asy_code = clean_string(out_asy_code)
-
-	#Label each object
-	for label in diagram.objectList:
-		curr_obj = diagram[label]
-		if not curr_obj.needs_label:
-			pass
+	#Label each object; the label itself keeps its apostrophes, the position is cleaned up
+	for label in diagram.labelled:
+		where = label_locations.get(label, "lsf * dir(45)")
+		if CSE_MODE == 0:
+			emit.raw("%s(\"$%s$\", %s, %s);" %(label_cmd_name, label, clean_string(label), where))
 		else:
-			where = label_locations.get(label, "lsf * dir(45)")
-			if CSE_MODE == 0:
-				out_asy_code += "%s(\"$%s$\", %s, %s);" %(label_cmd_name, label, clean_string(label), where)
-			else:
-				out_asy_code += "%s(\"%s\", %s, %s);" %(label_cmd_name, label, clean_string(label), where)
-			out_asy_code += "\n" if CONCISE_MODE == 0 else " "	
+			emit.raw("%s(\"%s\", %s, %s);" %(label_cmd_name, label, clean_string(label), where))
+		emit.newline()
 	
 	#Print the texts
-	for text_label in diagram.text_dict.keys():
-		text = diagram.text_dict[text_label]["text"]
-		x = diagram.text_dict[text_label]["x"]
-		y = diagram.text_dict[text_label]["y"]
+	for text_item in diagram.text_dict.itervalues():
+		text = text_item["text"]
+		x = text_item["x"]
+		y = text_item["y"]
 		if CSE_MODE == 1:
 			if text[0] == "$" and text[-1] == "$": text = text[1:-1]
-		out_asy_code += "%s(%s, (%s,%s));" %(label_cmd_name, text, x,y)
-		out_asy_code += "\n" if CONCISE_MODE == 0 else " "	
+		emit.raw("%s(%s, (%s,%s));" %(label_cmd_name, text, x,y))
+		emit.newline()
 
 	#Viewports	
 	if view is not None:
 		if CONCISE_MODE == 0:
-			out_asy_code += "\n/* Clip the image */ \n"
-		out_asy_code += "clip((xmin,ymin)--(xmin,ymax)--(xmax,ymax)--(xmax,ymin)--cycle);"
-	return out_asy_code
+			emit.code("\n/* Clip the image */ \n")
+		emit.code("clip((xmin,ymin)--(xmin,ymax)--(xmax,ymax)--(xmax,ymin)--cycle);")
 
+def objectRepr(curr_obj):
+	"""How an object is referred to when drawn: by name if it was declared, else by its constructor"""
+	if curr_obj.depend < DEPEND_THRESHOLD:
+		return curr_obj.constructor # If object wasn't declared earlier
+	else:
+		return curr_obj._key # Already declared -- refer to by name
@@ -0,0 +1,48 @@
+"""emitter.py
+Writes Asymptote code to a file-like sink one chunk at a time.
+Escaping (apostrophes, Greek letters) and the concise-mode abbreviations are applied to
+each chunk as it is written, rather than to the whole output afterwards."""
+
+import re
+
+from constants import CSE_CONCISE_TRANSLATE
+
+
+#Longest names first, so that e.g. IntersectionPoints is not read as IntersectionPoint + s
+ABBREVIATION_REGEX = re.compile(r"(?<![\w'])(%s)(?=\()" %"|".join(
+		sorted(CSE_CONCISE_TRANSLATE.keys(), key = len, reverse = True)))
+
+def clean_string(s):
+	return s.replace("'", "_prime")
+def restore_string(s):
+	return s.replace("_prime", r"\'")
+
+def abbreviate(s):
+	"""Replace the long CSE5 command names by their abbreviations"""
+	return ABBREVIATION_REGEX.sub(lambda match: CSE_CONCISE_TRANSLATE[match.group(1)], s)
+
+
+class AsyEmitter():
+	"""Writes chunks of Asymptote to sink, which needs only a write method.
+	code() is for generated code, whose apostrophes have to become valid identifiers;
+	raw() is for label and text strings, which are written as they are."""
+	def __init__(self, sink, concise = 0):
+		self.sink = sink
+		self.concise = concise
+
+	def code(self, chunk):
+		chunk = clean_string(chunk)
+		if self.concise:
+			chunk = abbreviate(chunk)
+		self.raw(chunk)
+
+	def raw(self, chunk):
+		if isinstance(chunk, unicode):
+			chunk = chunk.replace(u"\u03B1", "alpha").encode("utf-8")
+		else:
+			chunk = chunk.replace(u"\u03B1".encode("utf-8"), "alpha")
+		self.sink.write(chunk)
+
+	def newline(self):
+		"""End a statement: a newline in verbose mode, a space in concise mode"""
+		self.sink.write(" " if self.concise else "\n")
@@ -0,0 +1,26 @@
+"""errors.py
+Exceptions raised by Dragon.  Everything which is the fault of the input derives from DragonError."""
+
+class DragonError(Exception):
+	"""Base class for errors in the input diagram"""
+	pass
+
+class GGBFormatError(DragonError):
+	"""The input is not a GeoGebra file, or its XML is not what Dragon expects"""
+	pass
+
+class ParseError(DragonError):
+	"""A GeoGebra expression or command could not be parsed"""
+	pass
+
+class UnsupportedError(DragonError):
+	"""The diagram uses something Dragon does not know how to convert"""
+	pass
+
+class ConfigError(DragonError):
+	"""A manifest or .cfg file is malformed, or sets an option which does not exist"""
+	pass
+
+class RenderError(DragonError):
+	"""Asymptote could not render the generated code"""
+	pass
@@ -4,9 +4,13 @@ convert it into the corresponding asymptote code.  At the same time, the return
 give a list of _dependencies_; that is, a list of variables which are invoked, so that Dragon will
 known later that it should declare these variables for the definition to work."""
 
-import constructs as module_constructs
-from constants import INFIX_OPERATOR_DICT, STRING_TYPE, GOOD_LUCK
-import string
+from registry import commands, operators
+from constants import INFIX_OPERATOR_DICT, PARSE_CACHE_SIZE
+from errors import ParseError
+import profiler
+import re
+import threading
+from collections import OrderedDict
 
 class RPSToken():
 	"""Generic token class.
@@ -14,10 +18,10 @@ class RPSToken():
 	token_type = ""
 	needed_attr = []
 	def __init__(self, **kwargs):
-		if not all([kwargs.has_key(req) for req in self.needed_attr]):
+		missing = [req for req in self.needed_attr if req not in kwargs]
+		if missing:
 			raise KeyError, "Token of type %s requires attributes %s, given %s" %(self.token_type, self.needed_attr, kwargs.keys())
-		for key in kwargs.keys():
-			setattr(self, key, kwargs[key])
+		self.__dict__.update(kwargs)
 	def __repr__(self):
 		return self.token_type
 
@@ -28,7 +32,7 @@ class RPSFunction(RPSToken):
 
 class RPSPrefixFunction(RPSFunction):
 	function_type = "prefix"
-	needed_attr = ["name"]
+	needed_attr = ["name", "command"]
 	number_args = 0 #change this pretty soon... 
 	prec = 999
 
@@ -41,6 +45,7 @@ class RPSInfixOperator(RPSFunction):
 			setattr(self, key, kwargs[key])
 		self.name = INFIX_OPERATOR_DICT[op]['name']
 		self.prec = INFIX_OPERATOR_DICT[op]['prec']
+		self.function = operators[self.name]
 
 class RPSObject(RPSToken):
 	token_type = "object"
@@ -52,39 +57,66 @@ class RPSLeftParen(RPSToken): token_type = "("
 class RPSRightParen(RPSToken): token_type = ")"
 
 
-def isFunc(s):
-	return module_constructs.__dict__.has_key(s)
+def isFunc(s, registry = commands):
+	return s in registry
 
-def get_tokens_from_string(s):
-	"""Produce tokens from a raw GGB string s"""
+#Token types produced by tokenize()
+TOKEN_NUMBER = "number"
+TOKEN_NAME = "name"
+TOKEN_COMMAND = "command"
+TOKEN_OPERATOR = "operator"
+TOKEN_OPEN = "open"
+TOKEN_CLOSE = "close"
+TOKEN_COMMA = "comma"
+TOKEN_DEGREE = "degree"
+
+#Whitespace is skipped; every other character is either special or part of a "word",
+#which is classified afterwards.  One scan covers the whole string.
+TOKEN_REGEX = re.compile(u"[^\\s()[\\],+\\-*/^\xb0]+|[()[\\],+\\-*/^\xb0]", re.UNICODE)
+NUMBER_REGEX = re.compile(r"^[0-9.]+$")
+SPECIAL_TOKEN_TYPES = {
+		"(" : TOKEN_OPEN, "[" : TOKEN_OPEN,
+		")" : TOKEN_CLOSE, "]" : TOKEN_CLOSE,
+		"," : TOKEN_COMMA,
+		"+" : TOKEN_OPERATOR, "-" : TOKEN_OPERATOR, "*" : TOKEN_OPERATOR, "/" : TOKEN_OPERATOR, "^" : TOKEN_OPERATOR,
+		u"\xb0" : TOKEN_DEGREE
+		}
+VALUE_TOKENS = (TOKEN_NUMBER, TOKEN_NAME, TOKEN_CLOSE, TOKEN_DEGREE)
+
+def tokenize(s, registry = commands):
+	"""Produce typed tokens from a raw GGB string s in a single pass.
+	Words which are commands of registry (a registry.CommandRegistry) are TOKEN_COMMAND.
+	Return value: list of (token type, text) pairs."""
 	tokens = []
-	cocoon = ""
-	EOF = ";"
-	for char in s + EOF:
-		if char in "()[]+-*/^,;":
-			#If queue is nonempty, write it to tokens.
-			if cocoon.strip() != "":
-				tokens.append(cocoon.strip())
-			#If the last thing is a (, check if implicit multiply
-			if len(tokens) > 0:
-				if not isFunc(tokens[-1]) and not (tokens[-1] in "+-*/^") and char == "(":
-					tokens.append("*")
-			#Append special char to tokens
-			tokens.append(char)
-			#Reset queue
-			cocoon = ""
-		elif char == " " and cocoon.strip() == "":
-			#Ignore extraneous spaces
-			pass
-		else:
-			#Add to queue
-			cocoon += char
-	#OK, don't need that EOF anymore.
-	tokens.pop()
+	append = tokens.append
+	last_type = None
+	for text in TOKEN_REGEX.findall(s):
+		kind = SPECIAL_TOKEN_TYPES.get(text)
+		if kind is None:
+			if NUMBER_REGEX.match(text):
+				kind = TOKEN_NUMBER
+			elif text in registry:
+				kind = TOKEN_COMMAND
+			else:
+				kind = TOKEN_NAME
+		elif kind == TOKEN_OPEN:
+			#A value followed by a ( is an implicit multiply, e.g. 2(a+b)
+			if text == "(" and last_type in VALUE_TOKENS:
+				append((TOKEN_OPERATOR, "*"))
+		elif kind == TOKEN_DEGREE:
+			#A degree sign is treated as 1, so after a value it is just "times 1"
+			if last_type in VALUE_TOKENS:
+				continue
+		append((kind, text))
+		last_type = kind
 	return tokens
 
-def ShuntingYard(string_tokens, **kwargs):
-	"""Converts a prefix/infix string expression into a list of instances 'Token'
+def get_tokens_from_string(s):
+	"""Produce tokens from a raw GGB string s, as plain strings"""
+	return [text for kind, text in tokenize(s)]
+
+def ShuntingYard(tokens, registry = commands, **kwargs):
+	"""Converts a list of typed tokens (from tokenize) of a prefix/infix expression into a list of instances 'Token'
 	sorted in Reverse Polish notation.
 	Return value: [list (elements are tokens) of tokens, list (elements are labels) of dependencies]"""
 	output_queue = []
@@ -92,13 +124,13 @@ def ShuntingYard(string_tokens, **kwargs):
 	deps = []
 	function_nargs_tracker = []
 	
-	for string_token in string_tokens:
+	for token_type, string_token in tokens:
 		#print "Processing %s..." %string_token
 
-		if string_token in "([":
+		if token_type == TOKEN_OPEN:
 			stack.append(RPSLeftParen())
 			
-		elif string_token in ")]":
+		elif token_type == TOKEN_CLOSE:
 			while stack[-1].token_type != "(":
 				assert stack[-1].token_type == "function", stack[-1]
 				output_queue.append(stack.pop())
@@ -108,8 +140,12 @@ def ShuntingYard(string_tokens, **kwargs):
 					if stack[-1].function_type == "prefix":
 						output_queue.append(stack.pop())
 						output_queue[-1].number_args = function_nargs_tracker.pop()
+						command = output_queue[-1].command
+						if not command.accepts(output_queue[-1].number_args):
+							raise ParseError, "%s takes %s arguments, not %d.  Tokens: %s" %(command.name, command.arityText(),
+									output_queue[-1].number_args, [text for kind, text in tokens])
 
-		elif string_token in ",":
+		elif token_type == TOKEN_COMMA:
 			#Separator
 			while stack[-1].token_type != "(":
 				stack_top = stack.pop()
@@ -118,13 +154,13 @@ def ShuntingYard(string_tokens, **kwargs):
 				output_queue.append(stack_top)
 			function_nargs_tracker[-1] += 1
 			
-		elif isFunc(string_token):
+		elif token_type == TOKEN_COMMAND:
 			#This is a prefix function from constructs
-			curr_rps_token = RPSPrefixFunction(name = string_token)	
+			curr_rps_token = RPSPrefixFunction(name = string_token, command = registry.get(string_token))
 			stack.append(curr_rps_token)
 			function_nargs_tracker.append(1)
 
-		elif INFIX_OPERATOR_DICT.has_key(string_token):
+		elif token_type == TOKEN_OPERATOR:
 			#This is an infix operator.
 			curr_rps_token = RPSInfixOperator(op = string_token)
 			if len(stack) > 0:
@@ -136,39 +172,32 @@ def ShuntingYard(string_tokens, **kwargs):
 					if len(stack) <= 0: break
 			stack.append(curr_rps_token)
 
-		elif any( [char in (string.ascii_letters + "_ ") for char in string_token] ):
-			#This is a varname because it contains at least an alphanum
+		elif token_type == TOKEN_NAME:
+			#This is a varname
 			deps.append(string_token)
 
 			#curr_ggb_type = "point"
 			if not kwargs['ref_dict'].has_key(string_token):
-				print "FATAL ERROR"
-				print "\"%s\" is neither a recorded GGB command or the name of a previous object." %string_token
-				print "Tokens:", string_tokens
-				print GOOD_LUCK
-				exit()
+				raise ParseError, "\"%s\" is neither a recorded GGB command or the name of a previous object.  Tokens: %s" \
+						%(string_token, [text for kind, text in tokens])
 
 			curr_ggb_type = kwargs['ref_dict'][string_token].ggb_obj_type
 
 			curr_rps_token = RPSObject(ggb_type = curr_ggb_type, constructor = string_token, is_constant = 0, is_in_diagram = 1)
 			output_queue.append(curr_rps_token)
 
-		elif all( [char in '1234567890. ' for char in string_token] ):
+		elif token_type == TOKEN_NUMBER:
 			#This is a real.
 			curr_rps_token = RPSObject(ggb_type = "numeric", constructor = string_token, is_constant = 1, is_in_diagram = 0)
 			output_queue.append(curr_rps_token)
 
-		elif string_token == u'\xb0': # This is a degree sign, treat as 1.
+		elif token_type == TOKEN_DEGREE: # This is a degree sign, treat as 1.
 			curr_rps_token = RPSObject(ggb_type = "numeric", constructor = "1", is_constant = 1, is_in_diagram = 0)
 			output_queue.append(curr_rps_token)
 
 		else:
 			#idk
-			print "FATAL ERROR"
-			print "\"%s\" is not a recognized token." %string_token
-			print "Tokens:", string_tokens
-			print GOOD_LUCK
-			exit()
+			raise ParseError, "\"%s\" is not a recognized token.  Tokens: %s" %(string_token, [text for kind, text in tokens])
 
 
 	while len(stack) > 0:
@@ -178,9 +207,105 @@ def ShuntingYard(string_tokens, **kwargs):
 
 	return [output_queue, deps]
 
-def parse_string(s, **kwargs):
+class ParseCache():
+	"""Bounded LRU cache for parse_string.
+	The key is the expression text, the other keyword arguments (e.g. num_expected) and the
+	ggb_obj_type of every referenced label, since the types decide what e.g. Circle or Line emit.
+	One instance is shared by every diagram; all access goes through a lock."""
+	def __init__(self, maxsize = PARSE_CACHE_SIZE):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, key):
+		"""Return the cached value for key, or None"""
+		with self._lock:
+			value = self._entries.pop(key, None)
+			if value is None:
+				self.misses += 1
+			else:
+				self._entries[key] = value # Most recently used goes last
+				self.hits += 1
+			return value
+
+	def put(self, key, value):
+		with self._lock:
+			if self.maxsize <= 0:
+				return
+			self._entries.pop(key, None)
+			self._entries[key] = value
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last = False)
+
+	def resize(self, maxsize):
+		with self._lock:
+			self.maxsize = maxsize
+			while len(self._entries) > max(maxsize, 0):
+				self._entries.popitem(last = False)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+	def stats(self):
+		with self._lock:
+			return {"size" : len(self._entries), "maxsize" : self.maxsize, "hits" : self.hits, "misses" : self.misses}
+
+parse_cache = ParseCache()
+
+def parse_cache_key(s, tokens, kwargs, registry = commands):
+	"""Key for parse_cache, or None if some referenced label is unknown (which is an error anyway).
+	The plugins of registry, and their sources, are part of it, since they may redefine commands."""
+	ref_dict = kwargs['ref_dict']
+	ref_types = []
+	for token_type, text in tokens:
+		if token_type == TOKEN_NAME:
+			if not ref_dict.has_key(text):
+				return None
+			ref_types.append(ref_dict[text].ggb_obj_type)
+	options = tuple(sorted((key, val) for key, val in kwargs.items() if key != 'ref_dict'))
+	return (s, options, tuple(ref_types), registry.key)
+
+def parse_string(s, registry = commands, **kwargs):
+	"""Convert the GGB expression s into Asymptote code, with the commands of registry.
+	Return value: [constructor (a list of them if num_expected > 1), list of dependencies]
+	Results are memoized in parse_cache."""
+	if profiler.active is None:
+		tokens = tokenize(s, registry)
+	else:
+		with profiler.active.stage("tokenize"):
+			tokens = tokenize(s, registry)
+		profiler.active.expression(s, len(tokens))
+	key = parse_cache_key(s, tokens, kwargs, registry)
+	if key is not None:
+		cached = parse_cache.get(key)
+		if cached is not None:
+			constructor, deps = cached
+			if type(constructor) == tuple:
+				constructor = list(constructor)
+			return [constructor, list(deps)]
+	constructor, deps = parse_tokens(s, tokens, registry, **kwargs)
+	if not isinstance(constructor, basestring):
+		constructor = list(constructor) # e.g. Polygon gives a generator, which can only be used once
+	if key is not None:
+		parse_cache.put(key, (tuple(constructor) if type(constructor) == list else constructor, tuple(deps)))
+	return [constructor, deps]
+
+def parse_tokens(s, tokens, registry = commands, **kwargs):
+	"""parse_string, minus the cache; tokens is tokenize(s)"""
 	# Get token set and dependencies
-	token_set, deps = ShuntingYard(get_tokens_from_string(s), **kwargs)
+	if profiler.active is None:
+		token_set, deps = ShuntingYard(tokens, registry, **kwargs)
+	else:
+		with profiler.active.stage("shunting_yard"):
+			token_set, deps = ShuntingYard(tokens, registry, **kwargs)
 	stack = []
 
 	# Process an Reverse-Polish token_set
@@ -191,10 +316,7 @@ def parse_string(s, **kwargs):
 		elif token.token_type == "function":
 			# Get arguments by pushing from the stack
 			if len(stack) < token.number_args:
-				print "ERROR: Not enough arguments when parsing", s
-				print token_set, stack
-				print GOOD_LUCK
-				exit()
+				raise ParseError, "Not enough arguments when parsing %s: %s %s" %(s, token_set, stack)
 			args_token = reversed([stack.pop() for t in range(token.number_args)])
 			args_string = []
 			args_types = []
@@ -202,14 +324,16 @@ def parse_string(s, **kwargs):
 			for arg in args_token:
 				args_string.append(arg.constructor)
 				args_types.append(arg.ggb_type)
-			curr_func = getattr(module_constructs, token.name) # Get a function from the module
-			res_constructor = curr_func(*args_string, args_types = args_types, **kwargs) # Get GGB constructor
 			if token.function_type == "prefix":
-				the_return_type = curr_func.ggb_return_type # Each function has a specified return type
-				if type(the_return_type) == STRING_TYPE: # if the_return_type is a static string
-					res_type = the_return_type
-				else: # otherwise, it is a dynamic function
-					res_type = the_return_type(*args_string, args_types = args_types, **kwargs)
+				curr_func = token.command.function
+			else:
+				curr_func = token.function
+			if profiler.active is None:
+				res_constructor = curr_func(*args_string, args_types = args_types, **kwargs) # Get GGB constructor
+			else:
+				res_constructor = profiler.active.call(token.name, curr_func, *args_string, args_types = args_types, **kwargs)
+			if token.function_type == "prefix":
+				res_type = token.command.returnType(*args_string, args_types = args_types, **kwargs) # Static, or computed from the arguments
 			else:
 				#QQ
 				assert len(args_types) == 2, "Infix called with num arguments %s" %str(args_types)
@@ -0,0 +1,167 @@
+"""labels.py
+Automatic label placement (--autolabel).  Instead of putting every label at lsf * dir(45),
+each label gets the direction, out of DIRECTIONS evenly spaced ones, where it covers the
+fewest dots, drawn paths and other labels.  Positions come from the coordinates GeoGebra
+stored (GGBObject.value).  Candidates of all labels are scored at once with NumPy;
+label-label overlaps are then settled by a few rounds of moving each label to its best spot
+given the others.  Without NumPy, labels keep their default direction."""
+
+import re
+import math
+
+from optimize import SEGMENT_REGEX
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+DIRECTIONS = 16
+PREFERRED_ANGLE = 45 #The default direction, which wins ties
+ROUNDS = 4
+#Penalties per unit of overlap with the label's box
+LABEL_WEIGHT = 10.0 #per box-area of overlap with another label
+DOT_WEIGHT = 4.0 #per dot covered
+PATH_WEIGHT = 1.0 #per sample of a path covered; samples are about a label height apart
+PREFERENCE_WEIGHT = 0.05 #per 180 degrees away from PREFERRED_ANGLE
+
+UNITS = {"bp" : 1.0, "pt" : 72.0 / 72.27, "mm" : 72.0 / 25.4, "cm" : 72.0 / 2.54, "in" : 72.0}
+SIZE_REGEX = re.compile(r"^\s*([\d.]+)\s*([a-z]*)\s*$")
+
+def toBigPoints(size, default = 10.0):
+	"""A size such as "11cm" or "10pt" in PostScript points"""
+	match = SIZE_REGEX.match(str(size))
+	if not match:
+		return default
+	return float(match.group(1)) * UNITS.get(match.group(2) or "bp", 1.0)
+
+def labelExtent(text, font_size):
+	"""Rough (width, height) in PostScript points of the label $text$"""
+	width = 0.0
+	scale = 1.0
+	for char in text:
+		if char in "_^":
+			scale = 0.7 # Subscripts and superscripts are smaller
+		elif char not in "{}\\":
+			width += 0.6 * font_size * scale
+	return max(width, 0.6 * font_size), font_size
+
+def pathSamples(diagram, obj, bbox, spacing):
+	"""Points along a drawn path, about spacing apart, as a list of (x, y)"""
+	xmin, xmax, ymin, ymax = bbox
+	match = SEGMENT_REGEX.match(obj.constructor)
+	ends = None
+	if match and all(diagram.has_key(label) and diagram[label].value for label in match.groups()):
+		ends = [diagram[label].value for label in match.groups()]
+	elif obj.ggb_obj_type == "line" and obj.value:
+		a, b, c = obj.value
+		norm2 = a*a + b*b
+		if norm2 == 0:
+			return []
+		x, y = -a * c / norm2, -b * c / norm2
+		reach = math.hypot(xmax - xmin, ymax - ymin)
+		dx, dy = -b / math.sqrt(norm2), a / math.sqrt(norm2)
+		ends = [(x - reach * dx, y - reach * dy), (x + reach * dx, y + reach * dy)]
+	elif obj.ggb_obj_type == "conic" and obj.value and obj.value[0] != 0:
+		A0, A1, A2, A3, A4, A5 = obj.value
+		x, y = -A4 / A0, -A5 / A0
+		r2 = x*x + y*y - A2 / A0
+		if r2 <= 0 or abs(A0 - A1) > 1e-9 * abs(A0):
+			return []
+		r = math.sqrt(r2)
+		n = max(8, min(720, int(2 * math.pi * r / spacing)))
+		return [(x + r * math.cos(2 * math.pi * i / n), y + r * math.sin(2 * math.pi * i / n)) for i in range(n)]
+	if ends is None:
+		return []
+	(x0, y0), (x1, y1) = ends
+	n = max(2, min(2000, int(math.hypot(x1 - x0, y1 - y0) / spacing)))
+	return [(x0 + (x1 - x0) * i / (n - 1.0), y0 + (y1 - y0) * i / (n - 1.0)) for i in range(n)]
+
+def _covered(centers, halves, positions, radius, points):
+	"""For each label and candidate, how many of points lie in its box.
+	centers: L x K x 2, halves: L x 2, points: N x 2.  The candidate boxes of label l lie within
+	radius[l] of positions[l], so only the points in that window (found by sorting on x) are tested."""
+	counts = numpy.zeros(centers.shape[:2])
+	if len(points) == 0:
+		return counts
+	points = points[points[:, 0].argsort()]
+	lows = numpy.searchsorted(points[:, 0], positions[:, 0] - radius, "left")
+	highs = numpy.searchsorted(points[:, 0], positions[:, 0] + radius, "right")
+	for l in range(len(centers)):
+		window = points[lows[l]:highs[l]]
+		window = window[numpy.abs(window[:, 1] - positions[l, 1]) <= radius[l]]
+		if len(window):
+			inside = (numpy.abs(window[numpy.newaxis, :, :] - centers[l][:, numpy.newaxis, :]) <= halves[l]).all(axis = 2)
+			counts[l] = inside.sum(axis = 1)
+	return counts
+
+def placeLabels(diagram, opts, view = None, report = None):
+	"""The label locations chosen for the labelled points of diagram, as a dictionary
+	label : "lsf * dir(angle)", in the format of the [label] section of .cfg files."""
+	if numpy is None:
+		diagram.warn("Automatic label placement needs NumPy; labels keep their default directions")
+		return {}
+	labels = [label for label in diagram.labelled
+			if diagram[label].asy_obj_type == "pair" and diagram[label].value is not None]
+	if not labels:
+		return {}
+	dots = [diagram[label].value for label in diagram.visibleOfType("pair") if diagram[label].value is not None]
+	positions = numpy.array([diagram[label].value for label in labels])
+
+	#Scale: size(IMG_SIZE) fits the larger side of the picture into IMG_SIZE
+	if view is not None:
+		bbox = view
+	else:
+		everything = numpy.array(dots + [diagram[label].value for label in labels])
+		bbox = (everything[:, 0].min(), everything[:, 0].max(), everything[:, 1].min(), everything[:, 1].max())
+	extent = max(bbox[1] - bbox[0], bbox[3] - bbox[2]) or 1.0
+	units_per_bp = extent / toBigPoints(opts.get('IMG_SIZE', "11cm"), 312.0)
+	font_size = toBigPoints(opts.get('FONT_SIZE', "10pt"))
+	lsf = float(opts.get('LABEL_SCALE_FACTOR', 0.8))
+
+	samples = []
+	for label in diagram.visibleOfType("path"):
+		samples.extend(pathSamples(diagram, diagram[label], bbox, font_size * units_per_bp))
+	dots = numpy.array(dots).reshape(-1, 2)
+	samples = numpy.array(samples).reshape(-1, 2)
+
+	#Candidate boxes: L labels x K directions
+	halves = numpy.array([labelExtent(diagram[label].label, font_size) for label in labels]) * units_per_bp / 2
+	angles = numpy.arange(DIRECTIONS) * 360.0 / DIRECTIONS
+	units = numpy.column_stack([numpy.cos(numpy.radians(angles)), numpy.sin(numpy.radians(angles))])
+	gap = lsf * font_size * units_per_bp / 2
+	reach = gap + numpy.abs(units[numpy.newaxis, :, 0]) * halves[:, 0:1] + numpy.abs(units[numpy.newaxis, :, 1]) * halves[:, 1:2]
+	centers = positions[:, numpy.newaxis, :] + reach[:, :, numpy.newaxis] * units[numpy.newaxis, :, :]
+
+	radius = reach.max(axis = 1) + numpy.hypot(halves[:, 0], halves[:, 1]) # All candidates are within this
+
+	distance = numpy.abs((angles - PREFERRED_ANGLE + 180) % 360 - 180) / 180.0
+	cost = PREFERENCE_WEIGHT * distance[numpy.newaxis, :] + \
+			DOT_WEIGHT * _covered(centers, halves, positions, radius, dots) + \
+			PATH_WEIGHT * _covered(centers, halves, positions, radius, samples)
+
+	#Labels against each other; only labels whose candidate boxes can meet are compared
+	choice = cost.argmin(axis = 1)
+	areas = 4 * halves[:, 0] * halves[:, 1]
+	near = numpy.hypot(*(positions[:, numpy.newaxis, :] - positions[numpy.newaxis, :, :]).transpose(2, 0, 1)) \
+			< radius[:, numpy.newaxis] + radius[numpy.newaxis, :]
+	numpy.fill_diagonal(near, False)
+	neighbours = [numpy.flatnonzero(row) for row in near]
+	for attempt in range(ROUNDS):
+		moved = 0
+		for i, others in enumerate(neighbours):
+			if not len(others):
+				continue
+			chosen = centers[others, choice[others]] # n x 2
+			overlap = numpy.clip(halves[i] + halves[others][numpy.newaxis, :, :] - numpy.abs(centers[i][:, numpy.newaxis, :] - chosen[numpy.newaxis, :, :]), 0, None)
+			area = overlap[:, :, 0] * overlap[:, :, 1] # K x n
+			best = (cost[i] + LABEL_WEIGHT * area.sum(axis = 1) / areas[i]).argmin()
+			if best != choice[i]:
+				choice[i] = best
+				moved += 1
+		if not moved:
+			break
+
+	if report is not None:
+		report["labels"] = {"placed" : len(labels), "moved" : int((angles[choice] != PREFERRED_ANGLE).sum())}
+	return dict((label, "lsf * dir(%s)" %("%g" %angles[k])) for label, k in zip(labels, choice))
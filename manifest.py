@@ -0,0 +1,115 @@
+"""manifest.py
+A project manifest (--manifest): the options and label locations of many diagrams in one INI file,
+read and checked once, then handed to every conversion.
+
+	[defaults]
+	IMG_SIZE = 8cm
+	CSE_MODE = 1
+
+	[Iran]
+	CONCISE_MODE = 1
+	label.A = dir(30)
+
+A section is named after a diagram: its filename without .ggb, or its path from the manifest's
+directory.  Option names are those of constants.DEFAULT_OPTIONS, in any case; label.X gives the
+location of the label of X, as [label] does in a .cfg file.  Values are Python literals where they
+parse as one (1, 0.8, "text") and strings otherwise (8cm); nothing is evaluated.
+For each diagram, [defaults] applies first, then its section, then its own .cfg file if it has one."""
+
+import os
+import ast
+import ConfigParser
+
+from constants import DEFAULT_OPTIONS
+from errors import ConfigError
+
+DEFAULTS_SECTION = "defaults"
+LABEL_PREFIX = "label."
+
+
+def literalValue(val):
+	"""val as a Python literal if it is one (1, 0.8, "x"), else as the string itself (8cm)"""
+	try:
+		return ast.literal_eval(val.strip())
+	except (ValueError, SyntaxError):
+		return val.strip()
+
+def checkedOption(key, val, where):
+	"""The option key (any case) with the value val, converted to the type of its default"""
+	name = key.upper()
+	if name not in DEFAULT_OPTIONS:
+		raise ConfigError, "%s: unknown option %s" %(where, key)
+	value = literalValue(val)
+	default = DEFAULT_OPTIONS[name]
+	if isinstance(default, basestring):
+		return name, value if isinstance(value, basestring) else val.strip() # e.g. IMG_SIZE = 300
+	if isinstance(value, (int, long, float)):
+		return name, type(default)(value)
+	raise ConfigError, "%s: %s should be of type %s, not %r" %(where, key, type(default).__name__, val.strip())
+
+def sectionKey(name):
+	"""A section name or diagram path as looked up in the manifest: / separators, no .ggb"""
+	name = name.strip().replace(os.sep, "/")
+	if name.lower().endswith(".ggb"):
+		name = name[:-4]
+	return name
+
+
+class Manifest():
+	"""The parsed manifest.  With no filename, it is empty: it then only saves
+	looking for .cfg files one by one (see configFilename)."""
+	def __init__(self, filename = None):
+		self.filename = filename
+		self.directory = os.path.dirname(os.path.abspath(filename)) if filename else os.getcwd()
+		self.defaults = ({}, {}) #(options, label locations)
+		self.sections = {} #sectionKey : (options, label locations)
+		self._listings = {} #directory : set of its filenames
+		if filename is not None:
+			self.read(filename)
+
+	def read(self, filename):
+		config = ConfigParser.RawConfigParser()
+		config.optionxform = str # makes names case-sensitive
+		try:
+			if not config.read(filename):
+				raise ConfigError, "Cannot read the manifest %s" %filename
+		except ConfigParser.Error, e:
+			raise ConfigError, "Malformed manifest %s: %s" %(filename, e)
+		for section in config.sections():
+			where = "%s, [%s]" %(filename, section)
+			opts, labels = {}, {}
+			for key, val in config.items(section):
+				if key.startswith(LABEL_PREFIX):
+					labels[key[len(LABEL_PREFIX):]] = "lsf * " + val.strip()
+				else:
+					name, value = checkedOption(key, val, where)
+					opts[name] = value
+			if section == DEFAULTS_SECTION:
+				self.defaults = (opts, labels)
+			else:
+				self.sections[sectionKey(section)] = (opts, labels)
+
+	def settingsFor(self, filename = None):
+		"""(options, label locations) for the diagram filename, from [defaults] and its section.
+		Without a filename (e.g. standard input), only [defaults] applies."""
+		opts, labels = dict(self.defaults[0]), dict(self.defaults[1])
+		if filename is not None:
+			path = os.path.abspath(filename)
+			candidates = [sectionKey(os.path.relpath(path, self.directory)), sectionKey(os.path.basename(path))]
+			for key in candidates:
+				if key in self.sections:
+					opts.update(self.sections[key][0])
+					labels.update(self.sections[key][1])
+					break
+		return opts, labels
+
+	def configFilename(self, filename):
+		"""The .cfg file next to filename, or "" if there is none.  Each directory is listed once."""
+		directory, name = os.path.split(os.path.abspath(filename))
+		if directory not in self._listings:
+			try:
+				self._listings[directory] = set(os.listdir(directory))
+			except OSError:
+				self._listings[directory] = set()
+		config_name = os.path.splitext(name)[0] + ".cfg"
+		return os.path.join(directory, config_name) if config_name in self._listings[directory] else ""
@@ -0,0 +1,449 @@
+"""optimize.py
+Passes over a compiled AsyDiagram which make the generated Asymptote shorter or faster,
+without changing the picture.  Each pass takes an optional report dictionary, into which it
+puts a dictionary of statistics under its own name."""
+
+import re
+import math
+from collections import OrderedDict
+
+from diagram import GGBObject
+from constants import DEPEND_THRESHOLD
+from errors import DragonError
+
+SEGMENT_REGEX = re.compile(r"^([\w']+)--([\w']+)$")
+
+
+# Numeric baking {{{
+#Constructors containing these are slow for Asymptote, so the hybrid mode bakes just those
+EXPENSIVE_REGEX = re.compile(r"(?<![\w'])(IntersectionPoints?|circumcircle|relpoint)\(")
+
+def number(x):
+	"""x as a short literal: 6 decimals at most, no trailing zeros"""
+	s = ("%.6f" %x).rstrip("0").rstrip(".")
+	return "0" if s == "-0" else s
+
+def literal(obj):
+	"""A constructor for obj made of numbers only, from its value; None if there is no such thing"""
+	value = obj.value
+	if value is None:
+		return None
+	if obj.asy_obj_type == "pair" and len(value) == 2:
+		return "(%s, %s)" %(number(value[0]), number(value[1]))
+	if obj.asy_obj_type == "real" and len(value) == 1:
+		return number(value[0])
+	if obj.ggb_obj_type == "conic" and len(value) == 6:
+		A0, A1, A2, A3, A4, A5 = value
+		if A0 == 0 or abs(A0 - A1) > 1e-9 * abs(A0) or abs(A3) > 1e-9 * abs(A0):
+			return None # Not a circle
+		x, y = -A4 / A0, -A5 / A0
+		r2 = x*x + y*y - A2 / A0
+		if r2 <= 0:
+			return None
+		return "circle((%s, %s), %s)" %(number(x), number(y), number(r2 ** 0.5))
+	if obj.ggb_obj_type == "line" and len(value) == 3:
+		a, b, c = value
+		norm = (a*a + b*b) ** 0.5
+		if norm == 0:
+			return None
+		# The foot from the origin, and the unit direction, extended by lisf as Line() does
+		x, y = -a * c / norm**2, -b * c / norm**2
+		dx, dy = -b / norm, a / norm
+		return "(%s, %s)-lisf*(%s, %s)--(%s, %s)+lisf*(%s, %s)" %tuple(map(number, [x, y, dx, dy] * 2))
+	return None # Segments, rays, polygons... stay symbolic
+
+def bakeNumeric(diagram, mode = "full", report = None):
+	"""Replace symbolic constructors by the numbers GeoGebra computed for them.
+	mode "full" bakes every object it can; "hybrid" only those whose constructors use the
+	operations in EXPENSIVE_REGEX.  Baked objects no longer depend on anything, so a
+	following pruneDiagram can drop what only they needed."""
+	baked = 0
+	for label in diagram.objectList:
+		obj = diagram[label]
+		if label not in diagram.dependencies:
+			continue # Free objects are numbers already
+		if mode == "hybrid" and not EXPENSIVE_REGEX.search(obj.constructor):
+			continue
+		constructor = literal(obj)
+		if constructor is None or constructor == obj.constructor:
+			continue
+		obj.constructor = constructor
+		diagram.dropDependencies(label)
+		baked += 1
+	if report is not None:
+		report["bake"] = {"baked" : baked, "symbolic" : len(diagram) - baked}
+	return baked
+# }}}
+
+
+# Viewport culling {{{
+CULL_MARGIN = 0.02 #Fraction of the view's size kept around it, for dot sizes and line widths
+
+def _segmentMeetsBox(p, q, box):
+	"""Whether the segment pq meets the box (xmin, xmax, ymin, ymax)"""
+	xmin, xmax, ymin, ymax = box
+	if max(p[0], q[0]) < xmin or min(p[0], q[0]) > xmax or max(p[1], q[1]) < ymin or min(p[1], q[1]) > ymax:
+		return False
+	return _lineMeetsBox((q[1] - p[1], p[0] - q[0], q[0]*p[1] - p[0]*q[1]), box)
+
+def _lineMeetsBox(abc, box):
+	"""Whether the line ax + by + c = 0 meets the box: not all corners are on one side"""
+	a, b, c = abc
+	xmin, xmax, ymin, ymax = box
+	sides = [a*x + b*y + c for x in (xmin, xmax) for y in (ymin, ymax)]
+	return min(sides) <= 0 <= max(sides)
+
+def meetsView(diagram, obj, box):
+	"""Whether obj, drawn, may show inside box.  True whenever that cannot be decided."""
+	value = obj.value
+	xmin, xmax, ymin, ymax = box
+	if obj.asy_obj_type == "pair":
+		if value is None or len(value) != 2:
+			return True
+		return xmin <= value[0] <= xmax and ymin <= value[1] <= ymax
+	match = SEGMENT_REGEX.match(obj.constructor)
+	if match:
+		ends = [diagram[label].value if diagram.has_key(label) else None for label in match.groups()]
+		if None in ends:
+			return True
+		return _segmentMeetsBox(ends[0], ends[1], box)
+	if value is None:
+		return True
+	if obj.ggb_obj_type == "line" and len(value) == 3:
+		return _lineMeetsBox(value, box)
+	if obj.ggb_obj_type == "conic" and len(value) == 6:
+		A0, A1, A2, A3, A4, A5 = value
+		if A0 == 0 or abs(A0 - A1) > 1e-9 * abs(A0) or abs(A3) > 1e-9 * abs(A0):
+			return True # Only circles are handled
+		x, y = -A4 / A0, -A5 / A0
+		r2 = x*x + y*y - A2 / A0
+		if r2 < 0:
+			return True
+		# The circle misses the box if the box is outside it, or entirely inside it
+		nearest = (min(max(x, xmin), xmax) - x) ** 2 + (min(max(y, ymin), ymax) - y) ** 2
+		farthest = max((cx - x) ** 2 for cx in (xmin, xmax)) + max((cy - y) ** 2 for cy in (ymin, ymax))
+		return nearest <= r2 <= farthest
+	return True
+
+def cullToView(diagram, view, report = None):
+	"""Stop drawing, dotting and labelling the objects, and texts, which lie entirely outside
+	view = (xmin, xmax, ymin, ymax), as they would be clipped away anyway.  Culled objects
+	stay declared while something depends on them; a following pruneDiagram drops the rest."""
+	xmin, xmax, ymin, ymax = view
+	dx, dy = CULL_MARGIN * (xmax - xmin), CULL_MARGIN * (ymax - ymin)
+	box = (xmin - dx, xmax + dx, ymin - dy, ymax + dy)
+	culled = []
+	for asy_obj_type in ("pair", "path"):
+		for label in list(diagram.visibleOfType(asy_obj_type)):
+			obj = diagram[label]
+			if not meetsView(diagram, obj, box):
+				obj.visible = 0
+				obj.needs_label = 0
+				culled.append(label)
+	texts = 0
+	for label, text_item in diagram.text_dict.items():
+		try:
+			x, y = float(text_item["x"]), float(text_item["y"])
+		except ValueError:
+			continue
+		if not (box[0] <= x <= box[1] and box[2] <= y <= box[3]):
+			del diagram.text_dict[label]
+			texts += 1
+	if report is not None:
+		report["cull"] = {"culled" : len(culled), "texts_culled" : texts}
+	return len(culled)
+# }}}
+
+
+# Fitting lines to the view {{{
+FIT_MARGIN = 0.05 #Fraction of the view's size, and of the span of dependent points, added around them
+LINE_REGEX = re.compile(r"(?<![\w'])Line\(")
+
+def splitArguments(call):
+	"""The top-level arguments of a call such as Line(A,f(B,C),lisf)"""
+	args = []
+	depth = 0
+	start = call.index("(") + 1
+	for i in xrange(start, len(call) - 1):
+		if call[i] == "(":
+			depth += 1
+		elif call[i] == ")":
+			depth -= 1
+		elif call[i] == "," and depth == 0:
+			args.append(call[start:i])
+			start = i + 1
+	args.append(call[start:len(call) - 1])
+	return args
+
+def callsOf(s, regex):
+	"""The calls in s of the function matched by regex (up to its open paren), outermost first"""
+	calls = []
+	for match in regex.finditer(s):
+		depth = 0
+		for i in xrange(match.end() - 1, len(s)):
+			if s[i] == "(":
+				depth += 1
+			elif s[i] == ")":
+				depth -= 1
+				if depth == 0:
+					calls.append(s[match.start():i+1])
+					break
+	return calls
+
+def fittedLine(call, diagram, cover):
+	"""call, a Line(A,B,lisf) or ray Line(A,B,0,lisf), with the extensions beyond A and B cut down
+	so that the line still reaches every point of cover (projected onto it).  None if A or B
+	has no known position."""
+	args = splitArguments(call)
+	is_ray = len(args) == 4 and args[2].strip() == "0" and args[3].strip() == "lisf"
+	if not (is_ray or (len(args) == 3 and args[2].strip() == "lisf")):
+		return None
+	ends = []
+	for arg in args[:2]:
+		arg = arg.strip()
+		if not diagram.has_key(arg) or diagram[arg].asy_obj_type != "pair" or not diagram[arg].value:
+			return None
+		ends.append(diagram[arg].value)
+	(ax, ay), (bx, by) = ends
+	dx, dy = bx - ax, by - ay
+	length2 = dx*dx + dy*dy
+	if length2 == 0:
+		return None
+	ts = [((x - ax) * dx + (y - ay) * dy) / length2 for x, y in cover] + [0.0, 1.0]
+	tmin, tmax = min(ts), max(ts)
+	margin = FIT_MARGIN * (tmax - tmin)
+	before = 0 if is_ray else max(0.0, margin - tmin)
+	after = max(0.0, tmax + margin - 1)
+	before, after = [number(math.ceil(100 * x) / 100.0) for x in (before, after)]
+	if is_ray:
+		return "Line(%s,%s,0,%s)" %(args[0], args[1], after)
+	elif before == after:
+		return "Line(%s,%s,%s)" %(args[0], args[1], after)
+	return "Line(%s,%s,%s,%s)" %(args[0], args[1], before, after)
+
+def intersectionValues(diagram):
+	"""(p, q) : [(label, position)] for every IntersectionPoint(p,q,i) with an index i.
+	Taken before culling and pruning, for fitLines: those may drop some of the intersections
+	of a line, which the line must still reach, or the index i of the others would change."""
+	values = OrderedDict()
+	for label, call, p, q, index in indexedIntersections(diagram, diagram.objectList):
+		if diagram[label].value:
+			values.setdefault((p, q), []).append((label, diagram[label].value))
+	return values
+
+def fitLines(diagram, view, report = None, intersections = None):
+	"""Replace the lisf-extended Line() calls, which are far longer than anything drawn, by ones
+	which just cover view = (xmin, xmax, ymin, ymax), plus a margin.  A line is also extended to every point
+	constructed on it (e.g. an intersection outside the view), so those still resolve.
+	intersections, from intersectionValues before any object was removed, adds the positions of
+	all the intersections of p and q to the lines in p and q, while any IntersectionPoint(p,q,i) is left."""
+	xmin, xmax, ymin, ymax = view
+	dx, dy = FIT_MARGIN * (xmax - xmin), FIT_MARGIN * (ymax - ymin)
+	corners = [(x, y) for x in (xmin - dx, xmax + dx) for y in (ymin - dy, ymax + dy)]
+	#Points constructed from each path: the objects depending on it which have positions
+	built_on = {}
+	for label, deps in diagram.dependencies.items():
+		if diagram.has_key(label) and diagram[label].asy_obj_type == "pair" and diagram[label].value:
+			for dep in deps:
+				built_on.setdefault(dep, []).append(diagram[label].value)
+
+	#Each distinct call is fitted once, to what all objects using it need, so equal calls stay equal
+	covers = OrderedDict() #call : points it has to reach
+	for label in diagram.objectList:
+		obj = diagram[label]
+		for call in callsOf(obj.constructor, LINE_REGEX):
+			cover = covers.setdefault(call, list(corners))
+			cover.extend(built_on.get(label, []))
+			if obj.asy_obj_type == "pair" and obj.value:
+				cover.append(obj.value) # e.g. an intersection of an inline Line()
+	for (p, q), members in (intersections or {}).items():
+		if not any(diagram.has_key(label) for label, value in members):
+			continue
+		for path in (p.strip(), q.strip()):
+			texts = [path] + ([diagram[path].constructor] if diagram.has_key(path) else [])
+			for text in texts:
+				for call in callsOf(text, LINE_REGEX):
+					if call in covers:
+						covers[call].extend(value for label, value in members)
+	replacements = {}
+	for call, cover in covers.items():
+		replacement = fittedLine(call, diagram, cover)
+		if replacement is not None:
+			replacements[call] = replacement
+
+	for label in diagram.objectList:
+		obj = diagram[label]
+		constructor = obj.constructor
+		for call in callsOf(constructor, LINE_REGEX):
+			if call in replacements:
+				constructor = constructor.replace(call, replacements[call])
+		if constructor != obj.constructor:
+			obj.constructor = constructor
+	fitted = len(replacements)
+	kept = len(covers) - fitted
+	if report is not None:
+		report["fitlines"] = {"fitted" : fitted, "kept" : kept}
+	return fitted
+# }}}
+
+
+# Dead object elimination {{{
+def neededLabels(diagram, roots):
+	"""roots and everything they depend on, directly or not"""
+	needed = set()
+	stack = list(roots)
+	while stack:
+		label = stack.pop()
+		if label not in needed:
+			needed.add(label)
+			stack.extend(diagram.dependencies.get(label, ()))
+	return needed
+
+def pruneDiagram(diagram, only = None, report = None):
+	"""Remove every object which nothing drawn or labelled needs, even through other objects.
+	If only (a list of labels) is given, keep just those objects and what they need,
+	and the texts among them."""
+	if only:
+		for label in only:
+			if not diagram.has_key(label) and label not in diagram.text_dict:
+				raise DragonError, "No object has label %s" %label
+		roots = [label for label in only if diagram.has_key(label)]
+		for label in diagram.text_dict.keys():
+			if label not in only:
+				del diagram.text_dict[label]
+	else:
+		roots = list(diagram.labelled)
+		for asy_obj_type in diagram.visible:
+			if asy_obj_type != "real": #Reals are never drawn
+				roots.extend(diagram.visible[asy_obj_type])
+	needed = neededLabels(diagram, roots)
+
+	removed = [label for label in diagram.objectList if label not in needed]
+	for label in removed:
+		diagram.dropDependencies(label)
+		diagram.remove(label)
+	if report is not None:
+		report["prune"] = {"removed" : len(removed), "kept" : len(needed)}
+	return len(removed)
+# }}}
+
+
+# Shared intersections {{{
+INTERSECTION_REGEX = re.compile(r"(?<![\w'])IntersectionPoint\(")
+INTERSECTIONS_PREFIX = "_ips"
+
+def indexedIntersections(diagram, labels):
+	"""(label, call, p, q, index) for each IntersectionPoint(p,q,index) call, with a literal
+	index, in the constructors of labels"""
+	for label in labels:
+		for call in callsOf(diagram[label].constructor, INTERSECTION_REGEX):
+			args = splitArguments(call)
+			if len(args) == 3 and args[2].strip().isdigit():
+				yield label, call, args[0], args[1], args[2].strip()
+
+def shareIntersections(diagram, report = None):
+	"""Compute the intersections of two paths once: where IntersectionPoint(p,q,i) is written out
+	for several i (or several times), declare pair[] _ipsN = IntersectionPoints(p,q);
+	just before the first of them and use _ipsN[i] instead."""
+	groups = OrderedDict() #(p, q) : [(label, call, index)]
+	for label, call, p, q, index in indexedIntersections(diagram, emittedLabels(diagram)):
+		groups.setdefault((p, q), []).append((label, call, index))
+
+	shared = replaced = 0
+	for (p, q), uses in groups.items():
+		if len(uses) < 2:
+			continue
+		shared += 1
+		name = INTERSECTIONS_PREFIX + str(shared)
+		while diagram.has_key(name):
+			name += "_"
+		first_user = min((label for label, call, index in uses), key = lambda label: diagram[label]._seq)
+		for label, call, index in uses:
+			diagram[label].constructor = diagram[label].constructor.replace(call, "%s[%s]" %(name, index))
+			replaced += 1
+		diagram.insertBefore(first_user, name, GGBObject(label = name, constructor = "IntersectionPoints(%s,%s)" %(p, q),
+				visible = 0, depend = DEPEND_THRESHOLD, ggb_obj_type = "temporary", asy_obj_type = "pair[]"))
+	if report is not None:
+		report["intersections"] = {"shared" : shared, "calls_replaced" : replaced}
+	return shared
+# }}}
+
+
+# Common subexpression hoisting {{{
+#What each hoistable function returns, which is the type its temporary is declared with
+HOIST_TYPES = {
+	"relpoint" : "pair", "IntersectionPoint" : "pair", "foot" : "pair", "midpoint" : "pair",
+	"bisectorpoint" : "pair", "incenter" : "pair", "circumcenter" : "pair", "orthocenter" : "pair",
+	"centroid" : "pair",
+	"Line" : "path", "circumcircle" : "path", "incircle" : "path", "CirclebyPoint" : "path",
+	"CirclebyRadius" : "path",
+	"distance" : "real", "arclength" : "real",
+	"IntersectionPoints" : "pair[]",
+	}
+CALL_REGEX = re.compile(r"(?<![\w'])(%s)\(" %"|".join(sorted(HOIST_TYPES, key = len, reverse = True)))
+TEMPORARY_PREFIX = "_t"
+
+def findCalls(s, min_size, budget):
+	"""The calls of hoistable functions in s, as (text, function name), innermost ones included.
+	Calls longer than budget characters are not looked at, so each call costs at most budget steps."""
+	calls = []
+	for match in CALL_REGEX.finditer(s):
+		start = match.start()
+		depth = 0
+		for i in xrange(match.end() - 1, min(len(s), start + budget)):
+			if s[i] == "(":
+				depth += 1
+			elif s[i] == ")":
+				depth -= 1
+				if depth == 0:
+					if i + 1 - start >= min_size:
+						calls.append((s[start:i+1], match.group(1)))
+					break
+	return calls
+
+def emittedLabels(diagram):
+	"""Labels of the objects whose constructors end up in the code, in construction order"""
+	return [label for label in diagram.objectList
+			if diagram[label].asy_obj_type in ("pair", "path", "real", "pair[]")
+			and (label in diagram.declared or diagram[label].visible)]
+
+def hoistCommonSubexpressions(diagram, min_size = 12, budget = 400, report = None):
+	"""Bind every call which is written out at least twice to a temporary, declared just before
+	its first use, and refer to the temporary instead.  Longer calls are hoisted first, so a
+	repeated call inside a repeated call is only counted where it is still written out."""
+	users = {} #call text : labels of the objects whose constructors contain it
+	functions = {} #call text : function name
+	def scan(label):
+		for text, name in findCalls(diagram[label].constructor, min_size, budget):
+			users.setdefault(text, set()).add(label)
+			functions[text] = name
+	for label in emittedLabels(diagram):
+		scan(label)
+
+	temporaries = bytes_saved = evaluations_saved = 0
+	for text in sorted(users, key = lambda text: (-len(text), text)):
+		pattern = re.compile(r"(?<![\w'])" + re.escape(text))
+		counts = dict((label, len(pattern.findall(diagram[label].constructor))) for label in users[text])
+		if sum(counts.values()) < 2:
+			continue
+		temporaries += 1
+		name = TEMPORARY_PREFIX + str(temporaries)
+		while diagram.has_key(name):
+			name += "_"
+		asy_obj_type = HOIST_TYPES[functions[text]]
+		first_user = min((label for label in counts if counts[label]), key = lambda label: diagram[label]._seq)
+		for label in counts:
+			if counts[label]:
+				diagram[label].constructor = pattern.sub(name, diagram[label].constructor)
+		diagram.insertBefore(first_user, name, GGBObject(label = name, constructor = text,
+				visible = 0, depend = DEPEND_THRESHOLD, ggb_obj_type = "temporary", asy_obj_type = asy_obj_type))
+		scan(name) # The calls inside it are now written out once more, in the temporary
+		uses = sum(counts.values())
+		evaluations_saved += uses - 1
+		bytes_saved += uses * (len(text) - len(name)) - len("%s %s = %s;\n" %(asy_obj_type, name, text))
+
+	if report is not None:
+		report["hoist"] = {"temporaries" : temporaries, "bytes_saved" : bytes_saved,
+				"evaluations_saved" : evaluations_saved}
+	return temporaries
+# }}}
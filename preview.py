@@ -0,0 +1,255 @@
+"""preview.py
+A quick SVG preview of a compiled diagram, drawn in Python without Asymptote (--preview, or BACKEND svg).
+Nothing is evaluated the way Asymptote would: positions come from the coordinates GeoGebra stored
+(GGBObject.value), so the preview shows the diagram as it was saved.  Points, segments, polygons,
+lines and rays (clipped to the view), circles, angle marks, labels and texts are drawn, with the
+colours, widths and dashes parsed from each <element>; other conics are left out."""
+
+import re
+import math
+from xml.sax.saxutils import escape
+
+from optimize import LINE_REGEX, splitArguments, callsOf
+from labels import toBigPoints, labelExtent
+
+VIEW_MARGIN = 0.1 #Fraction of the extent added around the points when there is no view
+DEFAULT_WIDTH = 0.5 #bp, Asymptote's defaultpen
+DOT_FACTOR = 6 #Asymptote's dotfactor: dots are this many line widths across
+MARK_SIZE = 0.24 #Angle marks, in diagram units: olympiad's markscalefactor * 8
+RIGHT_ANGLE_COSINE = 1 / 2011.0 #As in constructs.Angle
+
+#Asymptote's dash patterns, in units of the line width
+DASHES = {
+	"dashed" : [8, 8],
+	"dotted" : [0, 4],
+	"dashdotted" : [8, 8, 0, 8],
+	}
+COMPASS = {"N" : 90, "S" : 270, "E" : 0, "W" : 180, "NE" : 45, "NW" : 135, "SE" : 315, "SW" : 225}
+
+PAIR_REGEX = re.compile(r"^\(\s*([-+\d.eE]+)\s*,\s*([-+\d.eE]+)\s*\)$")
+RGB_REGEX = re.compile(r"rgb\(([\d.]+),([\d.]+),([\d.]+)\)")
+LINEWIDTH_REGEX = re.compile(r"linewidth\(([\d.]+)\)")
+LINETYPE_REGEX = re.compile(r'linetype\("([\d. ]+)"\)')
+DIR_REGEX = re.compile(r"dir\(\s*([-+\d.eE]+)\s*\)")
+ANGLEMARK_REGEX = re.compile(r"(?<![\w'])(right)?anglemark\(")
+
+
+def pointOf(diagram, text):
+	"""The position of text, a label or a literal pair, or None"""
+	text = text.strip()
+	if diagram.has_key(text):
+		return diagram[text].value if diagram[text].asy_obj_type == "pair" else None
+	match = PAIR_REGEX.match(text)
+	if match:
+		return (float(match.group(1)), float(match.group(2)))
+	return None
+
+def clipSegment(p, q, view):
+	"""The part of the segment pq inside view (Liang-Barsky), or None"""
+	xmin, xmax, ymin, ymax = view
+	t0, t1 = 0.0, 1.0
+	dx, dy = q[0] - p[0], q[1] - p[1]
+	for d, low, high in ((dx, xmin - p[0], xmax - p[0]), (dy, ymin - p[1], ymax - p[1])):
+		if d == 0:
+			if low > 0 or high < 0:
+				return None
+			continue
+		a, b = low / float(d), high / float(d)
+		if a > b:
+			a, b = b, a
+		t0, t1 = max(t0, a), min(t1, b)
+		if t0 > t1:
+			return None
+	return (p[0] + t0 * dx, p[1] + t0 * dy), (p[0] + t1 * dx, p[1] + t1 * dy)
+
+def linePoints(obj, diagram, view):
+	"""The ends of a line or ray, clipped to view, or None"""
+	a, b, c = obj.value
+	norm2 = a*a + b*b
+	if norm2 == 0:
+		return None
+	xmin, xmax, ymin, ymax = view
+	reach = 2 * math.hypot(xmax - xmin, ymax - ymin) + math.hypot(xmin + xmax, ymin + ymax)
+	foot = (-a * c / norm2, -b * c / norm2)
+	u = (-b / math.sqrt(norm2), a / math.sqrt(norm2))
+	start = (foot[0] - reach * u[0], foot[1] - reach * u[1])
+	end = (foot[0] + reach * u[0], foot[1] + reach * u[1])
+	if obj.ggb_obj_type == "ray":
+		for call in callsOf(obj.constructor, LINE_REGEX):
+			args = splitArguments(call)
+			if len(args) == 4 and args[2].strip() == "0":
+				P, Q = pointOf(diagram, args[0]), pointOf(diagram, args[1])
+				if P is not None:
+					if Q is not None and (Q[0] - P[0]) * u[0] + (Q[1] - P[1]) * u[1] < 0:
+						end = start
+					start = P
+				break
+	return clipSegment(start, end, view)
+
+def circleOf(value):
+	"""(center, radius) of a conic which is a circle, or None"""
+	A0, A1, A2, A3, A4, A5 = value
+	if A0 == 0 or abs(A0 - A1) > 1e-9 * abs(A0) or abs(A3) > 1e-9 * abs(A0):
+		return None
+	x, y = -A4 / A0, -A5 / A0
+	r2 = x*x + y*y - A2 / A0
+	if r2 <= 0:
+		return None
+	return (x, y), math.sqrt(r2)
+
+def strokeOf(obj):
+	"""SVG stroke attributes for the pen of obj"""
+	color = "black"
+	width = DEFAULT_WIDTH
+	if obj.color:
+		match = RGB_REGEX.search(obj.color)
+		if match:
+			color = "rgb(%d,%d,%d)" %tuple(int(round(255 * float(v))) for v in match.groups())
+	if obj.thick:
+		match = LINEWIDTH_REGEX.search(obj.thick)
+		if match:
+			width = float(match.group(1))
+	attributes = 'stroke="%s" stroke-width="%g" fill="none"' %(color, width)
+	dashes = None
+	if obj.style:
+		match = LINETYPE_REGEX.search(obj.style)
+		dashes = [float(v) for v in match.group(1).split()] if match else DASHES.get(obj.style)
+	if dashes:
+		attributes += ' stroke-dasharray="%s" stroke-linecap="round"' %" ".join("%g" %max(v * width, 0.01) for v in dashes)
+	return attributes
+
+def labelDirection(location):
+	"""The angle in degrees of a label location such as "lsf * dir(30)" or "lsf * NE" """
+	match = DIR_REGEX.search(location)
+	if match:
+		return float(match.group(1))
+	for word in re.findall(r"[A-Z]+", location):
+		if word in COMPASS:
+			return COMPASS[word]
+	return 45.0
+
+def labelText(text):
+	"""A label or text as plain characters: quotes, dollar signs and braces dropped"""
+	text = text.strip()
+	if len(text) >= 2 and text[0] == text[-1] == '"':
+		text = text[1:-1]
+	return text.replace("$", "").replace("{", "").replace("}", "").replace("\\", "")
+
+def pathPoints(diagram, obj):
+	"""The corners of a path written as P--Q--..., possibly ending in cycle, or None"""
+	parts = obj.constructor.split("--")
+	if len(parts) < 2:
+		return None
+	closed = parts[-1].strip() == "cycle"
+	if closed:
+		parts = parts[:-1]
+	points = [pointOf(diagram, part) for part in parts]
+	if None in points:
+		return None
+	return points, closed
+
+def drawPreview(diagram, label_locations = {}, opts = {}, view = None, out = None):
+	"""Write an SVG picture of diagram to the file-like out, or return it as a string if out is not given.
+	Called like diagram.drawDiagram, so it can be a backend (see converter.BACKENDS)."""
+	parts = []
+	write = parts.append
+
+	positions = [diagram[label].value for label in diagram.objectList
+			if diagram[label].asy_obj_type == "pair" and diagram[label].value is not None]
+	if view is None:
+		if positions:
+			xs, ys = [p[0] for p in positions], [p[1] for p in positions]
+			margin = VIEW_MARGIN * max(max(xs) - min(xs), max(ys) - min(ys), 1.0)
+			view = (min(xs) - margin, max(xs) + margin, min(ys) - margin, max(ys) + margin)
+		else:
+			view = (-1.0, 1.0, -1.0, 1.0)
+	xmin, xmax, ymin, ymax = view
+	scale = toBigPoints(opts.get('IMG_SIZE', "11cm"), 312.0) / (max(xmax - xmin, ymax - ymin) or 1.0)
+	width, height = (xmax - xmin) * scale, (ymax - ymin) * scale
+	font_size = toBigPoints(opts.get('FONT_SIZE', "10pt"))
+	lsf = float(opts.get('LABEL_SCALE_FACTOR', 0.8))
+	place = lambda p: ((p[0] - xmin) * scale, (ymax - p[1]) * scale) # Diagram to SVG coordinates
+	to = lambda p: "%.2f,%.2f" %place(p)
+
+	write('<svg xmlns="http://www.w3.org/2000/svg" width="%.2fpt" height="%.2fpt" viewBox="0 0 %.2f %.2f">\n' %(width, height, width, height))
+	write('<rect width="100%" height="100%" fill="white"/>\n')
+
+	#Paths
+	for label in diagram.visibleOfType("path"):
+		obj = diagram[label]
+		stroke = strokeOf(obj)
+		if obj.ggb_obj_type == "angle":
+			for call in callsOf(obj.constructor, ANGLEMARK_REGEX)[:1]:
+				points = [pointOf(diagram, arg) for arg in splitArguments(call)[:3]]
+				if None not in points:
+					write(angleMark(points, stroke, to, scale))
+			continue
+		if obj.ggb_obj_type in ("line", "ray") and obj.value is not None:
+			ends = linePoints(obj, diagram, view)
+			if ends is not None:
+				write('<path d="M %s L %s" %s/>\n' %(to(ends[0]), to(ends[1]), stroke))
+			continue
+		if obj.ggb_obj_type == "conic" and obj.value is not None:
+			circle = circleOf(obj.value)
+			if circle is not None:
+				center, radius = circle
+				write('<circle cx="%.2f" cy="%.2f" r="%.2f" %s/>\n' %(place(center) + (radius * scale, stroke)))
+			continue
+		corners = pathPoints(diagram, obj)
+		if corners is not None:
+			points, closed = corners
+			write('<path d="M %s%s" %s/>\n' %(" L ".join(to(p) for p in points), " Z" if closed else "", stroke))
+
+	#Dots
+	for label in diagram.visibleOfType("pair"):
+		if diagram[label].value is not None:
+			write('<circle cx="%.2f" cy="%.2f" r="%g" fill="black"/>\n' %(place(diagram[label].value) + (DOT_FACTOR * DEFAULT_WIDTH / 2,)))
+
+	#Labels, each set off from its point in its direction, as in labels.py
+	for label in diagram.labelled:
+		P = diagram[label].value
+		if P is None:
+			continue
+		angle = math.radians(labelDirection(label_locations.get(label, "lsf * dir(45)")))
+		u = (math.cos(angle), math.sin(angle))
+		half_width, half_height = [extent / 2 for extent in labelExtent(diagram[label].label, font_size)]
+		reach = lsf * font_size / 2 + abs(u[0]) * half_width + abs(u[1]) * half_height
+		x, y = place(P)
+		write(textElement(x + reach * u[0], y - reach * u[1], labelText(diagram[label].label), font_size, italic = 1))
+	for text_item in diagram.text_dict.itervalues():
+		try:
+			x, y = place((float(text_item["x"]), float(text_item["y"])))
+		except ValueError:
+			continue
+		write(textElement(x, y, labelText(text_item["text"]), font_size))
+	write('</svg>\n')
+
+	if out is None:
+		return "".join(parts)
+	for part in parts:
+		out.write(part)
+
+def angleMark(points, stroke, to, scale):
+	"""The SVG for anglemark(A,B,C), or a right angle mark if ABC is (nearly) right"""
+	A, B, C = points
+	u = (A[0] - B[0], A[1] - B[1])
+	v = (C[0] - B[0], C[1] - B[1])
+	lu, lv = math.hypot(*u), math.hypot(*v)
+	if lu == 0 or lv == 0:
+		return ""
+	u, v = (u[0] / lu, u[1] / lu), (v[0] / lv, v[1] / lv)
+	if abs(u[0] * v[0] + u[1] * v[1]) < RIGHT_ANGLE_COSINE:
+		corner = lambda s, t: (B[0] + MARK_SIZE * (s * u[0] + t * v[0]), B[1] + MARK_SIZE * (s * u[1] + t * v[1]))
+		return '<path d="M %s L %s L %s" %s/>\n' %(to(corner(1, 0)), to(corner(1, 1)), to(corner(0, 1)), stroke)
+	start = (B[0] + MARK_SIZE * u[0], B[1] + MARK_SIZE * u[1])
+	end = (B[0] + MARK_SIZE * v[0], B[1] + MARK_SIZE * v[1])
+	large = 1 if u[0] * v[1] - u[1] * v[0] < 0 else 0 # Counterclockwise from BA to BC, as Asymptote does
+	return '<path d="M %s A %.2f %.2f 0 %d 1 %s" %s/>\n' %(to(start), MARK_SIZE * scale, MARK_SIZE * scale, large, to(end), stroke)
+
+def textElement(x, y, text, font_size, italic = 0):
+	#Anything beyond ASCII (e.g. a label alpha) becomes a character reference, so the SVG is plain bytes
+	if isinstance(text, str):
+		text = text.decode("utf-8", "replace")
+	text = escape(text).encode("ascii", "xmlcharrefreplace")
+	return '<text x="%.2f" y="%.2f" font-size="%g" font-family="serif"%s text-anchor="middle" dominant-baseline="central">%s</text>\n' \
+			%(x, y, font_size, ' font-style="italic"' if italic else "", text)
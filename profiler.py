@@ -0,0 +1,157 @@
+"""profiler.py
+Instrumentation for --profile: wall and CPU time per stage of a conversion, calls and time per
+constructs function, tokens per expression, the largest constructors and peak memory.
+Nothing is measured unless a Profiler is made active, and the hooks elsewhere cost one
+global lookup when none is, so the instrumentation can stay in place."""
+
+import sys
+import time
+import resource
+from collections import OrderedDict
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+active = None #The Profiler in use, if any
+
+class _NullStage():
+	def __enter__(self):
+		pass
+	def __exit__(self, *exc_info):
+		return False
+_NULL_STAGE = _NullStage()
+
+def stage(name):
+	"""with stage("draw"): ... times the block under name, if profiling"""
+	if active is None:
+		return _NULL_STAGE
+	return active.stage(name)
+
+def timed(iterable, name):
+	"""iterable, with the time spent producing each item counted under name, if profiling"""
+	if active is None:
+		return iterable
+	return active.timed(iterable, name)
+
+
+class _Stage():
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+	def __enter__(self):
+		self.profiler._open.append([time.time(), time.clock(), 0.0, 0.0])
+	def __exit__(self, *exc_info):
+		self.profiler._close(self.name)
+		return False
+
+
+class Profiler():
+	"""Collects the measurements.  Stages may nest; each is charged only for its own time,
+	not for the stages inside it."""
+	def __init__(self, top = 10):
+		self.top = top
+		self.stages = OrderedDict() #name : [wall seconds, cpu seconds, times entered]
+		self.constructs = {} #constructs function name : [calls, seconds]
+		self.expressions = [] #(number of tokens, expression)
+		self.constructors = [] #(length, label) of the largest ones
+		self._open = [] #[wall start, cpu start, wall in children, cpu in children] per open stage
+		self._peak_kb = 0
+
+	def start(self):
+		global active
+		active = self
+		if tracemalloc is not None:
+			tracemalloc.start()
+		return self
+
+	def stop(self):
+		global active
+		if tracemalloc is not None:
+			self._peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+			tracemalloc.stop()
+		else:
+			self._peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		active = None
+
+	def stage(self, name):
+		return _Stage(self, name)
+
+	def _close(self, name):
+		wall_start, cpu_start, wall_children, cpu_children = self._open.pop()
+		wall = time.time() - wall_start
+		cpu = time.clock() - cpu_start
+		entry = self.stages.setdefault(name, [0.0, 0.0, 0])
+		entry[0] += wall - wall_children
+		entry[1] += cpu - cpu_children
+		entry[2] += 1
+		if self._open:
+			self._open[-1][2] += wall
+			self._open[-1][3] += cpu
+
+	def timed(self, iterable, name):
+		iterator = iter(iterable)
+		while True:
+			with self.stage(name):
+				try:
+					item = iterator.next()
+				except StopIteration:
+					return
+			yield item
+
+	def call(self, name, function, *args, **kwargs):
+		"""function(*args, **kwargs), counted as the constructs function name"""
+		start = time.time()
+		with self.stage("constructs"):
+			result = function(*args, **kwargs)
+		entry = self.constructs.setdefault(name, [0, 0.0])
+		entry[0] += 1
+		entry[1] += time.time() - start
+		return result
+
+	def expression(self, s, number_of_tokens):
+		self.expressions.append((number_of_tokens, s))
+
+	def diagram(self, diagram):
+		"""Note the largest constructors of diagram"""
+		sizes = [(len(diagram[label].constructor), label) for label in diagram.objectList]
+		self.constructors = sorted(sizes, reverse = True)[:self.top]
+
+	def report(self, stream = None):
+		if stream is None:
+			stream = sys.stderr
+		write = lambda line = "": stream.write(line + "\n")
+		write("== Stages ==")
+		write("%-20s %10s %10s %8s" %("stage", "wall", "cpu", "count"))
+		for name, (wall, cpu, count) in self.stages.items():
+			write("%-20s %9.4fs %9.4fs %8d" %(name, wall, cpu, count))
+		total_wall = sum(entry[0] for entry in self.stages.values())
+		total_cpu = sum(entry[1] for entry in self.stages.values())
+		write("%-20s %9.4fs %9.4fs" %("total", total_wall, total_cpu))
+
+		write()
+		write("== Constructs (by cumulative time) ==")
+		write("%-24s %8s %10s %12s" %("function", "calls", "cumulative", "per call"))
+		for name, (calls, seconds) in sorted(self.constructs.items(), key = lambda item: -item[1][1]):
+			write("%-24s %8d %9.4fs %10.1fus" %(name, calls, seconds, 1e6 * seconds / calls))
+
+		write()
+		write("== Expressions ==")
+		if self.expressions:
+			counts = [count for count, s in self.expressions]
+			write("%d parsed, %d tokens, %.1f tokens on average, %d at most" %(len(counts), sum(counts),
+					float(sum(counts)) / len(counts), max(counts)))
+			for count, s in sorted(self.expressions, reverse = True)[:self.top]:
+				write("%6d  %s" %(count, s if len(s) <= 70 else s[:67] + "..."))
+		else:
+			write("none")
+
+		write()
+		write("== Largest constructors ==")
+		for length, label in self.constructors:
+			write("%6d  %s" %(length, label))
+
+		write()
+		write("== Memory ==")
+		write("peak %.1f MB (%s)" %(self._peak_kb / 1024.0, "tracemalloc" if tracemalloc is not None else "ru_maxrss"))
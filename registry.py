@@ -0,0 +1,125 @@
+"""registry.py
+The table of GeoGebra commands Dragon knows, built once at import from constructs.py.
+A command is a function with two attributes: ggb_return_type, the GGB type it returns (or a
+function of the arguments giving it), and ggb_arity, the (fewest, most) arguments it takes, most
+being None for no limit.  Plugin modules, named with --plugin, provide more commands the same way.
+They never change the table of constructs.py: pluginRegistry gives a separate table with them
+added, which the conversion asking for them uses."""
+
+import os
+import hashlib
+import threading
+import importlib
+
+import constructs
+from constants import INFIX_OPERATOR_DICT, STRING_TYPE
+from errors import DragonError
+
+class Command():
+	"""One GeoGebra command: its name, the function emitting Asymptote code, arity and return type"""
+	def __init__(self, name, function, arity, return_type):
+		self.name = name
+		self.function = function
+		self.min_args, self.max_args = arity
+		self.return_type = return_type
+		self.static_type = type(return_type) == STRING_TYPE
+
+	def accepts(self, number_args):
+		return self.min_args <= number_args and (self.max_args is None or number_args <= self.max_args)
+
+	def arityText(self):
+		if self.max_args is None:
+			return "at least %d" %self.min_args
+		if self.min_args == self.max_args:
+			return "%d" %self.min_args
+		return "%d to %d" %(self.min_args, self.max_args)
+
+	def returnType(self, *args, **kwargs):
+		if self.static_type:
+			return self.return_type
+		return self.return_type(*args, **kwargs)
+
+	def __repr__(self):
+		return "<Command %s[%s]>" %(self.name, self.arityText())
+
+
+def sourceHash(module):
+	"""A hash of the source file of module (or of its compiled file, if that is all there is)"""
+	filename = getattr(module, "__file__", None)
+	if not filename:
+		return ""
+	if filename.endswith((".pyc", ".pyo")) and os.path.isfile(filename[:-1]):
+		filename = filename[:-1]
+	f = open(filename, "rb")
+	try:
+		return hashlib.sha256(f.read()).hexdigest()
+	finally:
+		f.close()
+
+
+class CommandRegistry():
+	"""name : Command.  plugins are the names of the plugin modules registered, if any, and key
+	is (name, sourceHash) for each of them: caches of anything the commands produced include it.
+	Filled in once, then only read, so it is safe to share between threads."""
+	def __init__(self, plugins = ()):
+		self._commands = {}
+		self.plugins = tuple(plugins)
+		self.key = ()
+
+	def register(self, name, function):
+		if not hasattr(function, "ggb_arity"):
+			raise DragonError, "Command %s has no ggb_arity" %name
+		self._commands[name] = Command(name, function, function.ggb_arity, function.ggb_return_type)
+
+	def registerModule(self, module):
+		"""Register every function of module which has a ggb_return_type"""
+		for name, value in vars(module).items():
+			if callable(value) and hasattr(value, "ggb_return_type"):
+				self.register(name, value)
+
+	def withPlugins(self, names):
+		"""A new registry with the commands of this one and those of the plugin modules names"""
+		registry = CommandRegistry(self.plugins + tuple(names))
+		registry._commands = dict(self._commands)
+		registry.key = self.key
+		for name in names:
+			try:
+				module = importlib.import_module(name)
+			except ImportError, e:
+				raise DragonError, "Could not load the plugin %s: %s" %(name, e)
+			registry.registerModule(module)
+			registry.key += ((name, sourceHash(module)),)
+		return registry
+
+	def get(self, name):
+		"""The Command called name, or None"""
+		return self._commands.get(name)
+
+	def __contains__(self, name):
+		return name in self._commands
+
+	def names(self):
+		return sorted(self._commands)
+
+
+commands = CommandRegistry()
+commands.registerModule(constructs)
+
+_plugin_registries = {} #tuple of plugin names : registry with them
+_plugin_lock = threading.Lock()
+
+def pluginRegistry(names):
+	"""commands plus the plugin modules names (a list, or a comma-separated string).
+	The registry for each list of plugins is built once; without plugins, it is commands itself."""
+	if isinstance(names, basestring):
+		names = names.split(",")
+	names = tuple(name.strip() for name in names if name.strip())
+	if not names:
+		return commands
+	with _plugin_lock:
+		if names not in _plugin_registries:
+			_plugin_registries[names] = commands.withPlugins(names)
+		return _plugin_registries[names]
+
+#Infix operators by their names in INFIX_OPERATOR_DICT, e.g. op_plus
+operators = dict((entry["name"], getattr(constructs, entry["name"])) for entry in INFIX_OPERATOR_DICT.values())
@@ -0,0 +1,115 @@
+"""render.py
+Optional last stage: runs Asymptote on the generated code to get a PDF or SVG.
+Artifacts are cached by a hash of the complete source (which includes the preamble, size and
+font) and of the asy executable and its version, so re-rendering byte-identical code costs nothing,
+while a different or upgraded Asymptote renders afresh.  At most a given number of asy
+processes run at once, however many threads ask for renders."""
+
+import os
+import errno
+import shutil
+import threading
+import subprocess
+from distutils.spawn import find_executable
+from multiprocessing.pool import ThreadPool
+
+from cache import DiskCache, defaultCacheDirectory, hashKey
+from errors import RenderError
+
+RENDER_FORMATS = ("pdf", "svg", "eps", "png")
+RENDER_CACHE_SIZE = 512 #Megabytes
+RENDER_ATTEMPTS = 3 #renders of the same code renderTo tries, if the cache keeps losing the artifact
+
+
+class AsyRenderer():
+	"""Renders Asymptote source with the asy executable, through a DiskCache.
+	workers bounds the number of simultaneous asy processes."""
+	def __init__(self, asy = "asy", workers = 2, cache_dir = None, max_bytes = RENDER_CACHE_SIZE * 2**20):
+		self.asy = asy
+		self.workers = max(1, workers)
+		self.cache = DiskCache(cache_dir or os.path.join(defaultCacheDirectory(), "render"), max_bytes)
+		self._slots = threading.BoundedSemaphore(self.workers)
+		self._asy_key = None
+		self.rendered = 0
+
+	def asyKey(self):
+		"""The resolved path of the asy executable and what asy --version says, for the cache key.
+		Found on the first render; raises RenderError if asy cannot be run."""
+		if self._asy_key is None:
+			path = find_executable(self.asy) if os.path.basename(self.asy) == self.asy else self.asy
+			path = os.path.realpath(path or self.asy)
+			try:
+				process = subprocess.Popen([path, "--version"], stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+			except OSError, e:
+				raise RenderError, "Could not run %s: %s" %(self.asy, e)
+			self._asy_key = hashKey(path, process.communicate()[0])
+		return self._asy_key
+
+	def render(self, code, fmt = "pdf"):
+		"""Path of the artifact for code, rendering it first if it is not cached.
+		The path is inside the cache; copy it elsewhere to keep it."""
+		if fmt not in RENDER_FORMATS:
+			raise ValueError, "Cannot render to %s; use one of %s" %(fmt, ", ".join(RENDER_FORMATS))
+		if isinstance(code, unicode):
+			code = code.encode("utf-8")
+		key = hashKey(code, fmt, self.asyKey())
+		path = self.cache.lookup(key, "." + fmt)
+		if path is not None:
+			return path
+		with self._slots:
+			path = self.cache.lookup(key, "." + fmt) # Another thread may have just made it
+			if path is not None:
+				return path
+			return self._run(code, fmt, key)
+
+	def renderTo(self, code, filename, fmt = None):
+		"""Render code into filename, whose extension gives the format if fmt is not given"""
+		fmt = fmt or os.path.splitext(filename)[1][1:]
+		for attempt in range(RENDER_ATTEMPTS):
+			path = self.render(code, fmt)
+			try:
+				artifact = open(path, "rb")
+			except IOError, e:
+				if e.errno != errno.ENOENT:
+					raise
+				continue # Evicted by another process since render() found it; render it again
+			try:
+				f = open(filename, "wb")
+				try:
+					shutil.copyfileobj(artifact, f)
+				finally:
+					f.close()
+			finally:
+				artifact.close()
+			return filename
+		raise RenderError, "The render of %s kept being evicted from the cache; is the cache too small?" %filename
+
+	def renderMany(self, codes, fmt = "pdf"):
+		"""Paths of the artifacts of a list of sources, rendered in parallel"""
+		pool = ThreadPool(self.workers)
+		try:
+			return pool.map(lambda code: self.render(code, fmt), codes)
+		finally:
+			pool.close()
+			pool.join()
+
+	def _run(self, code, fmt, key):
+		workdir = self.cache.tempDirectory()
+		try:
+			source = os.path.join(workdir, "diagram.asy")
+			f = open(source, "wb")
+			f.write(code)
+			f.close()
+			try:
+				process = subprocess.Popen([self.asy, "-f", fmt, "-o", "diagram", "diagram.asy"], cwd = workdir,
+						stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+			except OSError, e:
+				raise RenderError, "Could not run %s: %s" %(self.asy, e)
+			output = process.communicate()[0]
+			artifact = os.path.join(workdir, "diagram." + fmt)
+			if process.returncode != 0 or not os.path.exists(artifact):
+				raise RenderError, "%s failed (exit status %d):\n%s" %(self.asy, process.returncode, output.strip())
+			self.rendered += 1
+			return self.cache.storeFile(key, "." + fmt, artifact)
+		finally:
+			shutil.rmtree(workdir, ignore_errors = True)
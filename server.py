@@ -0,0 +1,238 @@
+"""server.py
+A long-running conversion daemon, so that editors need not start Python for every save.
+Listens on localhost HTTP or on a Unix socket; conversions run on a pool of worker processes
+which have the parser and constructs loaded once.
+
+	POST /convert	body: the .ggb file; options (those of CLIENT_OPTIONS) in the query string,
+			e.g. /convert?CONCISE_MODE=1&IMG_SIZE=8cm.  Or, with Content-Type application/json,
+			{"ggb": <base64 of the .ggb file>, "options": {...}}.
+			Returns the Asymptote code as text/plain, or a JSON error with status 400.
+	GET /health	JSON with uptime, request counts and latency percentiles.
+
+python -m dragon serve [--port PORT | --socket PATH] [--workers N]"""
+
+import os
+import sys
+import stat
+import json
+import time
+import base64
+import argparse
+import threading
+import traceback
+import urlparse
+import multiprocessing
+from collections import deque
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn, UnixStreamServer
+
+from converter import convert
+from errors import DragonError, ConfigError
+from manifest import checkedOption
+from constants import SHORT_NAME, VERSION_NUMBER
+
+LATENCY_WINDOW = 1000 #number of recent requests the percentiles are computed over
+
+#The options a client may set.  CONFIG_FILENAME, which names a file on the server, is left out:
+#that belongs to whoever starts the server, as do plugins, which are not options at all.
+CLIENT_OPTIONS = frozenset([
+	'IMG_SIZE', 'LINE_SCALE_FACTOR', 'LABEL_SCALE_FACTOR', 'FONT_SIZE',
+	'CLIP_IMG', 'CONCISE_MODE', 'CSE_MODE', 'CSE_COLORS', 'BACKEND',
+	'NUMERIC_MODE', 'CULL_MODE', 'PRUNE_MODE', 'ONLY_LABELS', 'FIT_LINES', 'SHARE_INTERSECTIONS',
+	'AUTO_LABELS', 'HOIST_MODE', 'HOIST_MIN_SIZE', 'HOIST_BUDGET',
+	])
+
+
+def checkedOptions(options):
+	"""options converted to the types of their defaults, as manifest.checkedOption does, if a client
+	may set all of them; raises ConfigError otherwise.  Values are strings, as in a query string
+	(1, 0.8, 8cm), or JSON values."""
+	refused = [key for key in options if key not in CLIENT_OPTIONS]
+	if refused:
+		raise ConfigError, "Options which cannot be set by a request: %s" %", ".join(sorted(refused))
+	checked = {}
+	for key, val in options.items():
+		if isinstance(val, unicode):
+			val = val.encode("utf-8")
+		elif not isinstance(val, str):
+			val = repr(val) # A JSON number or boolean, which checkedOption reads back
+		name, value = checkedOption(key, val, "request")
+		checked[name] = value
+	return checked
+
+def _convertRequest(job):
+	"""Worker: convert one payload.  Return value: (HTTP status, content type, body)"""
+	payload, options = job
+	try:
+		# A file object, so that the payload is never mistaken for a filename
+		return (200, "text/plain; charset=utf-8", convert(StringIO(payload), **options))
+	except DragonError, e:
+		return (400, "application/json", json.dumps({"error" : e.__class__.__name__, "message" : str(e)}))
+	except Exception, e:
+		return (500, "application/json", json.dumps({"error" : e.__class__.__name__, "message" : str(e),
+				"traceback" : traceback.format_exc()}))
+
+
+class RequestStats():
+	"""Counts requests and keeps the latencies of the most recent ones.  Thread-safe."""
+	def __init__(self, window = LATENCY_WINDOW):
+		self.started = time.time()
+		self.requests = 0
+		self.errors = 0
+		self._latencies = deque(maxlen = window)
+		self._lock = threading.Lock()
+
+	def record(self, seconds, ok):
+		with self._lock:
+			self.requests += 1
+			if not ok:
+				self.errors += 1
+			self._latencies.append(seconds)
+
+	def report(self):
+		with self._lock:
+			latencies = sorted(self._latencies)
+			report = {"uptime" : round(time.time() - self.started, 3),
+					"requests" : self.requests, "errors" : self.errors}
+		for name, fraction in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99)]:
+			if latencies:
+				index = min(len(latencies) - 1, int(fraction * len(latencies)))
+				report["latency_" + name] = round(latencies[index], 6)
+			else:
+				report["latency_" + name] = None
+		return report
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+	server_version = "%s/%s" %(SHORT_NAME, VERSION_NUMBER)
+
+	def do_GET(self):
+		if urlparse.urlparse(self.path).path == "/health":
+			report = self.server.stats.report()
+			report["status"] = "ok"
+			report["workers"] = self.server.workers
+			self.reply(200, "application/json", json.dumps(report, sort_keys = True))
+		else:
+			self.reply(404, "application/json", json.dumps({"error" : "NotFound", "message" : self.path}))
+
+	def do_POST(self):
+		start = time.time()
+		url = urlparse.urlparse(self.path)
+		if url.path != "/convert":
+			self.reply(404, "application/json", json.dumps({"error" : "NotFound", "message" : self.path}))
+			return
+		try:
+			payload, options = self.readRequest(url)
+		except (ValueError, ConfigError), e:
+			status, content_type, body = 400, "application/json", json.dumps({"error" : "BadRequest", "message" : str(e)})
+		else:
+			status, content_type, body = self.server.pool.apply(_convertRequest, [(payload, options)])
+		self.reply(status, content_type, body)
+		self.server.stats.record(time.time() - start, status == 200)
+
+	def readRequest(self, url):
+		"""Return value: (contents of the .ggb file, option dictionary)"""
+		body = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+		if self.headers.gettype() == "application/json":
+			request = json.loads(body)
+			if not isinstance(request, dict) or "ggb" not in request:
+				raise ValueError, "The JSON body should be an object with the key ggb"
+			options = request.get("options", {})
+			if not isinstance(options, dict):
+				raise ValueError, "options should be a JSON object"
+			if not isinstance(request["ggb"], basestring):
+				raise ValueError, "ggb should be a base64 string"
+			try:
+				payload = base64.b64decode(request["ggb"])
+			except TypeError, e:
+				raise ValueError, "ggb is not valid base64: %s" %e
+			options = dict((str(key), val) for key, val in options.items())
+			return payload, checkedOptions(options)
+		options = {}
+		for key, values in urlparse.parse_qs(url.query).items():
+			options[key] = values[-1]
+		return body, checkedOptions(options)
+
+	def reply(self, status, content_type, body):
+		if isinstance(body, unicode):
+			body = body.encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def address_string(self):
+		# Unix sockets have no client address
+		return self.client_address[0] if self.client_address else "unix"
+
+	def log_message(self, format, *args):
+		if not self.server.quiet:
+			BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+	daemon_threads = True
+	def server_bind(self):
+		UnixStreamServer.server_bind(self)
+		self.server_name = "localhost"
+		self.server_port = 0
+
+
+def makeServer(host = "127.0.0.1", port = 8011, socket_path = None, workers = None, quiet = False):
+	"""Create (but don't start) the server; call serve_forever() on the result.
+	A socket left at socket_path by a previous run is replaced; anything else there raises ValueError."""
+	if socket_path:
+		try:
+			mode = os.stat(socket_path).st_mode
+		except OSError:
+			mode = None
+		if mode is not None:
+			if not stat.S_ISSOCK(mode):
+				raise ValueError, "%s exists and is not a socket" %socket_path
+			os.remove(socket_path) # Left over from a previous run
+		server = ThreadingUnixHTTPServer(socket_path, ConversionHandler)
+	else:
+		server = ThreadingHTTPServer((host, port), ConversionHandler)
+	server.workers = workers or multiprocessing.cpu_count()
+	server.pool = multiprocessing.Pool(server.workers)
+	server.stats = RequestStats()
+	server.quiet = quiet
+	return server
+
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(prog = "dragon serve",
+			description = "Serve conversions over HTTP on localhost or a Unix socket.")
+	parser.add_argument('--host', default = "127.0.0.1",
+			help = "Address to listen on.  Defaults to 127.0.0.1.")
+	parser.add_argument('--port', type = int, default = 8011,
+			help = "TCP port to listen on.  Defaults to 8011.")
+	parser.add_argument('--socket', dest = "socket_path", metavar = "PATH", default = None,
+			help = "Listen on this Unix socket instead of TCP.")
+	parser.add_argument('--workers', type = int, default = 0,
+			help = "Number of worker processes.  Defaults to the number of CPUs.")
+	parser.add_argument('--quiet', action = "store_true",
+			help = "Don't log every request to stderr.")
+	args = parser.parse_args(argv)
+
+	try:
+		server = makeServer(args.host, args.port, args.socket_path, args.workers, args.quiet)
+	except ValueError, e:
+		parser.error(str(e))
+	where = args.socket_path or "http://%s:%d" %(args.host, args.port)
+	print >>sys.stderr, "%s %s serving on %s with %d workers" %(SHORT_NAME, VERSION_NUMBER, where, server.workers)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		server.pool.terminate()
+		if args.socket_path and os.path.exists(args.socket_path):
+			os.remove(args.socket_path)
+	return 0
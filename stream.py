@@ -0,0 +1,74 @@
+"""stream.py
+Framed mode (--framed): one process converts any number of diagrams read from a single stream.
+Each document in is its length in bytes on a line of its own, then that many bytes of .ggb archive
+or bare geogebra.xml:
+
+	<length>\\n<payload>
+
+Each result out, in the same order, is the length, a space and ok or error on one line, then that
+many bytes of Asymptote code or of error message:
+
+	<length> ok\\n<code>
+	<length> error\\n<message>
+
+A document which cannot be converted gives an error frame and the stream goes on; a malformed
+length ends it, since there is no telling where the next document starts."""
+
+import traceback
+from StringIO import StringIO
+
+from converter import convertSource, conversionCache
+from errors import DragonError
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+
+class FrameError(Exception):
+	"""The input stream is not framed as it should be"""
+	pass
+
+def readFrame(stream):
+	"""The next payload from stream, or None at the end of it"""
+	header = stream.readline()
+	if not header:
+		return None
+	try:
+		length = int(header.strip())
+	except ValueError:
+		raise FrameError, "Bad frame header %r" %header[:40]
+	if length < 0:
+		raise FrameError, "Bad frame length %d" %length
+	payload = stream.read(length)
+	if len(payload) != length:
+		raise FrameError, "Stream ended %d bytes into a frame of %d" %(len(payload), length)
+	return payload
+
+def writeFrame(stream, status, payload):
+	if isinstance(payload, unicode):
+		payload = payload.encode("utf-8")
+	stream.write("%d %s\n" %(len(payload), status))
+	stream.write(payload)
+	stream.flush()
+
+def runFramed(opts, instream, outstream, manifest = None):
+	"""Convert every document of instream with opts, and the [defaults] of manifest if given,
+	writing a frame to outstream for each.
+	Return value: the number of documents which failed."""
+	cache = conversionCache(opts)
+	failures = 0
+	while True:
+		payload = readFrame(instream)
+		if payload is None:
+			return failures
+		try:
+			# A file object, so that the payload is never mistaken for a filename
+			code = convertSource(StringIO(payload), opts, cache = cache, manifest = manifest)
+		except DragonError, e:
+			failures += 1
+			writeFrame(outstream, STATUS_ERROR, "%s: %s" %(e.__class__.__name__, e))
+		except Exception, e:
+			failures += 1
+			writeFrame(outstream, STATUS_ERROR, traceback.format_exc())
+		else:
+			writeFrame(outstream, STATUS_OK, code)
@@ -0,0 +1,4 @@
+"""tests
+Unit tests, run from the directory containing dragon:
+
+python -m unittest discover -s dragon/tests -t ."""
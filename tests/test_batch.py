@@ -0,0 +1,123 @@
+"""tests/test_batch.py
+Batch mode (batch.runBatch and the worker's _convertOne) on copies of Iran.ggb and a broken file."""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from dragon import batch
+from dragon.batch import collectInputs, commonDirectory, outputFilename, runBatch
+from dragon.constants import DEFAULT_OPTIONS
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+
+class BatchTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.opts = dict(DEFAULT_OPTIONS)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def path(self, *parts):
+		return os.path.join(self.directory, *parts)
+
+	def copy(self, *parts):
+		"""Copy Iran.ggb to the path parts below the test directory"""
+		filename = self.path(*parts)
+		if not os.path.isdir(os.path.dirname(filename)):
+			os.makedirs(os.path.dirname(filename))
+		shutil.copy(IRAN, filename)
+		return filename
+
+	def write(self, data, *parts):
+		filename = self.path(*parts)
+		f = open(filename, "wb")
+		f.write(data)
+		f.close()
+		return filename
+
+	def convertAll(self, patterns, **kwargs):
+		"""runBatch, returning (failures, the results by input filename)"""
+		stream = StringIO()
+		failures = runBatch(patterns, self.opts, jobs = 2, stream = stream, **kwargs)
+		results = [json.loads(line) for line in stream.getvalue().splitlines()]
+		return failures, dict((result["input"], result) for result in results)
+
+	def testCollectInputs(self):
+		a = self.copy("a", "fig.ggb")
+		b = self.copy("b", "fig.ggb")
+		self.write("", "a", "notes.txt")
+		self.assertEqual(collectInputs([self.directory]), [a, b])
+		self.assertEqual(collectInputs([self.path("*", "*.ggb"), b]), [a, b]) # No duplicates
+
+	def testOutputFilename(self):
+		a = self.copy("a", "fig.ggb")
+		b = self.copy("b", "fig.ggb")
+		root = commonDirectory([a, b])
+		self.assertEqual(root, self.directory + os.sep)
+		self.assertEqual(outputFilename(a), self.path("a", "fig.asy"))
+		self.assertEqual(outputFilename(a, "out"), os.path.join("out", "fig.asy"))
+		self.assertEqual(outputFilename(b, "out", root), os.path.join("out", "b", "fig.asy"))
+
+	def testBrokenFileFailsAlone(self):
+		good = self.copy("Iran.ggb")
+		broken = self.write("PK not really a zip", "broken.ggb")
+		failures, results = self.convertAll([self.directory])
+		self.assertEqual(failures, 1)
+		self.assertEqual(results[good]["status"], "ok")
+		self.assertTrue(os.path.isfile(self.path("Iran.asy")))
+		self.assertEqual(results[broken]["status"], "error")
+		self.assertTrue(results[broken]["error"].startswith("GGBFormatError"), results[broken])
+		self.assertFalse(os.path.exists(self.path("broken.asy")))
+
+	def testOutputsKeepTheirDirectories(self):
+		a = self.copy("in", "a", "fig.ggb")
+		b = self.copy("in", "b", "fig.ggb")
+		failures, results = self.convertAll([self.path("in")], outdir = self.path("out"))
+		self.assertEqual(failures, 0)
+		self.assertEqual(results[a]["output"], self.path("out", "a", "fig.asy"))
+		self.assertEqual(results[b]["output"], self.path("out", "b", "fig.asy"))
+		self.assertTrue(os.path.isfile(self.path("out", "b", "fig.asy")))
+
+	def testCollidingOutputIsNotOverwritten(self):
+		a = self.copy("a", "fig.ggb")
+		b = self.path("a", ".", "fig.ggb") # The same file, by another name
+		failures, results = self.convertAll([a, b], outdir = self.path("out"))
+		self.assertEqual(failures, 1)
+		self.assertEqual(results[a]["status"], "ok")
+		self.assertEqual(results[b]["status"], "error")
+		self.assertTrue("already written for %s" %a in results[b]["error"])
+
+	def testOutputDirectoryWhichIsAFileFailsThatFileOnly(self):
+		a = self.copy("in", "a", "fig.ggb")
+		b = self.copy("in", "b", "fig.ggb")
+		os.makedirs(self.path("out"))
+		self.write("", "out", "a") # Where the directory for a's output should go
+		failures, results = self.convertAll([self.path("in")], outdir = self.path("out"))
+		self.assertEqual(failures, 1)
+		self.assertEqual(results[a]["status"], "error")
+		self.assertEqual(results[b]["status"], "ok")
+
+	def testTimeout(self):
+		def slowConvert(*args, **kwargs):
+			time.sleep(5)
+		convert_source = batch.convertSource
+		batch.convertSource = slowConvert
+		try:
+			good = self.copy("Iran.ggb")
+			result = batch._convertOne((good, self.path("Iran.asy"), self.opts, 1))
+		finally:
+			batch.convertSource = convert_source
+		self.assertEqual(result["status"], "timeout")
+		self.assertTrue(result["seconds"] < 4, result)
+		self.assertFalse(os.path.exists(self.path("Iran.asy"))) # No half-written diagram left behind
+
+
+if __name__ == "__main__":
+	unittest.main()
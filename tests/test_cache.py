@@ -0,0 +1,106 @@
+"""tests/test_cache.py
+The on-disk cache (cache.DiskCache) and the conversion cache built on it, in a temporary directory."""
+
+import os
+import errno
+import shutil
+import tempfile
+import unittest
+
+from dragon import cache as cache_module
+from dragon.cache import DiskCache, hashKey
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.converter import convertSource, conversionKey, xmlDigest
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+
+class DiskCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.cache = DiskCache(os.path.join(self.directory, "cache"))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def testHashKey(self):
+		self.assertNotEqual(hashKey("ab", "c"), hashKey("a", "bc"))
+		self.assertEqual(hashKey(u"\u03b1"), hashKey(u"\u03b1".encode("utf-8")))
+
+	def testHitAndMiss(self):
+		key = hashKey("diagram")
+		self.assertEqual(self.cache.read(key, ".asy"), None)
+		self.cache.store(key, ".asy", "code")
+		self.assertEqual(self.cache.read(key, ".asy"), "code")
+		self.assertEqual(self.cache.read(key, ".pdf"), None)
+		self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+		self.assertEqual(os.listdir(self.cache.directory), [key[:2]]) # No temporary files left
+
+	def testEvictsLeastRecentlyUsed(self):
+		keys = [hashKey(str(i)) for i in range(3)]
+		for i, key in enumerate(keys):
+			self.cache.store(key, "", "x" * 100)
+			os.utime(self.cache.path(key), (1000 + i, 1000 + i))
+		self.cache.max_bytes = 250
+		self.assertEqual(self.cache.lookup(keys[0]), self.cache.path(keys[0])) # Now the most recently used
+		self.cache.store(hashKey("new"), "", "x" * 100)
+		self.assertEqual([self.cache.lookup(key) is not None for key in keys], [True, False, False])
+		self.assertTrue(sum(size for mtime, size, path in self.cache.entries()) <= 250)
+
+	def testReadOnlyCacheStillHits(self):
+		key = hashKey("diagram")
+		self.cache.store(key, ".asy", "code")
+		def refuse(path, times):
+			raise OSError(errno.EPERM, "Operation not permitted", path)
+		utime = cache_module.os.utime
+		cache_module.os.utime = refuse
+		try:
+			self.assertEqual(self.cache.read(key, ".asy"), "code")
+			self.assertEqual(self.cache.read(hashKey("other"), ".asy"), None)
+		finally:
+			cache_module.os.utime = utime
+		self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+
+class ConversionCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.cache = DiskCache(os.path.join(self.directory, "cache"))
+		self.opts = dict(DEFAULT_OPTIONS)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def testKey(self):
+		digest = xmlDigest(IRAN)
+		key = conversionKey(digest, {}, self.opts)
+		self.assertEqual(key, conversionKey(xmlDigest(IRAN), {}, dict(self.opts)))
+		self.assertNotEqual(key, conversionKey(hashKey("other"), {}, self.opts))
+		self.assertNotEqual(key, conversionKey(digest, {"A" : "lsf * dir(90)"}, self.opts))
+		self.opts['CONCISE_MODE'] = 1
+		self.assertNotEqual(key, conversionKey(digest, {}, self.opts))
+
+	def testSecondConversionIsAHit(self):
+		report = {}
+		code = convertSource(IRAN, self.opts, cache = self.cache, report = report)
+		self.assertEqual(report["cache"], {"hits" : 0})
+		self.assertEqual(code, convertSource(IRAN, self.opts))
+		report = {}
+		self.assertEqual(convertSource(IRAN, self.opts, cache = self.cache, report = report), code)
+		self.assertEqual(report["cache"], {"hits" : 1})
+		self.opts['CONCISE_MODE'] = 1
+		self.assertNotEqual(convertSource(IRAN, self.opts, cache = self.cache), code)
+
+	def testChangedConfigIsAMiss(self):
+		filename = os.path.join(self.directory, "Iran.ggb")
+		shutil.copy(IRAN, filename)
+		code = convertSource(filename, self.opts, cache = self.cache)
+		f = open(os.path.join(self.directory, "Iran.cfg"), "w")
+		f.write("[label]\nA = dir(90)\n")
+		f.close()
+		self.assertTrue("lsf * dir(90)" in convertSource(filename, self.opts, cache = self.cache))
+		self.assertEqual(self.cache.hits, 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
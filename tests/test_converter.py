@@ -0,0 +1,168 @@
+"""tests/test_converter.py
+Reading geogebra.xml with the streaming iterConstruction, the library entry point dragon.convert,
+and writing several variants from one compile."""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+import dragon
+from dragon import convert, converter
+from dragon.cache import DiskCache
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.converter import iterConstruction, convertSource, convertVariants, parseVariant
+from dragon.errors import DragonError, GGBFormatError
+from dragon.tests.test_optimize import HEADER, FOOTER, element, point, command
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+TRIANGLE = (HEADER + point("A", 0.0, 0.0) + point("B", 4.0, 0.0) + point("C", 0.0, 3.0) +
+		command("Segment", ["A", "B"], ["c"]) + element("segment", "c") + FOOTER)
+
+
+class IterConstructionTest(unittest.TestCase):
+	def testChildrenInOrder(self):
+		header = {}
+		children = [(child.tag, child.get("label") or child.get("name")) for child in iterConstruction(StringIO(TRIANGLE), header)]
+		self.assertEqual(children, [("element", "A"), ("element", "B"), ("element", "C"), ("command", "Segment"), ("element", "c")])
+
+	def testView(self):
+		header = {}
+		for child in iterConstruction(StringIO(TRIANGLE), header):
+			pass
+		self.assertEqual(header["view"], (0.0, 52.0, -20.0, 20.0))
+
+	def testChildrenAreClearedOnceDone(self):
+		previous = None
+		for child in iterConstruction(StringIO(TRIANGLE), {}):
+			self.assertTrue(len(child) > 0)
+			if previous is not None:
+				self.assertEqual((len(previous), previous.attrib), (0, {}))
+			previous = child
+
+	def testNoView(self):
+		header = {}
+		xml_data = "<geogebra><construction>" + point("A", 0.0, 0.0) + FOOTER
+		self.assertEqual(len(list(iterConstruction(StringIO(xml_data), header))), 1)
+		self.assertFalse("view" in header)
+
+
+class BrokenFileTest(unittest.TestCase):
+	def testTruncatedXML(self):
+		self.assertRaises(GGBFormatError, convert, StringIO(TRIANGLE[:len(TRIANGLE) / 2]))
+
+	def testNotAGeoGebraFile(self):
+		self.assertRaises(GGBFormatError, convert, "PK\x03\x04 not really a zip")
+		self.assertRaises(GGBFormatError, convert, StringIO("plain text"))
+
+
+class ConvertTest(unittest.TestCase):
+	def setUp(self):
+		f = open(IRAN, "rb")
+		self.data = f.read()
+		f.close()
+		self.code = convert(IRAN)
+
+	def testSources(self):
+		self.assertTrue("pair A = (-3.0, 2.0);" in self.code)
+		self.assertEqual(convert(self.data), self.code)
+		self.assertEqual(convert(bytearray(self.data)), self.code)
+		self.assertEqual(convert(open(IRAN, "rb")), self.code)
+		self.assertEqual(convert(StringIO(self.data)), self.code)
+
+	def testOut(self):
+		out = StringIO()
+		self.assertEqual(convert(self.data, out = out, CONCISE_MODE = 1), None)
+		self.assertEqual(out.getvalue(), convert(IRAN, CONCISE_MODE = 1))
+
+	def testOptionsAreNotKept(self):
+		defaults = dict(DEFAULT_OPTIONS)
+		self.assertNotEqual(convert(IRAN, CONCISE_MODE = 1, IMG_SIZE = "8cm"), self.code)
+		self.assertEqual(DEFAULT_OPTIONS, defaults)
+		self.assertEqual(convert(IRAN), self.code)
+
+	def testUnknownOption(self):
+		self.assertRaises(TypeError, convert, IRAN, CONCISE = 1)
+
+	def testErrorsAreRaisedNotPrinted(self):
+		stdout, stderr = sys.stdout, sys.stderr
+		sys.stdout = sys.stderr = StringIO()
+		try:
+			self.assertRaises(dragon.DragonError, convert, self.data[:len(self.data) / 2])
+			self.assertRaises(dragon.GGBFormatError, convert, "<geogebra><construction>")
+			printed = sys.stdout.getvalue()
+		finally:
+			sys.stdout, sys.stderr = stdout, stderr
+		self.assertEqual(printed, "")
+
+	def testThreads(self):
+		results = {}
+		def run(i):
+			results[i] = convert(self.data, CONCISE_MODE = i % 2)
+		threads = [threading.Thread(target = run, args = (i,)) for i in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		concise = convert(IRAN, CONCISE_MODE = 1)
+		self.assertEqual([results[i] for i in range(8)], [self.code, concise] * 4)
+
+
+class VariantsTest(unittest.TestCase):
+	def setUp(self):
+		self.compiles = 0
+		self.compileDiagram = converter.compileDiagram
+		def countingCompileDiagram(*args, **kwargs):
+			self.compiles += 1
+			return self.compileDiagram(*args, **kwargs)
+		converter.compileDiagram = countingCompileDiagram
+
+	def tearDown(self):
+		converter.compileDiagram = self.compileDiagram
+
+	def testParseVariant(self):
+		self.assertEqual(parseVariant("plain.asy"), ("plain.asy", {}))
+		self.assertEqual(parseVariant("cse.asy:CSE_MODE=1, img_size=8cm"), ("cse.asy", {"CSE_MODE" : 1, "IMG_SIZE" : "8cm"}))
+		self.assertEqual(parseVariant("C:\\figures\\plain.asy"), ("C:\\figures\\plain.asy", {}))
+		self.assertRaises(DragonError, parseVariant, ":CSE_MODE=1")
+		self.assertRaises(DragonError, parseVariant, "clip.asy:CLIP_IMG=1") # Changes the compiled diagram
+		self.assertRaises(DragonError, parseVariant, "cse.asy:CSE_MODE=yes")
+
+	def testOneCompile(self):
+		variants = [{}, {"CSE_MODE" : 1}, {"CSE_MODE" : 1, "CONCISE_MODE" : 1}, {"BACKEND" : "svg"}]
+		outs = [StringIO() for overrides in variants]
+		convertVariants(IRAN, dict(DEFAULT_OPTIONS), zip(outs, variants))
+		self.assertEqual(self.compiles, 1)
+		self.assertEqual([out.getvalue() for out in outs], [convert(IRAN, **overrides) for overrides in variants])
+
+	def testOnlyVariantOptions(self):
+		self.assertRaises(DragonError, convertVariants, IRAN, dict(DEFAULT_OPTIONS), [(StringIO(), {"CLIP_IMG" : 1})])
+		self.assertEqual(self.compiles, 0)
+
+	def testNoCompileWhenEveryVariantIsCached(self):
+		directory = tempfile.mkdtemp(prefix = "dragon-test")
+		try:
+			cache = DiskCache(directory)
+			concise = convert(IRAN, CONCISE_MODE = 1)
+			self.compiles = 0
+			opts = dict(DEFAULT_OPTIONS)
+			variants = [{}, {"CONCISE_MODE" : 1}]
+			convertVariants(IRAN, opts, [(StringIO(), overrides) for overrides in variants], cache = cache)
+			self.assertEqual(self.compiles, 1)
+			out, report = StringIO(), {}
+			convertVariants(IRAN, opts, [(StringIO(), {}), (out, {"CONCISE_MODE" : 1})], report = report, cache = cache)
+			self.assertEqual((self.compiles, report["cache"]), (1, {"hits" : 2}))
+			self.assertEqual(out.getvalue(), concise)
+			opts['CONCISE_MODE'] = 1
+			self.assertEqual(convertSource(IRAN, opts, cache = cache), out.getvalue()) # The same entries as convertSource
+			self.assertEqual(self.compiles, 1)
+		finally:
+			shutil.rmtree(directory, ignore_errors = True)
+
+
+if __name__ == "__main__":
+	unittest.main()
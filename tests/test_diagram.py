@@ -0,0 +1,74 @@
+"""tests/test_diagram.py
+The indexed AsyDiagram container: construction order, removal and the emission buckets."""
+
+import unittest
+
+from dragon.diagram import AsyDiagram, GGBObject
+
+def pathObject(label, **attributes):
+	return GGBObject(label = label, ggb_obj_type = "segment", asy_obj_type = "path", **attributes)
+
+
+class AsyDiagramTest(unittest.TestCase):
+	def setUp(self):
+		self.diagram = AsyDiagram()
+		for label in ["A", "B", "C"]:
+			self.diagram[label] = GGBObject(label = label)
+		self.diagram["a"] = pathObject("a")
+
+	def testConstructionOrder(self):
+		self.assertEqual(self.diagram.objectList, ["A", "B", "C", "a"])
+		self.assertEqual(list(self.diagram.visibleOfType("pair")), ["A", "B", "C"])
+		self.assertEqual(list(self.diagram.visibleOfType("path")), ["a"])
+		self.assertEqual(list(self.diagram.visibleOfType("real")), [])
+
+	def testInsertBefore(self):
+		self.diagram.insertBefore("B", "t_1", pathObject("t_1"))
+		self.diagram.insertBefore("B", "t_2", pathObject("t_2")) # May be referred to by t_1, so comes first
+		self.assertEqual(self.diagram.objectList, ["A", "t_2", "t_1", "B", "C", "a"])
+		self.assertEqual(list(self.diagram.visibleOfType("path")), ["t_2", "t_1", "a"])
+
+	def testReplacingMovesToTheEnd(self):
+		self.diagram["A"] = GGBObject(label = "A")
+		self.assertEqual(self.diagram.objectList, ["B", "C", "a", "A"])
+		self.assertEqual(len(self.diagram), 4)
+
+	def testRemove(self):
+		self.diagram["B"].needs_label = 1
+		self.diagram.addDependencies("a", ["B", "C"])
+		removed = self.diagram.remove("B")
+		self.assertFalse(self.diagram.has_key("B"))
+		self.assertEqual(list(self.diagram.visibleOfType("pair")), ["A", "C"])
+		self.assertEqual(list(self.diagram.labelled), [])
+		removed.visible = 0 # No longer reindexes anything
+		self.assertFalse("B" in self.diagram.declared)
+
+	def testBucketsFollowAttributeChanges(self):
+		A = self.diagram["A"]
+		A.visible = 0
+		self.assertEqual(list(self.diagram.visibleOfType("pair")), ["B", "C"])
+		A.visible = 1
+		self.assertEqual(list(self.diagram.visibleOfType("pair")), ["A", "B", "C"])
+		A.asy_obj_type = "path"
+		self.assertEqual(list(self.diagram.visibleOfType("path")), ["A", "a"])
+		self.assertFalse("A" in self.diagram.visible["pair"])
+		A.needs_label = 1
+		self.assertEqual((list(self.diagram.labelled), list(self.diagram.declared)), (["A"], ["A"]))
+
+	def testDependencies(self):
+		self.diagram.addDependencies("a", ["A", "B", "A", "X"]) # X is not in the diagram
+		self.assertEqual(self.diagram["A"].depend, 2)
+		self.assertEqual(list(self.diagram.declared), ["A", "B"])
+		self.diagram.dropDependencies("a")
+		self.assertEqual((self.diagram["A"].depend, self.diagram["B"].depend), (0, 0))
+		self.assertEqual(list(self.diagram.declared), [])
+
+	def testDiagramsAreSeparate(self):
+		other = AsyDiagram()
+		other["A"] = GGBObject(label = "A", visible = 0)
+		self.assertEqual(list(self.diagram.visibleOfType("pair")), ["A", "B", "C"])
+		self.assertEqual(list(other.visibleOfType("pair")), [])
+
+
+if __name__ == "__main__":
+	unittest.main()
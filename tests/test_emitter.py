@@ -0,0 +1,57 @@
+"""tests/test_emitter.py
+The streaming Asymptote writer (emitter.AsyEmitter) and drawDiagram writing through it."""
+
+import os
+import unittest
+from StringIO import StringIO
+
+from dragon import convert
+from dragon.emitter import AsyEmitter, abbreviate
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+
+class AsyEmitterTest(unittest.TestCase):
+	def emitted(self, concise, *calls):
+		"""What an AsyEmitter writes for calls, each (method name, arguments...)"""
+		sink = StringIO()
+		emit = AsyEmitter(sink, concise = concise)
+		for call in calls:
+			getattr(emit, call[0])(*call[1:])
+		return sink.getvalue()
+
+	def testCodeCleansApostrophes(self):
+		self.assertEqual(self.emitted(0, ("code", "pair A' = IntersectionPoint(a,b);")), "pair A_prime = IntersectionPoint(a,b);")
+
+	def testConciseAbbreviates(self):
+		self.assertEqual(self.emitted(1, ("code", "X = IntersectionPoints(a,b)[0]+IntersectionPoint(a,b);")),
+				"X = IPs(a,b)[0]+IP(a,b);")
+		self.assertEqual(self.emitted(1, ("code", "Line(A,B,lisf)")), "L(A,B,lisf)")
+
+	def testOnlyCallsAreAbbreviated(self):
+		self.assertEqual(abbreviate("Lines(A,B); Line; myLine(A,B); Line_1(A)"), "Lines(A,B); Line; myLine(A,B); Line_1(A)")
+
+	def testRawKeepsApostrophesAndSpellsAlpha(self):
+		self.assertEqual(self.emitted(1, ("raw", u"label(\"$\u03b1'$\", lsf*dir(45));")), "label(\"$alpha'$\", lsf*dir(45));")
+		self.assertEqual(self.emitted(0, ("raw", u"\u03b1\u03b2".encode("utf-8"))), "alpha" + u"\u03b2".encode("utf-8"))
+
+	def testNewline(self):
+		self.assertEqual(self.emitted(0, ("code", "a;"), ("newline",), ("code", "b;")), "a;\nb;")
+		self.assertEqual(self.emitted(1, ("code", "a;"), ("newline",), ("code", "b;")), "a; b;")
+
+
+class DrawDiagramTest(unittest.TestCase):
+	def testStreamedEqualsReturned(self):
+		for options in [{}, {"CONCISE_MODE" : 1}, {"CSE_MODE" : 1, "CLIP_IMG" : 1}]:
+			out = StringIO()
+			self.assertEqual(convert(IRAN, out = out, **options), None)
+			self.assertEqual(out.getvalue(), convert(IRAN, **options))
+
+	def testConciseHasNoLongNames(self):
+		code = convert(IRAN, CONCISE_MODE = 1)
+		self.assertFalse("IntersectionPoint(" in code or "CirclebyPoint(" in code)
+		self.assertTrue("B_1 = IP(L(E,F,lisf),b_1); C_1 = IP(L(E,F,lisf),c_1);" in code) # Statements are joined by spaces
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,87 @@
+"""tests/test_labels.py
+Automatic label placement (labels.placeLabels) on diagrams built by hand, and through dragon.convert."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from dragon import convert, labels
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.diagram import AsyDiagram, GGBObject
+from dragon.labels import placeLabels, toBigPoints
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+def labelledPoints(**points):
+	"""An AsyDiagram with a labelled point at each (x, y), and C far away, which sets the scale:
+	a label is then about 0.3 units from its point"""
+	diagram = AsyDiagram()
+	points["C"] = (10.0, 10.0)
+	for label in sorted(points):
+		diagram[label] = GGBObject(label = label, value = points[label], needs_label = 1)
+	return diagram
+
+
+@unittest.skipIf(labels.numpy is None, "needs NumPy")
+class PlaceLabelsTest(unittest.TestCase):
+	def testDefaultDirection(self):
+		report = {}
+		self.assertEqual(placeLabels(labelledPoints(A = (0.0, 0.0)), DEFAULT_OPTIONS, report = report),
+				{"A" : "lsf * dir(45)", "C" : "lsf * dir(45)"})
+		self.assertEqual(report["labels"], {"placed" : 2, "moved" : 0})
+
+	def testAvoidsDots(self):
+		diagram = labelledPoints(A = (0.0, 0.0))
+		diagram["B"] = GGBObject(label = "B", value = (0.22, 0.22)) # Right under A's label at dir(45)
+		placed = placeLabels(diagram, DEFAULT_OPTIONS)
+		self.assertNotEqual(placed["A"], "lsf * dir(45)")
+		self.assertEqual(placed["C"], "lsf * dir(45)")
+
+	def testAvoidsPaths(self):
+		diagram = labelledPoints(A = (0.0, 0.0))
+		diagram["s"] = GGBObject(label = "s", constructor = "A--C", ggb_obj_type = "segment", asy_obj_type = "path")
+		self.assertNotEqual(placeLabels(diagram, DEFAULT_OPTIONS)["A"], "lsf * dir(45)")
+
+	def testAvoidsOtherLabels(self):
+		report = {}
+		placed = placeLabels(labelledPoints(A = (0.0, 0.0), B = (0.22, 0.22)), DEFAULT_OPTIONS, report = report)
+		self.assertNotEqual(placed["A"], placed["B"])
+		self.assertEqual(report["labels"]["moved"], 1)
+
+	def testConfigFileHasTheLastWord(self):
+		directory = tempfile.mkdtemp(prefix = "dragon-test")
+		try:
+			config_filename = os.path.join(directory, "Iran.cfg")
+			f = open(config_filename, "w")
+			f.write("[label]\nD = dir(270)\n")
+			f.close()
+			code = convert(IRAN, AUTO_LABELS = 1, CONFIG_FILENAME = config_filename)
+		finally:
+			shutil.rmtree(directory, ignore_errors = True)
+		self.assertTrue('label("$D$", D, lsf * dir(270));' in code)
+		self.assertTrue('label("$C_1$", C_1, lsf * dir(337.5));' in code)
+
+
+class WithoutNumPyTest(unittest.TestCase):
+	def testDefaultsAreKept(self):
+		numpy = labels.numpy
+		labels.numpy = None
+		try:
+			diagram = labelledPoints(A = (0.0, 0.0))
+			self.assertEqual(placeLabels(diagram, DEFAULT_OPTIONS), {})
+		finally:
+			labels.numpy = numpy
+		self.assertTrue("NumPy" in diagram.warnings[0])
+
+
+class ToBigPointsTest(unittest.TestCase):
+	def testUnits(self):
+		self.assertAlmostEqual(toBigPoints("2.54cm"), 72.0)
+		self.assertAlmostEqual(toBigPoints("72.27pt"), 72.0)
+		self.assertEqual(toBigPoints("12"), 12.0)
+		self.assertEqual(toBigPoints("big", 5.0), 5.0)
+
+
+if __name__ == "__main__":
+	unittest.main()
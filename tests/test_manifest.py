@@ -0,0 +1,135 @@
+"""tests/test_manifest.py
+Project manifests (manifest.Manifest), option checking, and the .cfg files which override them,
+on copies of Iran.ggb in a temporary directory."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.converter import convertSource, readConfig
+from dragon.errors import ConfigError
+from dragon.manifest import Manifest, checkedOption
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+MANIFEST = """[defaults]
+img_size = 8cm
+CSE_MODE = 1
+label.A = dir(0)
+
+[Iran]
+CONCISE_MODE = 1
+label.B = dir(90)
+
+[sub/Iran]
+label.B = dir(180)
+"""
+
+
+class CheckedOptionTest(unittest.TestCase):
+	def testTypesOfTheDefaults(self):
+		self.assertEqual(checkedOption("concise_mode", "1", "test"), ("CONCISE_MODE", 1))
+		self.assertEqual(checkedOption("LABEL_SCALE_FACTOR", "1", "test"), ("LABEL_SCALE_FACTOR", 1.0))
+		self.assertEqual(checkedOption("IMG_SIZE", " 8cm ", "test"), ("IMG_SIZE", "8cm"))
+		self.assertEqual(checkedOption("IMG_SIZE", "300", "test"), ("IMG_SIZE", "300"))
+		self.assertEqual(checkedOption("ONLY_LABELS", "'A,B'", "test"), ("ONLY_LABELS", "A,B"))
+
+	def testRefused(self):
+		self.assertRaises(ConfigError, checkedOption, "NO_SUCH_OPTION", "1", "test")
+		self.assertRaises(ConfigError, checkedOption, "CONCISE_MODE", "yes", "test")
+		self.assertRaises(ConfigError, checkedOption, "HOIST_BUDGET", "__import__('os').getpid()", "test")
+		try:
+			checkedOption("CSE_MODE", "[1]", "project.ini, [Iran]")
+		except ConfigError, e:
+			self.assertTrue(str(e).startswith("project.ini, [Iran]: CSE_MODE should be of type int"), e)
+		else:
+			self.fail("CSE_MODE = [1] was accepted")
+
+
+class ManifestTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.filename = self.write(MANIFEST, "project.ini")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def write(self, data, *parts):
+		filename = os.path.join(self.directory, *parts)
+		if not os.path.isdir(os.path.dirname(filename)):
+			os.makedirs(os.path.dirname(filename))
+		f = open(filename, "w")
+		f.write(data)
+		f.close()
+		return filename
+
+	def testSettings(self):
+		manifest = Manifest(self.filename)
+		self.assertEqual(manifest.settingsFor(None), ({"IMG_SIZE" : "8cm", "CSE_MODE" : 1}, {"A" : "lsf * dir(0)"}))
+		opts, labels = manifest.settingsFor(os.path.join(self.directory, "Iran.ggb"))
+		self.assertEqual(opts, {"IMG_SIZE" : "8cm", "CSE_MODE" : 1, "CONCISE_MODE" : 1})
+		self.assertEqual(labels, {"A" : "lsf * dir(0)", "B" : "lsf * dir(90)"})
+		self.assertEqual(manifest.settingsFor(os.path.join(self.directory, "sub", "Iran.ggb"))[1]["B"], "lsf * dir(180)")
+		self.assertEqual(manifest.settingsFor(os.path.join(self.directory, "other", "Iran.ggb"))[1]["B"], "lsf * dir(90)")
+		self.assertEqual(manifest.settingsFor(os.path.join(self.directory, "Other.ggb"))[0], {"IMG_SIZE" : "8cm", "CSE_MODE" : 1})
+
+	def testBadManifests(self):
+		self.assertRaises(ConfigError, Manifest, os.path.join(self.directory, "missing.ini"))
+		self.assertRaises(ConfigError, Manifest, self.write("IMG_SIZE = 8cm\n", "nosection.ini"))
+		self.assertRaises(ConfigError, Manifest, self.write("[Iran]\nCONCISE = 1\n", "unknown.ini"))
+
+	def testConfigFileHasTheLastWord(self):
+		filename = os.path.join(self.directory, "Iran.ggb")
+		shutil.copy(IRAN, filename)
+		manifest = Manifest(self.filename)
+		code = convertSource(filename, dict(DEFAULT_OPTIONS), manifest = manifest)
+		self.assertTrue("size(8cm);" in code and "MP(\"A\", A, lsf * dir(0));" in code, code)
+		self.write("[var]\nCSE_MODE = 0\n[label]\nA = dir(270)\n", "Iran.cfg")
+		manifest = Manifest(self.filename) # Directory listings are kept, so a new .cfg needs a new manifest
+		code = convertSource(filename, dict(DEFAULT_OPTIONS), manifest = manifest)
+		self.assertTrue("size(8cm);" in code and "MP(\"$A$\", A, lsf * dir(270));" in code, code) # $: not CSE any more
+
+	def testConfigFilename(self):
+		manifest = Manifest()
+		iran = os.path.join(self.directory, "Iran.ggb")
+		self.assertEqual(manifest.configFilename(iran), "")
+		self.write("", "sub", "Iran.cfg")
+		self.assertEqual(manifest.configFilename(os.path.join(self.directory, "sub", "Iran.ggb")),
+				os.path.join(self.directory, "sub", "Iran.cfg"))
+
+
+class ReadConfigTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.filename = os.path.join(self.directory, "Iran.cfg")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def read(self, data):
+		f = open(self.filename, "w")
+		f.write(data)
+		f.close()
+		opts = dict(DEFAULT_OPTIONS)
+		return readConfig(self.filename, opts), opts
+
+	def testValues(self):
+		labels, opts = self.read("[var]\nconcise_mode = 1\nIMG_SIZE = 5cm\n[label]\nA = dir(30)\n")
+		self.assertEqual(labels, {"A" : "lsf * dir(30)"})
+		self.assertEqual((opts['CONCISE_MODE'], opts['IMG_SIZE']), (1, "5cm"))
+
+	def testChecked(self):
+		for data in ["[var]\nCONCISE_MODE = yes\n", "[var]\nNO_SUCH_OPTION = 1\n", "[var]\nPLUGINS = os\n",
+				"no section\n"]:
+			self.assertRaises(ConfigError, self.read, data)
+
+	def testMissingFile(self):
+		opts = dict(DEFAULT_OPTIONS)
+		self.assertEqual(readConfig(self.filename, opts), {})
+		self.assertEqual(opts, DEFAULT_OPTIONS)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,265 @@
+"""tests/test_optimize.py
+The passes of optimize.py, on small constructions converted with dragon.convert or on
+diagrams built by hand."""
+
+import os
+import re
+import unittest
+from StringIO import StringIO
+
+from dragon import convert
+from dragon.diagram import AsyDiagram, GGBObject
+from dragon.optimize import fittedLine, findCalls, hoistCommonSubexpressions, pruneDiagram, bakeNumeric, literal, meetsView
+from dragon.optimize import shareIntersections
+from dragon.errors import DragonError
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+#The view is x in [0, 52], y in [-20, 20]
+HEADER = """<?xml version="1.0" encoding="utf-8"?>
+<geogebra format="4.0"><euclidianView><size width="520" height="400"/><coordSystem xZero="0.0" yZero="200.0" scale="10.0" yscale="10.0"/></euclidianView>
+<construction title="" author="" date="">
+"""
+FOOTER = "</construction></geogebra>\n"
+
+def element(ggb_type, label, extra = "", visible = True):
+	return ('<element type="%s" label="%s"><show object="%s" label="true"/><objColor r="0" g="0" b="0" alpha="0.0"/>'
+			'<lineStyle thickness="2" type="0" typeHidden="1"/>%s</element>\n' %(ggb_type, label, str(visible).lower(), extra))
+
+def point(label, x, y, visible = True):
+	return element("point", label, '<coords x="%r" y="%r" z="1.0"/>' %(x, y), visible)
+
+def command(name, inputs, outputs):
+	return '<command name="%s"><input %s/><output %s/></command>\n' %(name,
+			" ".join('a%d="%s"' %(i, label) for i, label in enumerate(inputs)),
+			" ".join('a%d="%s"' %(i, label) for i, label in enumerate(outputs)))
+
+#The line y = 0 through A and B, near the right edge of the view, meets the circle of radius 10
+#about the origin at D = (-10, 0), outside the view, and E = (10, 0), inside it.
+LINE_AND_CIRCLE = (HEADER + point("A", 50.0, 0.0) + point("B", 51.0, 0.0) +
+		point("O", 0.0, 0.0, False) + point("P", 0.0, 10.0, False) +
+		command("Line", ["A", "B"], ["l"]) + element("line", "l", '<coords x="0.0" y="1.0" z="0.0"/>') +
+		command("Circle", ["O", "P"], ["c"]) + element("conic", "c") +
+		command("Intersect", ["l", "c"], ["D", "E"]) + point("D", -10.0, 0.0) + point("E", 10.0, 0.0) +
+		FOOTER)
+
+#Plus the hidden point Z, needed only by the hidden midpoint W
+WITH_UNUSED = LINE_AND_CIRCLE.replace(FOOTER, point("Z", 1.0, 1.0, False) + command("Midpoint", ["Z", "A"], ["W"]) +
+		point("W", 25.5, 0.5, False) + FOOTER)
+
+#Q and R are right of the view, S left of it: the segment QR misses the view, QS crosses it
+OUTSIDE_THE_VIEW = (HEADER + point("Q", 60.0, 0.0) + point("R", 70.0, 0.0) + point("S", -10.0, 0.0) +
+		command("Segment", ["Q", "R"], ["s"]) + element("segment", "s") +
+		command("Segment", ["Q", "S"], ["t"]) + element("segment", "t") + point("T", 10.0, 10.0) + FOOTER)
+
+FITTED_REGEX = re.compile(r"Line\(A,B,([\d.]+),([\d.]+)\)")
+
+
+class CullTest(unittest.TestCase):
+	def testObjectsOutsideTheViewAreNotDrawn(self):
+		code = convert(StringIO(OUTSIDE_THE_VIEW), CLIP_IMG = 1)
+		self.assertFalse("draw(s)" in code or "path s " in code or "pair R " in code or "dot(R)" in code)
+		self.assertTrue("draw(t);" in code)
+		self.assertTrue("pair Q = (60.0, 0.0);" in code) # t is built from it
+		self.assertFalse("dot(Q)" in code or 'label("$Q$"' in code)
+		self.assertTrue("dot(T);" in code)
+
+	def testOnlyWhenClipping(self):
+		for options in [{}, {"CLIP_IMG" : 1, "CULL_MODE" : 0}]:
+			code = convert(StringIO(OUTSIDE_THE_VIEW), **options)
+			self.assertTrue("draw(s);" in code and "dot(R);" in code, options)
+
+	def testMeetsView(self):
+		diagram = AsyDiagram()
+		box = (0.0, 10.0, 0.0, 10.0)
+		def meets(**attributes):
+			return meetsView(diagram, GGBObject(**attributes), box)
+		self.assertTrue(meets(value = (5.0, 5.0)))
+		self.assertFalse(meets(value = (5.0, 11.0)))
+		self.assertTrue(meets(value = None)) # Unknown: kept
+		self.assertTrue(meets(ggb_obj_type = "line", asy_obj_type = "path", value = (1.0, 1.0, -10.0))) # x + y = 10
+		self.assertFalse(meets(ggb_obj_type = "line", asy_obj_type = "path", value = (1.0, 1.0, 10.0)))
+		#(x - 5)^2 + (y - 5)^2 = r^2: inside the box, around it, and crossing it
+		for r, expected in [(2.0, True), (100.0, False), (6.0, True)]:
+			circle = (1.0, 1.0, 50.0 - r*r, 0.0, -5.0, -5.0)
+			self.assertEqual(meets(ggb_obj_type = "conic", asy_obj_type = "path", value = circle), expected, r)
+
+
+class FitLinesTest(unittest.TestCase):
+	def testLineReachesIntersectionsCulledFromTheView(self):
+		code = convert(StringIO(LINE_AND_CIRCLE), CLIP_IMG = 1)
+		self.assertTrue("pair D" not in code) # Culled
+		self.assertTrue("IntersectionPoint(l,c,1)" in code)
+		before, after = map(float, FITTED_REGEX.search(code).groups())
+		# A line from A = (50, 0) to B = (51, 0), extended by before beyond A, must still reach D
+		self.assertTrue(50.0 - before <= -10.0, code)
+		self.assertTrue(51.0 + after >= 52.0, code)
+
+	def testLinesAreOnlyFittedWhenClipping(self):
+		code = convert(StringIO(LINE_AND_CIRCLE))
+		self.assertTrue("Line(A,B,lisf)" in code)
+		self.assertTrue("IntersectionPoints(l,c)" in code) # D and E, sharing one call
+
+	def testNoFitLines(self):
+		code = convert(StringIO(LINE_AND_CIRCLE), CLIP_IMG = 1, FIT_LINES = 0)
+		self.assertTrue("Line(A,B,lisf)" in code)
+
+	def testFittedLine(self):
+		diagram = AsyDiagram()
+		diagram["A"] = GGBObject(label = "A", constructor = "(0, 0)", value = (0.0, 0.0))
+		diagram["B"] = GGBObject(label = "B", constructor = "(1, 0)", value = (1.0, 0.0))
+		self.assertEqual(fittedLine("Line(A,B,lisf)", diagram, [(-1.0, 5.0), (2.5, -5.0)]), "Line(A,B,1.18,1.68)")
+		self.assertEqual(fittedLine("Line(A,B,0,lisf)", diagram, [(-1.0, 5.0), (2.5, -5.0)]), "Line(A,B,0,1.68)")
+		self.assertEqual(fittedLine("Line(A,C,lisf)", diagram, [(0.0, 0.0)]), None)
+
+
+def handmadeDiagram(**constructors):
+	"""An AsyDiagram of the points A, B, C and the paths c, d, then an object per constructor,
+	in the order of their labels"""
+	diagram = AsyDiagram()
+	for label in ["A", "B", "C"]:
+		diagram[label] = GGBObject(label = label, constructor = "(0, 0)", depend = 1)
+	for label in ["c", "d"]:
+		diagram[label] = GGBObject(label = label, constructor = "A--B", depend = 1, ggb_obj_type = "segment", asy_obj_type = "path")
+	for label in sorted(constructors):
+		diagram[label] = GGBObject(label = label, constructor = constructors[label])
+	return diagram
+
+
+class BakeNumericTest(unittest.TestCase):
+	def testFull(self):
+		code = convert(StringIO(LINE_AND_CIRCLE), NUMERIC_MODE = "full")
+		self.assertTrue("pair D = (-10, 0);\npair E = (10, 0);" in code)
+		self.assertTrue("path l = (0, 0)-lisf*(-1, 0)--(0, 0)+lisf*(-1, 0);" in code)
+		self.assertTrue("path c = CirclebyPoint(O,P);" in code) # No coefficients in the file: stays symbolic
+
+	def testHybridOnlyBakesExpensiveCalls(self):
+		code = convert(StringIO(LINE_AND_CIRCLE), NUMERIC_MODE = "hybrid")
+		self.assertTrue("pair D = (-10, 0);\npair E = (10, 0);" in code)
+		self.assertTrue("path l = Line(A,B,lisf);" in code)
+
+	def testBakedObjectsNeedNothing(self):
+		code = convert(IRAN, NUMERIC_MODE = "full")
+		self.assertTrue("draw(circle((-1.850054, -1.242568), 1.757432)" in code)
+		self.assertFalse("incenter(" in code or "foot(" in code or "IntersectionPoint" in code)
+
+	def testLiteral(self):
+		self.assertEqual(literal(GGBObject(value = (0.5, -2.0))), "(0.5, -2)")
+		self.assertEqual(literal(GGBObject(asy_obj_type = "real", value = (3.25,))), "3.25")
+		circle = GGBObject(ggb_obj_type = "conic", asy_obj_type = "path", value = (1.0, 1.0, -4.0, 0.0, -1.0, 0.0))
+		self.assertEqual(literal(circle), "circle((1, 0), 2.236068)")
+		ellipse = GGBObject(ggb_obj_type = "conic", asy_obj_type = "path", value = (1.0, 2.0, -4.0, 0.0, 0.0, 0.0))
+		self.assertEqual(literal(ellipse), None)
+		self.assertEqual(literal(GGBObject()), None)
+
+	def testReport(self):
+		diagram = handmadeDiagram(X = "midpoint(A--B)", Y = "foot(A,B,C)")
+		diagram["X"].value = (0.5, 0.0)
+		diagram.addDependencies("X", ["A", "B"])
+		diagram.addDependencies("Y", ["A", "B", "C"]) # No value, so Y stays symbolic
+		report = {}
+		self.assertEqual(bakeNumeric(diagram, report = report), 1)
+		self.assertEqual(diagram["X"].constructor, "(0.5, 0)")
+		self.assertEqual(diagram["A"].depend, 2)
+		self.assertEqual(report["bake"], {"baked" : 1, "symbolic" : 6})
+
+
+class PruneTest(unittest.TestCase):
+	def testUnneededObjectsAreRemoved(self):
+		self.assertTrue("pair Z = (1.0, 1.0);" in convert(StringIO(WITH_UNUSED), PRUNE_MODE = 0))
+		code = convert(StringIO(WITH_UNUSED))
+		self.assertFalse("Z" in code)
+		self.assertTrue("pair O = (0.0, 0.0);" in code) # Hidden, but the circle is built from it
+
+	def testOnly(self):
+		code = convert(StringIO(WITH_UNUSED), ONLY_LABELS = "c")
+		self.assertTrue("path c = CirclebyPoint(O,P);" in code)
+		for label in ["A", "B", "l", "D", "E", "Z"]:
+			self.assertFalse("pair %s " %label in code or "path %s " %label in code, label)
+		self.assertTrue("pair Z = (1.0, 1.0);" in convert(StringIO(WITH_UNUSED), ONLY_LABELS = "W, c"))
+		self.assertRaises(DragonError, convert, StringIO(WITH_UNUSED), ONLY_LABELS = "c,Q")
+
+	def testReport(self):
+		diagram = handmadeDiagram(X = "midpoint(A--B)")
+		diagram["A"].visible = diagram["B"].visible = 0
+		diagram["C"].visible = diagram["c"].visible = diagram["d"].visible = 0
+		diagram.addDependencies("X", ["A", "B"])
+		report = {}
+		self.assertEqual(pruneDiagram(diagram, report = report), 3)
+		self.assertEqual(diagram.objectList, ["A", "B", "X"])
+		self.assertEqual(report["prune"], {"removed" : 3, "kept" : 3})
+
+
+class ShareIntersectionsTest(unittest.TestCase):
+	def testConvert(self):
+		code = convert(StringIO(LINE_AND_CIRCLE))
+		self.assertTrue("pair[] _ips1 = IntersectionPoints(l,c);\npair D = _ips1[0];\npair E = _ips1[1];" in code, code)
+		code = convert(StringIO(LINE_AND_CIRCLE), SHARE_INTERSECTIONS = 0)
+		self.assertTrue("pair D = IntersectionPoint(l,c,0);\npair E = IntersectionPoint(l,c,1);" in code, code)
+
+	def testShared(self):
+		diagram = handmadeDiagram(X = "IntersectionPoint(c,d,0)", Y = "midpoint(A--IntersectionPoint(c,d,1))",
+				Z = "IntersectionPoint(d,c,0)")
+		report = {}
+		self.assertEqual(shareIntersections(diagram, report), 1)
+		self.assertEqual(diagram.objectList, ["A", "B", "C", "c", "d", "_ips1", "X", "Y", "Z"])
+		self.assertEqual((diagram["_ips1"].constructor, diagram["_ips1"].asy_obj_type), ("IntersectionPoints(c,d)", "pair[]"))
+		self.assertEqual(diagram["X"].constructor, "_ips1[0]")
+		self.assertEqual(diagram["Y"].constructor, "midpoint(A--_ips1[1])")
+		self.assertEqual(diagram["Z"].constructor, "IntersectionPoint(d,c,0)") # Other order, alone
+		self.assertEqual(report["intersections"], {"shared" : 1, "calls_replaced" : 2})
+
+	def testOnlyLiteralIndicesAndSeveralUses(self):
+		diagram = handmadeDiagram(X = "IntersectionPoint(c,d,0)", Y = "IntersectionPoint(c,d,n)")
+		self.assertEqual(shareIntersections(diagram), 0)
+		self.assertEqual(diagram["X"].constructor, "IntersectionPoint(c,d,0)")
+
+	def testNamesDoNotClobberObjects(self):
+		diagram = handmadeDiagram(_ips1 = "(0, 0)", X = "IntersectionPoint(c,d,0)", Y = "IntersectionPoint(c,d,1)")
+		self.assertEqual(shareIntersections(diagram), 1)
+		self.assertEqual((diagram["_ips1"].constructor, diagram["X"].constructor), ("(0, 0)", "_ips1_[0]"))
+
+
+class HoistTest(unittest.TestCase):
+	def testFindCalls(self):
+		s = "IntersectionPoint(Line(A,B,lisf),c)"
+		self.assertEqual(findCalls(s, 12, 400), [(s, "IntersectionPoint"), ("Line(A,B,lisf)", "Line")])
+		self.assertEqual(findCalls(s, 15, 400), [(s, "IntersectionPoint")]) # Line(A,B,lisf) is too short
+		self.assertEqual(findCalls(s, 12, 20), [("Line(A,B,lisf)", "Line")]) # The other is over budget
+
+	def testRepeatedCallIsHoisted(self):
+		diagram = handmadeDiagram(X = "IntersectionPoint(Line(A,B,lisf),c)", Y = "IntersectionPoint(Line(A,B,lisf),d)")
+		report = {}
+		self.assertEqual(hoistCommonSubexpressions(diagram, report = report), 1)
+		self.assertEqual(diagram.objectList, ["A", "B", "C", "c", "d", "_t1", "X", "Y"])
+		self.assertEqual((diagram["_t1"].asy_obj_type, diagram["_t1"].constructor), ("path", "Line(A,B,lisf)"))
+		self.assertEqual(diagram["X"].constructor, "IntersectionPoint(_t1,c)")
+		self.assertEqual(diagram["Y"].constructor, "IntersectionPoint(_t1,d)")
+		self.assertEqual(report["hoist"]["evaluations_saved"], 1)
+
+	def testCallsInsideAHoistedCallAreCountedOnce(self):
+		diagram = handmadeDiagram(X = "IntersectionPoint(Line(A,B,lisf),c)", Y = "IntersectionPoint(Line(A,B,lisf),c)+(1,0)")
+		self.assertEqual(hoistCommonSubexpressions(diagram), 1)
+		self.assertEqual(diagram["_t1"].constructor, "IntersectionPoint(Line(A,B,lisf),c)")
+		self.assertEqual(diagram["Y"].constructor, "_t1+(1,0)")
+
+	def testTemporariesDoNotClobberObjects(self):
+		diagram = handmadeDiagram(_t1 = "midpoint(A--B)", X = "foot(C,Line(A,B,lisf))", Y = "foot(A,Line(A,B,lisf))")
+		self.assertEqual(hoistCommonSubexpressions(diagram), 1)
+		self.assertEqual(diagram["_t1"].constructor, "midpoint(A--B)")
+		self.assertEqual(diagram["X"].constructor, "foot(C,_t1_)")
+
+	def testShortCallsStay(self):
+		diagram = handmadeDiagram(X = "midpoint(A--B)+(1,0)", Y = "midpoint(A--B)+(0,1)")
+		self.assertEqual(hoistCommonSubexpressions(diagram, min_size = 15), 0)
+		self.assertEqual(hoistCommonSubexpressions(diagram, min_size = 14), 1)
+
+	def testConvert(self):
+		code = convert(IRAN, HOIST_MODE = 1, HOIST_MIN_SIZE = 8)
+		self.assertTrue("path _t1 = Line(E,F,lisf);\npair B_1 = IntersectionPoint(_t1,b_1);\n"
+				"pair C_1 = IntersectionPoint(_t1,c_1);\n" in code, code)
+		self.assertTrue("_t" not in convert(IRAN))
+
+
+if __name__ == "__main__":
+	unittest.main()
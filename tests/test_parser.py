@@ -0,0 +1,104 @@
+"""tests/test_parser.py
+The GeoGebra expression parser (ggb_parser): tokenizing, parse_string and its cache."""
+
+import unittest
+
+from dragon.ggb_parser import tokenize, get_tokens_from_string, parse_string, parse_cache, parse_cache_key, ParseCache
+from dragon.diagram import GGBObject
+from dragon.registry import commands
+
+def refDict(**types):
+	"""ref_dict for parse_string, with objects of the given types by label"""
+	return dict((label, GGBObject(label = label, ggb_obj_type = ggb_type)) for label, ggb_type in types.items())
+
+
+class TokenizeTest(unittest.TestCase):
+	def testKinds(self):
+		self.assertEqual(tokenize(u"Segment[A, B]"), [("command", "Segment"), ("open", "["), ("name", "A"),
+				("comma", ","), ("name", "B"), ("close", "]")])
+		self.assertEqual(tokenize(u"1.5 x^2"), [("number", "1.5"), ("name", "x"), ("operator", "^"), ("number", "2")])
+
+	def testNamesWhichStartLikeCommands(self):
+		self.assertEqual(tokenize(u"Segments+Circle_1")[0], ("name", "Segments"))
+		self.assertEqual(tokenize(u"Segments+Circle_1")[2], ("name", "Circle_1"))
+
+	def testImplicitMultiplication(self):
+		self.assertEqual(get_tokens_from_string(u"2(a+b)"), ["2", "*", "(", "a", "+", "b", ")"])
+		self.assertEqual(get_tokens_from_string(u"(a)(b)"), ["(", "a", ")", "*", "(", "b", ")"])
+		self.assertEqual(get_tokens_from_string(u"a(b)"), ["a", "*", "(", "b", ")"])
+		self.assertEqual(get_tokens_from_string(u"a+(b)"), ["a", "+", "(", "b", ")"])
+		self.assertEqual(get_tokens_from_string(u"Midpoint[A,B]"), ["Midpoint", "[", "A", ",", "B", "]"])
+
+	def testDegrees(self):
+		self.assertEqual(tokenize(u"30\xb0"), [("number", "30")])
+		self.assertEqual(get_tokens_from_string(u"(a+30)\xb0"), ["(", "a", "+", "30", ")"])
+		self.assertEqual(tokenize(u"\xb0"), [("degree", u"\xb0")])
+
+	def testWhitespace(self):
+		self.assertEqual(tokenize(u"  a \t+\nb "), tokenize(u"a+b"))
+		self.assertEqual(tokenize(u""), [])
+
+
+class ParseStringTest(unittest.TestCase):
+	def testCommand(self):
+		self.assertEqual(parse_string(u"Midpoint[A,B]", num_expected = 1, ref_dict = refDict(A = "point", B = "point")),
+				["midpoint(A--B)", ["A", "B"]])
+
+	def testImplicitMultiplication(self):
+		self.assertEqual(parse_string(u"2(a+1)", num_expected = 1, ref_dict = refDict(a = "numeric")), ["(2)*(a+1)", ["a"]])
+
+
+class ParseCacheTest(unittest.TestCase):
+	def setUp(self):
+		parse_cache.clear()
+
+	def tearDown(self):
+		parse_cache.clear()
+
+	def testEvictsLeastRecentlyUsed(self):
+		cache = ParseCache(maxsize = 2)
+		cache.put("a", 1)
+		cache.put("b", 2)
+		self.assertEqual(cache.get("a"), 1) # b is now the least recently used
+		cache.put("c", 3)
+		self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+		self.assertEqual(cache.stats(), {"size" : 2, "maxsize" : 2, "hits" : 3, "misses" : 1})
+		cache.resize(1)
+		self.assertEqual(len(cache), 1)
+		self.assertEqual(cache.get("c"), 3)
+
+	def testSizeZeroKeepsNothing(self):
+		cache = ParseCache(maxsize = 0)
+		cache.put("a", 1)
+		self.assertEqual((len(cache), cache.get("a")), (0, None))
+
+	def testRepeatedExpressionIsAHit(self):
+		ref_dict = refDict(A = "point", B = "point", C = "point")
+		first = parse_string(u"Polygon[A,B,C]", num_expected = 4, ref_dict = ref_dict)
+		first[0].append("garbage") # What the caller does with the result must not reach the cache
+		first[1].append("garbage")
+		second = parse_string(u"Polygon[A,B,C]", num_expected = 4, ref_dict = ref_dict)
+		self.assertEqual(second, [["A--B--C--cycle", "A--B", "B--C", "C--A"], ["A", "B", "C"]])
+		self.assertEqual((parse_cache.stats()["hits"], parse_cache.stats()["misses"]), (1, 1))
+
+	def testKeyHasTheTypesOfReferences(self):
+		self.assertEqual(parse_string(u"Circle[A,B]", num_expected = 1, ref_dict = refDict(A = "point", B = "point"))[0],
+				"CirclebyPoint(A,B)")
+		self.assertEqual(parse_string(u"Circle[A,B]", num_expected = 1, ref_dict = refDict(A = "point", B = "numeric"))[0],
+				"CirclebyRadius(A,B)")
+		self.assertEqual(parse_cache.stats()["misses"], 2)
+
+	def testKeyHasTheOtherArgumentsAndTheRegistry(self):
+		s = u"Midpoint[A,B]"
+		tokens = tokenize(s)
+		ref_dict = refDict(A = "point", B = "point")
+		key = parse_cache_key(s, tokens, {"num_expected" : 1, "ref_dict" : ref_dict})
+		self.assertNotEqual(key, parse_cache_key(s, tokens, {"num_expected" : 2, "ref_dict" : ref_dict}))
+		plugged = commands.withPlugins([])
+		plugged.key = (("plugin", "hash"),)
+		self.assertNotEqual(key, parse_cache_key(s, tokens, {"num_expected" : 1, "ref_dict" : ref_dict}, plugged))
+		self.assertEqual(parse_cache_key(s, tokens, {"num_expected" : 1, "ref_dict" : refDict(A = "point")}), None)
+
+
+if __name__ == "__main__":
+	unittest.main()
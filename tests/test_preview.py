@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""tests/test_preview.py
+The SVG backend (preview.drawPreview), through dragon.convert."""
+
+import unittest
+from StringIO import StringIO
+from xml.dom import minidom
+
+from dragon import convert
+
+GGB_XML = u"""<?xml version="1.0" encoding="utf-8"?>
+<geogebra format="4.0"><euclidianView><size width="800" height="600"/><coordSystem xZero="400.0" yZero="300.0" scale="50.0" yscale="50.0"/></euclidianView>
+<construction title="" author="" date="">
+<element type="point" label="A"><show object="true" label="true"/><objColor r="0" g="0" b="0" alpha="0.0"/><lineStyle thickness="2" type="0" typeHidden="1"/><coords x="0.0" y="0.0" z="1.0"/></element>
+<element type="point" label="α"><show object="true" label="true"/><objColor r="0" g="0" b="0" alpha="0.0"/><lineStyle thickness="2" type="0" typeHidden="1"/><coords x="1.0" y="1.0" z="1.0"/></element>
+<command name="Segment"><input a0="A" a1="α"/><output a0="s"/></command>
+<element type="segment" label="s"><show object="true" label="false"/><objColor r="0" g="0" b="0" alpha="0.0"/><lineStyle thickness="2" type="0" typeHidden="1"/></element>
+</construction></geogebra>
+""".encode("utf-8")
+
+
+class PreviewTest(unittest.TestCase):
+	def testNonASCIILabel(self):
+		svg = convert(StringIO(GGB_XML), BACKEND = "svg")
+		self.assertTrue(isinstance(svg, str))
+		self.assertTrue("&#945;" in svg)
+		labels = [node.firstChild.data for node in minidom.parseString(svg).getElementsByTagName("text")]
+		self.assertEqual(sorted(labels), [u"A", u"α"])
+
+	def testWritesToAFile(self):
+		out = StringIO()
+		convert(StringIO(GGB_XML), out, BACKEND = "svg", CLIP_IMG = 1)
+		self.assertTrue(out.getvalue().startswith("<svg"))
+
+
+if __name__ == "__main__":
+	unittest.main()
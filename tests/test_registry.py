@@ -0,0 +1,107 @@
+"""tests/test_registry.py
+The command registry: arity and types of the commands of constructs.py, the errors they raise,
+and plugin registries, which must never change what other conversions see."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from dragon import convert
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.converter import convertSource
+from dragon.errors import DragonError, ParseError, UnsupportedError
+from dragon.ggb_parser import parse_string
+from dragon.registry import CommandRegistry, commands, pluginRegistry
+from dragon.tests.test_optimize import HEADER, FOOTER, element, point, command
+from dragon.tests.test_parser import refDict
+
+PLUGIN_NAME = "dragon_test_plugin"
+PLUGIN = '''
+def Midpoint(*args, **kwargs):
+	return "mymidpoint(%s)" %",".join(args)
+Midpoint.ggb_return_type = "point"
+Midpoint.ggb_arity = (2, 2)
+
+def Twice(*args, **kwargs):
+	return "2*" + args[0]
+Twice.ggb_return_type = "numeric"
+Twice.ggb_arity = (1, 1)
+'''
+
+MIDPOINT = (HEADER + point("A", 0.0, 0.0) + point("B", 4.0, 0.0) +
+		command("Midpoint", ["A", "B"], ["M"]) + point("M", 2.0, 0.0) + FOOTER)
+
+def parse(s, **types):
+	return parse_string(s, num_expected = 1, ref_dict = refDict(**types))
+
+
+class CommandTest(unittest.TestCase):
+	def testArity(self):
+		intersect = commands.get("Intersect")
+		self.assertEqual((intersect.min_args, intersect.max_args, intersect.arityText()), (2, 3, "2 to 3"))
+		self.assertTrue(intersect.accepts(3))
+		self.assertFalse(intersect.accepts(4))
+		self.assertEqual(commands.get("Line").arityText(), "2")
+		self.assertEqual(commands.get("NoSuchCommand"), None)
+
+	def testWrongNumberOfArguments(self):
+		self.assertRaises(ParseError, parse, u"Midpoint[A,B,C]", A = "point", B = "point", C = "point")
+		try:
+			parse(u"Line[A]", A = "point")
+		except ParseError, e:
+			self.assertTrue("Line takes 2 arguments, not 1" in str(e), e)
+		else:
+			self.fail("Line[A] was parsed")
+
+	def testIntersectIndex(self):
+		self.assertEqual(parse(u"Intersect[a,b,2]", a = "line", b = "conic")[0], "IntersectionPoint(a,b,1)")
+		self.assertRaises(ParseError, parse, u"Intersect[a,b,1.5]", a = "line", b = "conic")
+		self.assertRaises(ParseError, parse, u"Intersect[a,b,n]", a = "line", b = "conic", n = "numeric")
+
+	def testUnsupported(self):
+		self.assertRaises(UnsupportedError, parse, u"AngularBisector[a,b]", a = "line", b = "line")
+
+	def testRegisterNeedsArity(self):
+		registry = CommandRegistry()
+		self.assertRaises(DragonError, registry.register, "Nothing", lambda *args, **kwargs: "")
+
+
+class PluginTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		f = open(os.path.join(self.directory, PLUGIN_NAME + ".py"), "w")
+		f.write(PLUGIN)
+		f.close()
+		sys.path.insert(0, self.directory)
+
+	def tearDown(self):
+		sys.path.remove(self.directory)
+		sys.modules.pop(PLUGIN_NAME, None)
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def testRegistry(self):
+		self.assertTrue(pluginRegistry("") is commands)
+		registry = pluginRegistry(PLUGIN_NAME)
+		self.assertTrue(pluginRegistry([PLUGIN_NAME]) is registry)
+		self.assertTrue("Twice" in registry and "Intersect" in registry)
+		self.assertFalse("Twice" in commands)
+		self.assertEqual(registry.plugins, (PLUGIN_NAME,))
+		self.assertEqual([name for name, source_hash in registry.key], [PLUGIN_NAME])
+		self.assertEqual(commands.key, ())
+
+	def testMissingPlugin(self):
+		self.assertRaises(DragonError, pluginRegistry, "dragon_no_such_plugin")
+
+	def testConversionsDoNotShareCommands(self):
+		opts = dict(DEFAULT_OPTIONS)
+		opts['PLUGINS'] = PLUGIN_NAME
+		self.assertTrue("pair M = mymidpoint(A,B);" in convertSource(StringIO(MIDPOINT), opts))
+		self.assertTrue("pair M = midpoint(A--B);" in convert(StringIO(MIDPOINT))) # Not from the parse cache
+		self.assertTrue("pair M = mymidpoint(A,B);" in convertSource(StringIO(MIDPOINT), opts))
+
+
+if __name__ == "__main__":
+	unittest.main()
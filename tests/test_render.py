@@ -0,0 +1,149 @@
+"""tests/test_render.py
+AsyRenderer against a stub asy executable, which copies its input to its output, logs every
+render to the file calls next to it, and fails on sources containing FAILME.  Its --version
+prints the file version next to it."""
+
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+from dragon.render import AsyRenderer
+from dragon.errors import RenderError
+
+STUB_ASY = """#!/bin/sh
+# asy -f FMT -o OUT SRC
+DIR=$(dirname "$0")
+if [ "$1" = "--version" ]; then cat "$DIR/version"; exit 0; fi
+echo "$@" >> "$DIR/calls"
+if grep -q FAILME "$5"; then echo "error: boom"; exit 1; fi
+cp "$5" "$4.$2"
+"""
+
+
+class RenderTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.asy = os.path.join(self.directory, "asy")
+		f = open(self.asy, "w")
+		f.write(STUB_ASY)
+		f.close()
+		os.chmod(self.asy, stat.S_IRWXU)
+		self.setVersion("Asymptote version 2.41")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def renderer(self, max_bytes = 0):
+		return AsyRenderer(self.asy, cache_dir = os.path.join(self.directory, "cache"), max_bytes = max_bytes)
+
+	def setVersion(self, version):
+		f = open(os.path.join(self.directory, "version"), "w")
+		f.write(version + "\n")
+		f.close()
+
+	def calls(self):
+		try:
+			f = open(os.path.join(self.directory, "calls"))
+		except IOError:
+			return 0
+		try:
+			return len(f.readlines())
+		finally:
+			f.close()
+
+	def read(self, filename):
+		f = open(filename, "rb")
+		try:
+			return f.read()
+		finally:
+			f.close()
+
+	def testIdenticalCodeIsRenderedOnce(self):
+		renderer = self.renderer()
+		path = renderer.render("draw(A--B);", "pdf")
+		self.assertEqual(renderer.render("draw(A--B);", "pdf"), path)
+		self.assertEqual(self.read(path), "draw(A--B);")
+		self.assertEqual(self.calls(), 1)
+		self.assertEqual(renderer.rendered, 1)
+
+	def testFormatsAreCachedSeparately(self):
+		renderer = self.renderer()
+		pdf = renderer.render("draw(A--B);", "pdf")
+		svg = renderer.render("draw(A--B);", "svg")
+		self.assertNotEqual(pdf, svg)
+		self.assertTrue(svg.endswith(".svg"))
+		self.assertEqual(self.calls(), 2)
+
+	def testCacheIsSharedBetweenRenderers(self):
+		self.renderer().render("dot(A);", "pdf")
+		self.renderer().render("dot(A);", "pdf")
+		self.assertEqual(self.calls(), 1)
+
+	def testUpgradedAsyRendersAgain(self):
+		self.renderer().render("dot(A);", "pdf")
+		self.setVersion("Asymptote version 2.86")
+		self.renderer().render("dot(A);", "pdf")
+		self.assertEqual(self.calls(), 2)
+
+	def testOtherAsyRendersAgain(self):
+		self.renderer().render("dot(A);", "pdf")
+		other = os.path.join(self.directory, "other-asy")
+		shutil.copy(self.asy, other)
+		AsyRenderer(other, cache_dir = os.path.join(self.directory, "cache")).render("dot(A);", "pdf")
+		self.assertEqual(self.calls(), 2)
+
+	def testRenderMany(self):
+		codes = ["dot(%s);" %label for label in "ABC"]
+		paths = self.renderer().renderMany(codes, "pdf")
+		self.assertEqual([self.read(path) for path in paths], codes)
+		self.assertEqual(self.calls(), 3)
+
+	def testEvictionRendersAgain(self):
+		renderer = self.renderer(max_bytes = 10) # Room for one 7 byte artifact
+		first = renderer.render("dot(A);", "pdf")
+		os.utime(first, (1, 1)) # Least recently used
+		renderer.render("dot(B);", "pdf")
+		self.assertFalse(os.path.exists(first))
+		self.assertEqual(renderer.render("dot(A);", "pdf"), first)
+		self.assertEqual(self.calls(), 3)
+
+	def testRenderToRendersAgainWhenEvictedMeanwhile(self):
+		renderer = self.renderer()
+		render = renderer.render
+		evicted = []
+		def renderThenEvict(code, fmt = "pdf"):
+			path = render(code, fmt)
+			if not evicted: # As if another process evicted it before the copy
+				os.remove(path)
+				evicted.append(path)
+			return path
+		renderer.render = renderThenEvict
+		filename = os.path.join(self.directory, "out.pdf")
+		self.assertEqual(renderer.renderTo("dot(A);", filename), filename)
+		self.assertEqual(self.read(filename), "dot(A);")
+		self.assertEqual(self.calls(), 2)
+
+	def testFailureRaisesAndIsNotCached(self):
+		renderer = self.renderer()
+		try:
+			renderer.render("FAILME", "pdf")
+		except RenderError, e:
+			self.assertTrue("boom" in str(e))
+		else:
+			self.fail("no RenderError")
+		self.assertRaises(RenderError, renderer.render, "FAILME", "pdf")
+		self.assertEqual(self.calls(), 2)
+		self.assertEqual(renderer.cache.entries(), [])
+
+	def testMissingExecutable(self):
+		renderer = AsyRenderer(os.path.join(self.directory, "no-asy"), cache_dir = os.path.join(self.directory, "cache"))
+		self.assertRaises(RenderError, renderer.render, "dot(A);", "pdf")
+
+	def testUnknownFormat(self):
+		self.assertRaises(ValueError, self.renderer().render, "dot(A);", "gif")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,128 @@
+"""tests/test_server.py
+The conversion server: which options a request may set, and the replies to good and bad requests,
+from a server on a free localhost port (or a Unix socket) with one worker."""
+
+import os
+import json
+import socket
+import base64
+import shutil
+import httplib
+import tempfile
+import threading
+import unittest
+
+from dragon import convert
+from dragon.errors import ConfigError
+from dragon.server import checkedOptions, makeServer
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+
+class CheckedOptionsTest(unittest.TestCase):
+	def testTypesOfTheDefaults(self):
+		self.assertEqual(checkedOptions({"CONCISE_MODE" : "1", "IMG_SIZE" : "8cm", "LABEL_SCALE_FACTOR" : "0.5"}),
+				{"CONCISE_MODE" : 1, "IMG_SIZE" : "8cm", "LABEL_SCALE_FACTOR" : 0.5})
+		self.assertEqual(checkedOptions({"CONCISE_MODE" : 1, "IMG_SIZE" : u"8cm"}), {"CONCISE_MODE" : 1, "IMG_SIZE" : "8cm"})
+
+	def testWrongTypes(self):
+		self.assertRaises(ConfigError, checkedOptions, {"CONCISE_MODE" : "yes"})
+		self.assertRaises(ConfigError, checkedOptions, {"HOIST_BUDGET" : "__import__('os')"})
+
+	def testRefused(self):
+		self.assertRaises(ConfigError, checkedOptions, {"CONFIG_FILENAME" : "/etc/passwd"})
+		self.assertRaises(ConfigError, checkedOptions, {"PLUGINS" : "os"})
+		self.assertRaises(ConfigError, checkedOptions, {"NO_SUCH_OPTION" : "1"})
+
+
+class ServerTest(unittest.TestCase):
+	def setUp(self):
+		self.server = makeServer(port = 0, workers = 1, quiet = True)
+		self.thread = threading.Thread(target = self.server.serve_forever)
+		self.thread.start()
+		f = open(IRAN, "rb")
+		self.data = f.read()
+		f.close()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.thread.join()
+		self.server.server_close()
+		self.server.pool.terminate()
+
+	def request(self, method, path, body = None, headers = {}):
+		"""Return value: (status, the decoded JSON body, or the body as it is if it is not JSON)"""
+		connection = httplib.HTTPConnection("127.0.0.1", self.server.server_port)
+		connection.request(method, path, body, headers)
+		response = connection.getresponse()
+		body = response.read()
+		connection.close()
+		if response.getheader("Content-Type") == "application/json":
+			body = json.loads(body)
+		return response.status, body
+
+	def testConvert(self):
+		self.assertEqual(self.request("POST", "/convert", self.data), (200, convert(IRAN)))
+		self.assertEqual(self.request("POST", "/convert?CONCISE_MODE=1", self.data), (200, convert(IRAN, CONCISE_MODE = 1)))
+
+	def testConvertJSON(self):
+		body = json.dumps({"ggb" : base64.b64encode(self.data), "options" : {"CONCISE_MODE" : 1}})
+		self.assertEqual(self.request("POST", "/convert", body, {"Content-Type" : "application/json"}),
+				(200, convert(IRAN, CONCISE_MODE = 1)))
+
+	def testBadRequests(self):
+		for path, body, headers in [
+				("/convert?CONFIG_FILENAME=/etc/passwd", self.data, {}),
+				("/convert?CONCISE_MODE=yes", self.data, {}),
+				("/convert", "[1, 2]", {"Content-Type" : "application/json"}),
+				("/convert", json.dumps({"ggb" : "not base64!"}), {"Content-Type" : "application/json"}),
+				("/convert", json.dumps({"ggb" : 1}), {"Content-Type" : "application/json"}),
+				]:
+			status, reply = self.request("POST", path, body, headers)
+			self.assertEqual((status, reply["error"]), (400, "BadRequest"), (path, body, reply))
+
+	def testConversionErrors(self):
+		status, reply = self.request("POST", "/convert", "not a GeoGebra file")
+		self.assertEqual((status, reply["error"]), (400, "GGBFormatError"))
+		status, reply = self.request("POST", "/convert?ONLY_LABELS=1", self.data)
+		self.assertEqual(status, 400, reply)
+		self.assertFalse("traceback" in reply)
+
+	def testHealth(self):
+		self.request("POST", "/convert", self.data)
+		self.request("POST", "/convert", "not a GeoGebra file")
+		status, report = self.request("GET", "/health")
+		self.assertEqual((status, report["status"], report["requests"], report["errors"]), (200, "ok", 2, 1))
+		self.assertTrue(report["latency_p50"] > 0)
+		self.assertEqual(self.request("GET", "/nothing")[0], 404)
+
+
+class SocketPathTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.socket_path = os.path.join(self.directory, "dragon.sock")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def testLeftoverSocketIsReplaced(self):
+		leftover = socket.socket(socket.AF_UNIX)
+		leftover.bind(self.socket_path)
+		leftover.close()
+		server = makeServer(socket_path = self.socket_path, workers = 1, quiet = True)
+		client = socket.socket(socket.AF_UNIX)
+		client.connect(self.socket_path) # The new server's socket
+		client.close()
+		server.server_close()
+		server.pool.terminate()
+
+	def testRegularFileIsKept(self):
+		f = open(self.socket_path, "w")
+		f.write("precious")
+		f.close()
+		self.assertRaises(ValueError, makeServer, socket_path = self.socket_path, workers = 1)
+		self.assertEqual(open(self.socket_path).read(), "precious")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,93 @@
+"""tests/test_stream.py
+Framed mode (stream.runFramed) and reading a document from standard input."""
+
+import os
+import sys
+import unittest
+import subprocess
+from StringIO import StringIO
+
+from dragon import convert
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.converter import isDocument, openGeoGebraXML
+from dragon.stream import FrameError, readFrame, runFramed
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+TOP = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #The directory containing dragon
+
+def frames(*payloads):
+	return "".join("%d\n%s" %(len(payload), payload) for payload in payloads)
+
+def readResults(data):
+	"""The (status, payload) of each frame of runFramed's output data"""
+	stream = StringIO(data)
+	results = []
+	while True:
+		header = stream.readline()
+		if not header:
+			return results
+		length, status = header.split()
+		results.append((status, stream.read(int(length))))
+
+
+class RunFramedTest(unittest.TestCase):
+	def setUp(self):
+		f = open(IRAN, "rb")
+		self.data = f.read()
+		f.close()
+		self.xml_data = openGeoGebraXML(IRAN).read()
+		self.code = convert(IRAN)
+
+	def convertFrames(self, data):
+		"""Return value: (failures, results as readResults gives them)"""
+		out = StringIO()
+		failures = runFramed(dict(DEFAULT_OPTIONS), StringIO(data), out)
+		return failures, readResults(out.getvalue())
+
+	def testDocuments(self):
+		failures, results = self.convertFrames(frames(self.data, "not a GeoGebra file", self.xml_data, ""))
+		self.assertEqual(failures, 2)
+		self.assertEqual([status for status, payload in results], ["ok", "error", "ok", "error"])
+		self.assertEqual(results[0][1], self.code)
+		self.assertEqual(results[2][1], self.code)
+		self.assertTrue(results[1][1].startswith("GGBFormatError: "))
+
+	def testNothing(self):
+		self.assertEqual(self.convertFrames(""), (0, []))
+
+	def testBadFrames(self):
+		for data in ["twelve\n" + self.data, "-1\n", "%d\n%s" %(len(self.data) + 1, self.data)]:
+			self.assertRaises(FrameError, readFrame, StringIO(data))
+		out = StringIO()
+		self.assertRaises(FrameError, runFramed, dict(DEFAULT_OPTIONS), StringIO(frames(self.data) + "garbage\n"), out)
+		self.assertEqual(readResults(out.getvalue()), [("ok", self.code)]) # The frame before is answered
+		self.assertEqual(readFrame(StringIO("")), None)
+
+
+class DocumentTest(unittest.TestCase):
+	def testIsDocument(self):
+		self.assertTrue(isDocument("PK\x03\x04rest of the zip"))
+		self.assertTrue(isDocument("\xef\xbb\xbf<?xml version=\"1.0\"?>"))
+		self.assertTrue(isDocument("\n  <geogebra>"))
+		self.assertFalse(isDocument("Iran.ggb"))
+		self.assertFalse(isDocument("figures/<odd name>.ggb"))
+
+	def testStandardInput(self):
+		xml_data = openGeoGebraXML(IRAN).read()
+		for data in [open(IRAN, "rb").read(), xml_data]:
+			process = subprocess.Popen([sys.executable, "-m", "dragon", "--no-cache", "-"], cwd = TOP,
+					stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+			out, err = process.communicate(data)
+			self.assertEqual(process.returncode, 0, err)
+			self.assertEqual(out.strip(), convert(IRAN).strip())
+
+	def testFramedCommandLine(self):
+		process = subprocess.Popen([sys.executable, "-m", "dragon", "--no-cache", "--framed"], cwd = TOP,
+				stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+		out, err = process.communicate(frames(open(IRAN, "rb").read(), "junk"))
+		self.assertNotEqual(process.returncode, 0)
+		self.assertEqual([status for status, payload in readResults(out)], ["ok", "error"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,109 @@
+"""tests/test_watch.py
+Incremental recompiles (diagram.CompiledNodes) and the watch loop, on Iran.ggb."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from dragon.constants import DEFAULT_OPTIONS
+from dragon.converter import convertSource, openGeoGebraXML
+from dragon.diagram import CompiledNodes
+from dragon.watch import watch
+
+IRAN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Iran.ggb")
+
+MTIME = 1000000000 #Of both the broken and the good file in WatchTest
+
+def convertXML(xml_data, compiled_nodes = None):
+	return convertSource(StringIO(xml_data), dict(DEFAULT_OPTIONS), compiled_nodes = compiled_nodes)
+
+
+class CompiledNodesTest(unittest.TestCase):
+	def setUp(self):
+		self.xml_data = openGeoGebraXML(IRAN).read()
+		self.nodes = CompiledNodes()
+		self.code = convertXML(self.xml_data, self.nodes)
+		self.number_of_nodes = self.nodes.compiled
+
+	def edit(self, old, new):
+		self.assertTrue(old in self.xml_data)
+		xml_data = self.xml_data.replace(old, new, 1)
+		code = convertXML(xml_data, self.nodes)
+		self.assertEqual(code, convertXML(xml_data))
+		return code
+
+	def testUnchangedConstructionReusesEveryNode(self):
+		self.assertEqual(self.nodes.reused, 0)
+		self.assertEqual(convertXML(self.xml_data, self.nodes), self.code)
+		self.assertEqual((self.nodes.compiled, self.nodes.reused), (0, self.number_of_nodes))
+		self.assertEqual(self.code, convertXML(self.xml_data))
+
+	def testMovingAFreePointCompilesOneNode(self):
+		code = self.edit('<coords x="-3.0" y="2.0" z="1.0"/>', '<coords x="-2.0" y="2.0" z="1.0"/>')
+		self.assertNotEqual(code, self.code)
+		self.assertEqual(self.nodes.compiled, 1)
+		self.assertEqual(len(self.nodes._entries), self.number_of_nodes) # The old point is forgotten
+
+	def testChangingATypeCompilesWhatRefersToIt(self):
+		self.edit('<element type="segment" label="b_1">', '<element type="line" label="b_1">')
+		self.assertTrue(self.nodes.compiled >= 2) # The element, and the intersection with b_1
+
+
+class FixingStream(StringIO):
+	"""A report stream which puts back a good .ggb file when the watch loop reports an error,
+	with the same mtime as the broken one, as a save finishing within the same second would have"""
+	def __init__(self, filename):
+		StringIO.__init__(self)
+		self.filename = filename
+
+	def write(self, s):
+		StringIO.write(self, s)
+		if "Error" in s:
+			shutil.copy(IRAN, self.filename)
+			os.utime(self.filename, (MTIME, MTIME))
+
+
+class WatchTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "dragon-test")
+		self.filename = os.path.join(self.directory, "Iran.ggb")
+		self.out_filename = os.path.join(self.directory, "Iran.asy")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors = True)
+
+	def testHalfWrittenFileIsTriedAgain(self):
+		f = open(IRAN, "rb")
+		data = f.read()
+		f.close()
+		f = open(self.filename, "wb")
+		f.write(data[:len(data) / 2])
+		f.close()
+		os.utime(self.filename, (MTIME, MTIME))
+		stream = FixingStream(self.filename)
+		watch(self.filename, dict(DEFAULT_OPTIONS), self.out_filename, interval = 0, stream = stream, rounds = 3)
+		lines = stream.getvalue().splitlines()
+		self.assertEqual(len(lines), 2, lines)
+		self.assertTrue("GGBFormatError" in lines[0])
+		self.assertTrue("written" in lines[1])
+		self.assertTrue(os.path.isfile(self.out_filename))
+
+	def testOutputIsOnlyRewrittenWhenItChanges(self):
+		shutil.copy(IRAN, self.filename)
+		for expected in ["written", "unchanged"]:
+			stream = StringIO()
+			watch(self.filename, dict(DEFAULT_OPTIONS), self.out_filename, interval = 0, stream = stream, rounds = 1)
+			self.assertTrue(expected in stream.getvalue(), stream.getvalue())
+		f = open(os.path.join(self.directory, "Iran.cfg"), "w")
+		f.write("[label]\nA = dir(90)\n")
+		f.close()
+		stream = StringIO()
+		watch(self.filename, dict(DEFAULT_OPTIONS), self.out_filename, interval = 0, stream = stream, rounds = 1)
+		self.assertTrue("written" in stream.getvalue(), stream.getvalue())
+		self.assertTrue("lsf * dir(90)" in open(self.out_filename).read())
+
+
+if __name__ == "__main__":
+	unittest.main()
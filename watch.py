@@ -0,0 +1,82 @@
+"""watch.py
+Watch mode: reconvert a .ggb file whenever it, its .cfg file or the manifest changes.
+Only the commands, expressions and elements which changed since the last save, and those which
+depend on them, are compiled again; the objects of all the others are reused as they were
+(see diagram.CompiledNodes), so no unchanged expression is parsed again.  geogebra.xml is still
+read whole, and the optimisation passes and drawing still run over the whole diagram, so a save
+costs less than a full conversion but still grows with the size of the diagram.
+The .asy file is only rewritten when its contents actually change."""
+
+import os
+import sys
+import time
+import zlib
+import zipfile
+
+from converter import resolveFilename, convertSource
+from diagram import CompiledNodes
+from errors import DragonError
+from manifest import Manifest
+
+
+def _mtime(filename):
+	try:
+		return os.stat(filename).st_mtime
+	except OSError:
+		return None
+
+def writeIfChanged(filename, code):
+	"""Atomically replace filename by code, unless it already holds exactly that.
+	Returns whether the file was written."""
+	if os.path.isfile(filename):
+		f = open(filename)
+		try:
+			if f.read() == code:
+				return False
+		finally:
+			f.close()
+	temp_filename = filename + ".tmp"
+	f = open(temp_filename, "w")
+	try:
+		f.write(code)
+	finally:
+		f.close()
+	os.rename(temp_filename, filename)
+	return True
+
+
+def watch(filename, opts, out_filename, interval = 0.5, stream = None, rounds = None, manifest_filename = None):
+	"""Convert filename to out_filename now and after every change to it, its .cfg file or
+	the manifest manifest_filename (which is read again each time), reporting on stream.  Runs until interrupted, or for the given number of polls.
+	A conversion which fails, e.g. because the file is being written, is tried again at the next poll."""
+	if stream is None:
+		stream = sys.stderr
+	filename = resolveFilename(filename)
+	config_filename = opts.get('CONFIG_FILENAME', "").strip() or os.path.splitext(filename)[0] + '.cfg'
+	last_stamp = None
+	last_error = None
+	compiled_nodes = CompiledNodes()
+	while rounds is None or rounds > 0:
+		stamp = (_mtime(filename), _mtime(config_filename), manifest_filename and _mtime(manifest_filename))
+		if stamp != last_stamp:
+			last_stamp = stamp
+			start = time.time()
+			try:
+				manifest = Manifest(manifest_filename) if manifest_filename else None
+				code = convertSource(filename, opts, manifest = manifest, compiled_nodes = compiled_nodes) + "\n"
+			except (DragonError, EnvironmentError, zipfile.BadZipfile, zlib.error), e:
+				# Also what a .ggb file half written by GeoGebra gives, so try again at the next poll
+				last_stamp = None
+				error = "%s: %s: %s" %(filename, e.__class__.__name__, e)
+				if error != last_error:
+					print >>stream, error
+				last_error = error
+			else:
+				last_error = None
+				written = writeIfChanged(out_filename, code)
+				print >>stream, "%s: %s (%d nodes compiled, %d reused) in %.3fs" %(out_filename,
+						"written" if written else "unchanged", compiled_nodes.compiled, compiled_nodes.reused, time.time() - start)
+			stream.flush()
+		if rounds is not None:
+			rounds -= 1
+		time.sleep(interval)